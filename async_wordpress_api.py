@@ -0,0 +1,322 @@
+import asyncio
+import base64
+import random
+import time
+from collections import Counter
+from importlib.util import find_spec
+from config import Config
+from metrics import Metrics
+from multipart_stream import MultipartStream
+from request_scheduler import MAX_RETRY_AFTER, REJECTED_STATUSES, RETRY_STATUSES, parse_retry_after
+from wordpress_api import WordPressAPI
+
+# Endpoint -> class sharing one in-flight limit; anything else counts as posts
+_ENDPOINT_CLASSES = {'media': 'media', 'categories': 'terms', 'tags': 'terms'}
+# httpcore scans every connection of a pool for every queued request, so the
+# connections are spread over several small clients instead of one large pool
+_CONNECTIONS_PER_CLIENT = 8
+
+def _import_httpx():
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError("AsyncWordPressAPI needs httpx: pip install httpx (add h2 for HTTP/2)") from None
+    return httpx
+
+async def _chunks(body, size=1 << 16):
+    """Async iterator over a MultipartStream, for httpx's streaming upload
+
+    Chunks are read from disk on a thread, so a large upload does not hold
+    up the event loop and the other requests in flight.
+    """
+    while True:
+        chunk = await asyncio.to_thread(body.read, size)
+        if not chunk:
+            return
+        yield chunk
+
+class AsyncWordPressAPI:
+    """asyncio WordPress client with the methods of WordPressAPI as coroutines
+
+    Requests go to the least busy of a few httpx clients. When h2 is
+    installed and the site offers HTTP/2 (https only), each client
+    multiplexes its calls over one connection. Otherwise the clients share
+    HTTP_POOL_SIZE HTTP/1.1 keep-alive connections, with one request per
+    connection at a time. Calls wait on a semaphore per endpoint class
+    (posts, media, terms), so hundreds of posts can be in flight from one
+    thread without uploads or term lookups crowding them out. Retries,
+    backoff, Retry-After and HTTP_RATE_LIMIT work as in RequestScheduler.
+
+    Use it as `async with AsyncWordPressAPI() as api:`.
+    """
+
+    def __init__(self, metrics=None, http2=None):
+        httpx = _import_httpx()
+        self.httpx = httpx
+        if http2 is None:
+            http2 = Config.HTTP2
+        self.http2 = http2 and find_spec('h2') is not None
+
+        base_url = Config.WORDPRESS_URL.rstrip('/')
+        self.api_url = f"{base_url}/index.php?rest_route=/wp/v2"
+        self.media_url = f"{base_url}/index.php?rest_route=/wp/v2/media"
+
+        headers = {}
+        auth = None
+        if Config.WORDPRESS_APPLICATION_PASSWORD:
+            auth_string = f"{Config.WORDPRESS_USERNAME}:{Config.WORDPRESS_APPLICATION_PASSWORD}"
+            headers['Authorization'] = f"Basic {base64.b64encode(auth_string.encode()).decode()}"
+        else:
+            auth = (Config.WORDPRESS_USERNAME, Config.WORDPRESS_PASSWORD)
+        if not Config.HTTP_COMPRESSION:
+            headers['Accept-Encoding'] = 'identity'
+
+        pool_size = max(Config.HTTP_POOL_SIZE, 1)
+        client_count = -(-pool_size // _CONNECTIONS_PER_CLIENT)
+        connections = -(-pool_size // client_count)
+        self.clients = [
+            httpx.AsyncClient(
+                http2=self.http2,
+                headers=headers,
+                auth=auth,
+                # Requests beyond the pool wait for a connection instead of timing out
+                timeout=httpx.Timeout(Config.HTTP_TIMEOUT, pool=None),
+                limits=httpx.Limits(max_connections=connections,
+                                    max_keepalive_connections=connections if Config.HTTP_KEEP_ALIVE else 0),
+            )
+            for _ in range(client_count)
+        ]
+        self.in_flight = [0] * client_count
+        # Over HTTP/1.1 a request needs a connection to itself; lifted once a response comes over HTTP/2
+        self.connection_slots = asyncio.Semaphore(client_count * connections)
+        self.multiplexed = False
+        self.semaphores = {
+            'posts': asyncio.Semaphore(Config.ASYNC_POSTS_IN_FLIGHT),
+            'media': asyncio.Semaphore(Config.ASYNC_MEDIA_IN_FLIGHT),
+            'terms': asyncio.Semaphore(Config.ASYNC_TERMS_IN_FLIGHT),
+        }
+
+        self.max_retries = Config.HTTP_MAX_RETRIES
+        self.backoff_base = Config.HTTP_BACKOFF_BASE
+        self.backoff_max = Config.HTTP_BACKOFF_MAX
+        self.rate = Config.HTTP_RATE_LIMIT
+        self.burst = max(Config.HTTP_RATE_BURST, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.retries = 0
+
+        self.metrics = metrics or Metrics()
+        # Responses per protocol, e.g. {'HTTP/2': 120}
+        self.http_versions = Counter()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        for client in self.clients:
+            await client.aclose()
+
+    def __str__(self):
+        versions = ', '.join(f"{count} {version}" for version, count in self.http_versions.items()) or 'no requests'
+        return f"{versions}, {self.retries} retries"
+
+    async def _throttle(self):
+        """Wait out a Retry-After pause and the HTTP_RATE_LIMIT token bucket"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if not self.rate:
+                return
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def _send(self, method, url, **kwargs):
+        """Send one request on the least busy client"""
+        slots = None if self.multiplexed else self.connection_slots
+        if slots:
+            await slots.acquire()
+        index = min(range(len(self.clients)), key=self.in_flight.__getitem__)
+        self.in_flight[index] += 1
+        try:
+            response = await self.clients[index].request(method, url, **kwargs)
+        finally:
+            self.in_flight[index] -= 1
+            if slots:
+                slots.release()
+        if response.http_version == 'HTTP/2':
+            self.multiplexed = True
+        return response
+
+    async def _request(self, method, url, upload=None, idempotent=None, **kwargs):
+        """Send a request with retries; upload() opens a fresh MultipartStream body per attempt
+
+        As in WordPressAPI, a POST is only retried when the server cannot
+        have acted on it, unless idempotent says otherwise.
+        """
+        endpoint = WordPressAPI._endpoint(url)
+        semaphore = self.semaphores[_ENDPOINT_CLASSES.get(endpoint, 'posts')]
+        if idempotent is None:
+            idempotent = method != 'POST'
+        retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+        # Failures before the request reached the server
+        not_sent = (self.httpx.ConnectError, self.httpx.ConnectTimeout, self.httpx.PoolTimeout)
+
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self._throttle()
+                body = upload() if upload else None
+                started = time.perf_counter()
+                status = 'error'
+                try:
+                    if body is not None:
+                        kwargs['content'] = _chunks(body)
+                        kwargs['headers'] = {'Content-Type': body.content_type, 'Content-Length': str(len(body))}
+                    response = await self._send(method, url, **kwargs)
+                    status = str(response.status_code)
+                except self.httpx.TransportError as e:
+                    if attempt == self.max_retries or not (idempotent or isinstance(e, not_sent)):
+                        raise
+                    print(f"Request failed ({e.__class__.__name__}), retrying")
+                    retry_after = None
+                else:
+                    self.http_versions[response.http_version] += 1
+                    self.metrics.increment('http_request_bytes_total',
+                                           int(response.request.headers.get('Content-Length', 0)), endpoint=endpoint)
+                    self.metrics.increment('http_response_bytes_total', len(response.content), endpoint=endpoint)
+                    if response.status_code not in retry_statuses or attempt == self.max_retries:
+                        response.raise_for_status()
+                        return response
+                    print(f"Request returned {response.status_code}, retrying")
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                finally:
+                    if body is not None:
+                        body.close()
+                    self.metrics.observe('http_request_seconds', time.perf_counter() - started,
+                                         method=method, endpoint=endpoint)
+                    self.metrics.increment('http_requests_total', method=method, endpoint=endpoint, status=status)
+
+                self.retries += 1
+                if retry_after is not None:
+                    # Every call waits in _throttle(), not just this one
+                    self.paused_until = max(self.paused_until, time.monotonic() + min(retry_after, MAX_RETRY_AFTER))
+                else:
+                    await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt))))
+
+    async def create_post(self, title, content, date=None, categories=None, tags=None, featured_media_id=None):
+        """Create a new WordPress post"""
+        post_data = WordPressAPI.build_post_data(title, content, date, categories, tags, featured_media_id)
+        response = await self._request('POST', self.api_url + '/posts', json=post_data)
+        return response.json()
+
+    async def create_posts(self, posts_data):
+        """Create several posts from build_post_data() bodies at once
+
+        Returns one (post, error) pair per body, in order. The requests share
+        the connections instead of going through /batch/v1.
+        """
+        async def send(post_data):
+            try:
+                response = await self._request('POST', self.api_url + '/posts', json=post_data)
+                return response.json(), None
+            except Exception as e:
+                return None, e
+
+        return await asyncio.gather(*(send(post_data) for post_data in posts_data))
+
+    async def get_post(self, post_id):
+        """Get the raw title and content, terms and featured image of a post"""
+        response = await self._request(
+            'GET',
+            f"{self.api_url}/posts/{post_id}&context=edit&_fields=id,title,content,categories,tags,featured_media"
+        )
+        return response.json()
+
+    async def update_post(self, post_id, title, content, date=None, categories=None, tags=None,
+                          featured_media_id=None):
+        """Replace the content of an existing post, keeping its status and author"""
+        post_data = WordPressAPI.build_post_data(title, content, date, categories, tags, featured_media_id)
+        del post_data['status'], post_data['author']
+        response = await self._request('PUT', f"{self.api_url}/posts/{post_id}", json=post_data)
+        return response.json()
+
+    async def upload_media(self, file_path, title=None, slug=None, progress=None):
+        """Upload a media file, streamed from disk; progress(sent, total) as in WordPressAPI"""
+        data = {}
+        if title:
+            data['title'] = title
+        if slug:
+            data['slug'] = slug
+
+        response = await self._request(
+            'POST', self.media_url, upload=lambda: MultipartStream(file_path, data, progress=progress)
+        )
+        return response.json()
+
+    async def get_all_terms(self, taxonomy):
+        """Get every term of a taxonomy, fetching the pages after the first concurrently"""
+        url = f"{self.api_url}/{taxonomy}&per_page=100&_fields=id,name,slug"
+        first_page = await self._request('GET', f"{url}&page=1")
+        terms = first_page.json()
+        total_pages = int(first_page.headers.get('X-WP-TotalPages', 1))
+
+        pages = await asyncio.gather(*(self._request('GET', f"{url}&page={page}")
+                                       for page in range(2, total_pages + 1)))
+        for page in pages:
+            terms.extend(page.json())
+        return terms
+
+    async def get_categories(self):
+        """Get all WordPress categories"""
+        return await self.get_all_terms('categories')
+
+    async def get_tags(self):
+        """Get all WordPress tags"""
+        return await self.get_all_terms('tags')
+
+    async def _create_term(self, taxonomy, name, slug=None):
+        """Create a term, returning the existing one if WordPress reports a duplicate"""
+        data = {'name': name}
+        if slug:
+            data['slug'] = slug
+
+        try:
+            # A repeated creation resolves to the existing term below, so retries are safe
+            response = await self._request('POST', f"{self.api_url}/{taxonomy}", idempotent=True, json=data)
+        except self.httpx.HTTPStatusError as e:
+            try:
+                term_id = WordPressAPI._existing_term_id(e.response.json())
+            except ValueError:
+                term_id = None
+            if term_id is None:
+                raise
+            return {'id': term_id, 'name': name}
+
+        return response.json()
+
+    async def create_terms(self, taxonomy, names):
+        """Create several terms at once; one (term, error) pair per name, in order"""
+        async def send(name):
+            try:
+                return await self._create_term(taxonomy, name), None
+            except Exception as e:
+                return None, e
+
+        return await asyncio.gather(*(send(name) for name in names))
+
+    async def create_category(self, name, slug=None):
+        """Create a new category"""
+        return await self._create_term('categories', name, slug)
+
+    async def create_tag(self, name, slug=None):
+        """Create a new tag"""
+        return await self._create_term('tags', name, slug)
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Telegram to WordPress importer.
+Generates a synthetic export and imports it end to end into a local mock
+WordPress REST server with configurable latency and error injection.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = [
+    'продукт', 'команда', 'релиз', 'пользователь', 'дизайн', 'wordpress', 'seo',
+    'разработка', 'маркетинг', 'docker', 'стартап', 'найм', 'метрики', 'гипотеза',
+    'задача', 'клиент', 'проект', 'сроки', 'бюджет', 'интерфейс', 'сервер', 'код',
+]
+ENTITY_TYPES = ['plain', 'bold', 'italic', 'code', 'link', 'pre']
+
+def generate_export(export_dir, message_count, entity_ratio=0.5, photo_ratio=0.2, tag_density=0.3,
+                    service_ratio=0.05, seed=1):
+    """Write a synthetic result.json (and photos) with the given content mix"""
+    from config import Config
+
+    rng = random.Random(seed)
+    photos_dir = os.path.join(export_dir, 'photos')
+    os.makedirs(photos_dir, exist_ok=True)
+    photo_names = _generate_photos(photos_dir, rng)
+    tags = Config.TAGS + Config.CATEGORIES
+
+    def sentence():
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 15))]
+        if rng.random() < tag_density:
+            words.insert(rng.randrange(len(words)), rng.choice(tags))
+        return ' '.join(words).capitalize() + '.'
+
+    with open(os.path.join(export_dir, 'result.json'), 'w', encoding='utf-8') as f:
+        f.write('{\n "name": "Benchmark",\n "type": "public_channel",\n "id": 1,\n "messages": [')
+        for message_id in range(1, message_count + 1):
+            date = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(1600000000 + message_id * 3600))
+            if rng.random() < service_ratio:
+                message = {'id': message_id, 'type': 'service', 'date': date, 'action': 'pin_message', 'text': ''}
+            else:
+                lines = [sentence()] + [sentence() for _ in range(rng.randint(1, 6))]
+                if rng.random() < 0.1:
+                    lines.append('Жми на ❤️ если понравилось')
+                text = '\n'.join(lines)
+                message = {'id': message_id, 'type': 'message', 'date': date}
+                if rng.random() < entity_ratio:
+                    message['text'] = _entities(text, rng)
+                else:
+                    message['text'] = text
+                if rng.random() < photo_ratio:
+                    message['photo'] = 'photos/' + rng.choice(photo_names)
+            f.write((',' if message_id > 1 else '') + '\n  ' + json.dumps(message, ensure_ascii=False))
+        f.write('\n ]\n}\n')
+
+def _entities(text, rng):
+    """Split text into the mixed string/entity list format of Telegram exports"""
+    parts = []
+    for chunk in re.split(r'(\s+)', text):
+        if chunk.strip() and rng.random() < 0.2:
+            entity_type = rng.choice(ENTITY_TYPES)
+            entity = {'type': entity_type, 'text': chunk}
+            if entity_type == 'link':
+                entity['href'] = f'https://example.com/{chunk}'
+            parts.append(entity)
+        elif parts and isinstance(parts[-1], str):
+            parts[-1] += chunk
+        else:
+            parts.append(chunk)
+    return parts
+
+def _generate_photos(photos_dir, rng, count=20):
+    """Create a small pool of distinct JPEG photos shared by messages"""
+    from PIL import Image
+
+    names = []
+    for index in range(count):
+        name = f'photo_{index}@01-01-2024_00-00-00.jpg'
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        Image.new('RGB', (1280, 960), color).save(os.path.join(photos_dir, name), quality=90)
+        names.append(name)
+    return names
+
+class MockWordPressHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the WordPress REST API used by the importer"""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; avoid Nagle/delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        query = parse_qs(urlparse(self.path).query)
+        return query.get('rest_route', [''])[0], query
+
+    def _inject(self):
+        """Simulate latency and transient failures; True if an error was sent"""
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+        if server.error_rate and random.random() < server.error_rate:
+            status = random.choice((429, 502, 503))
+            self._send(status, {'code': 'overloaded'}, {'Retry-After': str(server.retry_after)})
+            return True
+        return False
+
+    def do_GET(self):
+        route, query = self._route()
+        if self._inject():
+            return
+        post = self.server.get_post(route)
+        if post is not None:
+            return self._send(*post)
+        collection = self.server.collection(route)
+        if collection is None:
+            return self._send(404, {'code': 'rest_no_route'})
+
+        per_page = int(query.get('per_page', ['10'])[0])
+        page = int(query.get('page', ['1'])[0])
+        with self.server.lock:
+            items = list(collection.values())
+        total_pages = max(1, (len(items) + per_page - 1) // per_page)
+        self._send(200, items[(page - 1) * per_page:page * per_page], {
+            'X-WP-Total': str(len(items)),
+            'X-WP-TotalPages': str(total_pages),
+        })
+
+    def do_POST(self):
+        route, query = self._route()
+        body = self._read_body()
+        if self._inject():
+            return
+
+        if route == '/batch/v1':
+            responses = [self.server.handle_json(item['path'], item.get('body') or {})
+                         for item in json.loads(body)['requests']]
+            return self._send(207, {'responses': [{'status': s, 'body': b} for s, b in responses]})
+        if route == '/wp/v2/media':
+            return self._send(*self.server.create_media(body, self.headers.get('Content-Type', '')))
+        status, payload = self.server.handle_json(route, json.loads(body or b'{}'))
+        self._send(status, payload)
+
+    do_PUT = do_POST
+
+class MockWordPressServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Clients opening dozens of connections at once overflow the default backlog of 5
+    request_queue_size = 256
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, retry_after=0):
+        super().__init__(address, MockWordPressHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.collections = {'posts': {}, 'media': {}, 'categories': {}, 'tags': {}}
+        self.next_id = 1
+
+    def collection(self, route):
+        return self.collections.get(route.rsplit('/', 1)[-1]) if route.startswith('/wp/v2/') else None
+
+    def get_post(self, route):
+        """Answer GET /wp/v2/posts/<id> in the edit context, or None for other routes"""
+        match = re.fullmatch(r'/wp/v2/posts/(\d+)', route)
+        if not match:
+            return None
+        with self.lock:
+            post = self.collections['posts'].get(int(match.group(1)))
+            if post is None:
+                return 404, {'code': 'rest_post_invalid_id'}
+            return 200, {
+                'id': post['id'],
+                'title': {'raw': post.get('title', '')},
+                'content': {'raw': post.get('content', '')},
+                'categories': post.get('categories', []),
+                'tags': post.get('tags', []),
+                'featured_media': post.get('featured_media', 0),
+            }
+
+    def _new_id(self):
+        with self.lock:
+            new_id = self.next_id
+            self.next_id += 1
+            return new_id
+
+    def handle_json(self, route, data):
+        parts = route.strip('/').split('/')
+        name = parts[2] if len(parts) > 2 else ''
+        if name in ('categories', 'tags'):
+            with self.lock:
+                for term in self.collections[name].values():
+                    if term['name'].lower() == data.get('name', '').lower():
+                        return 400, {'code': 'term_exists', 'data': {'status': 400, 'term_id': term['id']}}
+            term_id = self._new_id()
+            term = {'id': term_id, 'name': data.get('name', ''), 'slug': data.get('slug') or str(term_id)}
+            with self.lock:
+                self.collections[name][term_id] = term
+            return 201, term
+        if name == 'posts':
+            if len(parts) > 3:
+                post_id = int(parts[3])
+                with self.lock:
+                    if post_id not in self.collections['posts']:
+                        return 404, {'code': 'rest_post_invalid_id'}
+                    self.collections['posts'][post_id].update(data)
+                return 200, {'id': post_id}
+            post_id = self._new_id()
+            with self.lock:
+                self.collections['posts'][post_id] = dict(data, id=post_id)
+            return 201, {'id': post_id}
+        return 404, {'code': 'rest_no_route'}
+
+    def create_media(self, body, content_type):
+        match = re.search(rb'name="slug"\r\n\r\n([^\r]*)', body)
+        media_id = self._new_id()
+        media = {
+            'id': media_id,
+            'slug': match.group(1).decode() if match else f'media-{media_id}',
+            'source_url': f'http://mock/uploads/{media_id}.jpg',
+        }
+        with self.lock:
+            self.collections['media'][media_id] = media
+        return 201, media
+
+def _serve(address_queue, latency, error_rate, retry_after):
+    server = MockWordPressServer(('127.0.0.1', 0), latency, error_rate, retry_after)
+    address_queue.put(server.server_address)
+    server.serve_forever()
+
+def start_mock_server(latency=0.0, error_rate=0.0, retry_after=0):
+    """Run the mock server in its own process so it does not skew importer timings"""
+    context = multiprocessing.get_context('spawn')
+    address_queue = context.Queue()
+    process = context.Process(target=_serve, args=(address_queue, latency, error_rate, retry_after), daemon=True)
+    process.start()
+    host, port = address_queue.get(timeout=30)
+    return process, f'http://{host}:{port}'
+
+class StageTimer:
+    """Wraps methods to collect per-call latencies by stage name"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def wrap(self, obj, method_name, stage=None):
+        stage = stage or method_name
+        method = getattr(obj, method_name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.samples.setdefault(stage, []).append(elapsed)
+
+        setattr(obj, method_name, timed)
+
+    def summary(self):
+        result = {}
+        for stage, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            result[stage] = {
+                'count': len(samples),
+                'p50_ms': round(_percentile(samples, 50) * 1000, 3),
+                'p99_ms': round(_percentile(samples, 99) * 1000, 3),
+            }
+        return result
+
+def _percentile(samples, percent):
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _results(args, elapsed, timer):
+    results = {
+        'params': {key: value for key, value in vars(args).items() if key not in ('baseline', 'save')},
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(args.messages / elapsed, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'stages': timer.summary(),
+    }
+    if tracemalloc.is_tracing():
+        # Peak of Python allocations during the import alone, unlike RSS which includes the export generation
+        results['peak_heap_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+    return results
+
+async def _create_posts_async(export_dir, timer):
+    """Create a post per message with AsyncWordPressAPI, every request queued at once"""
+    import asyncio
+    from async_wordpress_api import AsyncWordPressAPI
+    from content_processor import ContentProcessor
+    from export_reader import ExportReader
+
+    processor = ContentProcessor()
+    messages = [message for message in processor.process_messages(
+        ExportReader(os.path.join(export_dir, 'result.json')).iter_messages()) if message]
+
+    async with AsyncWordPressAPI() as api:
+        term_ids = {}
+        for taxonomy in ('categories', 'tags'):
+            names = sorted({name for message in messages for name in getattr(message, taxonomy)})
+            for name, (term, error) in zip(names, await api.create_terms(taxonomy, names)):
+                if term:
+                    term_ids[taxonomy, name] = term['id']
+
+        async def create(message):
+            started = time.perf_counter()
+            try:
+                await api.create_post(
+                    message.title, message.content, message.date,
+                    [term_ids[('categories', name)] for name in message.categories if ('categories', name) in term_ids],
+                    [term_ids[('tags', name)] for name in message.tags if ('tags', name) in term_ids],
+                )
+            finally:
+                timer.samples.setdefault('async_create_post', []).append(time.perf_counter() - started)
+
+        await asyncio.gather(*(create(message) for message in messages))
+        print(f"Async client: {api}, {threading.active_count()} threads")
+
+def run_benchmark(args):
+    """Generate an export, import it into the mock server and return the results"""
+    from config import Config
+
+    work_dir = tempfile.mkdtemp(prefix='tg2wp-bench-')
+    export_dir = os.path.join(work_dir, 'ChatExport_bench')
+    process = None
+    try:
+        generate_export(export_dir, args.messages, args.entity_ratio, args.photo_ratio,
+                        args.tag_density, seed=args.seed)
+        process, url = start_mock_server(args.latency, args.error_rate)
+
+        Config.WORDPRESS_URL = url
+        Config.WORDPRESS_APPLICATION_PASSWORD = 'benchmark'
+        Config.set_export_dir(export_dir)
+        Config.MEDIA_CACHE_FILE = os.path.join(work_dir, 'media_cache.sqlite3')
+        Config.HTTP_POOL_SIZE = max(Config.HTTP_POOL_SIZE, args.concurrency)
+        Config.IMAGE_MAX_DIMENSION = args.image_max_dimension
+        Config.ORIGINAL_MESSAGE = args.original
+        if args.trace_memory:
+            tracemalloc.start()
+
+        if args.async_client:
+            import asyncio
+            timer = StageTimer()
+            started = time.perf_counter()
+            asyncio.run(_create_posts_async(export_dir, timer))
+            return _results(args, time.perf_counter() - started, timer)
+
+        from telegram_importer import TelegramImporter
+        importer = TelegramImporter()
+        timer = StageTimer()
+        timer.wrap(importer.processor, 'process_message')
+        timer.wrap(importer, 'upload_file')
+        timer.wrap(importer, 'ensure_categories_exist')
+        timer.wrap(importer, 'ensure_tags_exist')
+        timer.wrap(importer.wp_api, 'create_post')
+        timer.wrap(importer.wp_api, 'create_posts')
+
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                importer.run(0, 0, stream=args.stream, concurrency=args.concurrency,
+                             track_state=not args.no_state, media_cache=not args.no_media_cache,
+                             post_batch=args.batch_posts)
+            finally:
+                sys.stdout = stdout
+        return _results(args, time.perf_counter() - started, timer)
+    finally:
+        if process:
+            process.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions of results against a baseline run"""
+    regressions = []
+    if results['messages_per_sec'] < baseline['messages_per_sec'] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['messages_per_sec']} -> {results['messages_per_sec']} messages/s")
+    if results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {baseline['peak_rss_mb']} -> {results['peak_rss_mb']} MB")
+    if 'peak_heap_mb' in results and 'peak_heap_mb' in baseline:
+        if results['peak_heap_mb'] > baseline['peak_heap_mb'] * (1 + tolerance):
+            regressions.append(f"peak heap {baseline['peak_heap_mb']} -> {results['peak_heap_mb']} MB")
+    for stage, stats in results['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if base and stats['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{stage} p99 {base['p99_ms']} -> {stats['p99_ms']} ms")
+    return regressions
+
+def print_results(results):
+    print(f"Imported {results['params']['messages']} messages in {results['elapsed_s']}s "
+          f"({results['messages_per_sec']} messages/s), peak RSS {results['peak_rss_mb']} MB")
+    if 'peak_heap_mb' in results:
+        print(f"Peak Python heap during the import: {results['peak_heap_mb']} MB")
+    print(f"{'stage':<26}{'count':>8}{'p50 ms':>12}{'p99 ms':>12}")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:<26}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p99_ms']:>12}")
+
+def build_parser(parser=None):
+    from content_processor import ORIGINAL_MODES
+
+    parser = parser or argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--messages', type=int, default=2000, help='Messages in the synthetic export')
+    parser.add_argument('--entity-ratio', type=float, default=0.5, help='Share of messages with text entities')
+    parser.add_argument('--photo-ratio', type=float, default=0.2, help='Share of messages with a photo')
+    parser.add_argument('--tag-density', type=float, default=0.3, help='Chance of a tag per sentence')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.005, help='Mock server latency per request (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 429/5xx')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--batch-posts', action='store_true')
+    parser.add_argument('--no-state', action='store_true')
+    parser.add_argument('--no-media-cache', action='store_true')
+    parser.add_argument('--image-max-dimension', type=int, default=0)
+    parser.add_argument('--async-client', action='store_true',
+                        help='Create the posts (no media) with AsyncWordPressAPI instead of running the importer')
+    parser.add_argument('--original', choices=ORIGINAL_MODES, default='lazy',
+                        help='What queued posts keep of their Telegram message (ORIGINAL_MESSAGE)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Report the peak Python heap of the import (tracemalloc, slows the run down)')
+    parser.add_argument('--save', metavar='FILE', help='Write results as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against saved results')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed regression vs. baseline (0.1 = 10%%)')
+    return parser
+
+def main(args=None):
+    if args is None:
+        args = build_parser().parse_args()
+
+    results = run_benchmark(args)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Results saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  ✗ {regression}")
+            return 1
+        print("✓ No regressions against baseline")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,160 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+# Directory of this script; .env, categories.md, tags.md and the default export
+# directory are looked up here first, so runs do not depend on the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-class Config:
-    # WordPress API Configuration
-    WORDPRESS_URL = os.getenv('WORDPRESS_URL', 'http://localhost')
-    WORDPRESS_USERNAME = os.getenv('WORDPRESS_USERNAME', 'sensei')
-    WORDPRESS_PASSWORD = os.getenv('WORDPRESS_PASSWORD', '')
-    WORDPRESS_APPLICATION_PASSWORD = os.getenv('WORDPRESS_APPLICATION_PASSWORD', '')
+def resolve_path(path):
+    """Return a relative path inside BASE_DIR if it exists there, else unchanged"""
+    if not os.path.isabs(path):
+        candidate = os.path.join(BASE_DIR, path)
+        if os.path.exists(candidate):
+            return candidate
+    return path
 
-    # Import Settings
-    BATCH_SIZE = int(os.getenv('BATCH_SIZE', '1'))  # Process 1 by 1 or batch
-    SKIP_SYSTEM_MESSAGES = True
-    REMOVE_EMOJI_LINES = True  # Remove lines with "Жми на " and emojis
+def data_path(path):
+    """Place a relative data file (cache, state, queue) in BASE_DIR
 
-    # Content Processing
-    DEFAULT_AUTHOR_ID = 1
-    DEFAULT_STATUS = 'publish'
+    A file left in the working directory by an earlier run is still used
+    while BASE_DIR has none, so existing state is not lost.
+    """
+    if not path or os.path.isabs(path):
+        return path
+    candidate = os.path.join(BASE_DIR, path)
+    if not os.path.exists(candidate) and os.path.exists(path):
+        return os.path.abspath(path)
+    return candidate
 
-    # File paths - can be overridden by environment variable or command line
-    EXPORT_DIR = os.getenv('EXPORT_DIR', 'ChatExport_2025-07-27')
-    PHOTOS_DIR = os.path.join(EXPORT_DIR, 'photos')
+def _load_env():
+    """Load .env; python-dotenv is optional when settings come from the environment"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    # Searches from this file's directory upwards, whatever the working directory
+    load_dotenv()
 
+def _load_settings():
+    """Read .env and every environment-driven setting"""
+    _load_env()
+
+    class Settings:
+        # WordPress API Configuration
+        WORDPRESS_URL = os.getenv('WORDPRESS_URL', 'http://localhost')
+        WORDPRESS_USERNAME = os.getenv('WORDPRESS_USERNAME', 'sensei')
+        WORDPRESS_PASSWORD = os.getenv('WORDPRESS_PASSWORD', '')
+        WORDPRESS_APPLICATION_PASSWORD = os.getenv('WORDPRESS_APPLICATION_PASSWORD', '')
+
+        # HTTP connection pooling
+        HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))  # Keep-alive connections per host
+        HTTP_KEEP_ALIVE = os.getenv('HTTP_KEEP_ALIVE', 'true').lower() == 'true'
+        HTTP_COMPRESSION = os.getenv('HTTP_COMPRESSION', 'true').lower() == 'true'  # Accept gzip/deflate responses
+
+        # Retries and request scheduling
+        HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))  # Seconds per request
+        HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '5'))  # On 429, 5xx, timeouts and connection errors
+        HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '1'))  # First retry waits up to this many seconds
+        HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '60'))
+        HTTP_RATE_LIMIT = float(os.getenv('HTTP_RATE_LIMIT', '0'))  # Requests per second (0 = unlimited)
+        HTTP_RATE_BURST = int(os.getenv('HTTP_RATE_BURST', '10'))
+        HTTP_MAX_CONCURRENCY = int(os.getenv('HTTP_MAX_CONCURRENCY', '0'))  # In-flight requests (0 = HTTP_POOL_SIZE)
+        HTTP_TARGET_LATENCY = float(os.getenv('HTTP_TARGET_LATENCY', '2'))  # Shrink concurrency above this (seconds)
+
+        # AsyncWordPressAPI (optional httpx; h2 for HTTP/2)
+        HTTP2 = os.getenv('HTTP2', 'true').lower() == 'true'  # Multiplex over HTTP/2 when the site offers it
+        ASYNC_POSTS_IN_FLIGHT = int(os.getenv('ASYNC_POSTS_IN_FLIGHT', '64'))  # Post requests in flight at once
+        ASYNC_MEDIA_IN_FLIGHT = int(os.getenv('ASYNC_MEDIA_IN_FLIGHT', '8'))  # Uploads in flight at once
+        ASYNC_TERMS_IN_FLIGHT = int(os.getenv('ASYNC_TERMS_IN_FLIGHT', '8'))  # Category/tag requests in flight at once
+
+        # Import Settings
+        BATCH_SIZE = int(os.getenv('BATCH_SIZE', '1'))  # Process 1 by 1 or batch
+        CONCURRENCY = int(os.getenv('CONCURRENCY', '1'))  # Posts created in parallel (1 = serial)
+        LARGE_UPLOAD_THRESHOLD_MB = float(os.getenv('LARGE_UPLOAD_THRESHOLD_MB', '20'))  # Slow lane from this size (0 = off)
+        LARGE_UPLOAD_WORKERS = int(os.getenv('LARGE_UPLOAD_WORKERS', '1'))  # Parallel uploads in the slow lane
+        MEDIA_UPLOAD_WORKERS = int(os.getenv('MEDIA_UPLOAD_WORKERS', '4'))  # Parallel uploads of one post's attachments
+        GROUP_ALBUMS = os.getenv('GROUP_ALBUMS', 'true').lower() == 'true'  # Merge album messages into one gallery post
+        DUPLICATE_POLICY = os.getenv('DUPLICATE_POLICY', 'off').lower()  # Near-duplicates: off, skip, merge or update
+        DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.6'))  # Share of word pairs in common
+        DUPLICATE_MIN_WORDS = int(os.getenv('DUPLICATE_MIN_WORDS', '8'))  # Shorter messages are never duplicates
+        SKIP_SYSTEM_MESSAGES = True
+        REMOVE_EMOJI_LINES = True  # Remove lines with "Жми на " and emojis
+        # Lines containing one of these phrases and an emoji are removed (comma-separated)
+        REMOVE_LINE_PHRASES = [p for p in os.getenv('REMOVE_LINE_PHRASES', 'Жми на ,Жми сердечко,Жми молнию').split(',') if p]
+        STREAM_EXPORT = os.getenv('STREAM_EXPORT', 'false').lower() == 'true'  # Parse result.json incrementally
+        # Message offsets in result.json for start index/id/date seeks, relative to EXPORT_DIR ('' = not saved)
+        EXPORT_INDEX_FILE = os.getenv('EXPORT_INDEX_FILE', 'result.json.idx')
+        PROCESS_WORKERS = int(os.getenv('PROCESS_WORKERS', '1'))  # Processes for batch content processing
+        # What queued posts keep of their Telegram message: keep, lazy (compact JSON) or drop
+        ORIGINAL_MESSAGE = os.getenv('ORIGINAL_MESSAGE', 'lazy').lower()
+        DRY_RUN_MEDIA_URL = os.getenv('DRY_RUN_MEDIA_URL', '')  # Where photos/ is hosted for WXR attachments
+        PRELOAD_TAXONOMY = os.getenv('PRELOAD_TAXONOMY', 'false').lower() == 'true'  # Create all needed terms upfront
+        POST_BATCH = os.getenv('POST_BATCH', 'false').lower() == 'true'  # Create posts via /batch/v1 (WordPress 5.6+)
+        BATCH_REQUEST_SIZE = int(os.getenv('BATCH_REQUEST_SIZE', '25'))  # Sub-requests per batch call (WordPress max 25)
+        SHOW_PROGRESS = os.getenv('SHOW_PROGRESS', 'false').lower() == 'true'  # Live progress line with ETA on stderr
+        METRICS_FILE = os.getenv('METRICS_FILE', '')  # Per-stage timings report (.json, or .prom for Prometheus)
+
+        # Import state and media cache
+        TRACK_STATE = os.getenv('TRACK_STATE', 'true').lower() == 'true'  # Record imported messages, skip them on re-run
+        STATE_FILE = os.getenv('STATE_FILE', 'import_state.sqlite3')  # Relative to EXPORT_DIR
+        MEDIA_CACHE = os.getenv('MEDIA_CACHE', 'true').lower() == 'true'  # Skip uploads of already uploaded images
+        MEDIA_CACHE_FILE = data_path(os.getenv('MEDIA_CACHE_FILE', 'media_cache.sqlite3'))  # Relative to BASE_DIR
+        # Shared by every export of --sync; relative to BASE_DIR
+        SYNC_STATE_FILE = data_path(os.getenv('SYNC_STATE_FILE', 'sync_state.sqlite3'))
+
+        # Work queue shared by publish and work processes
+        WORK_QUEUE = os.getenv('WORK_QUEUE', 'work_queue.sqlite3')  # SQLite file (relative to BASE_DIR), or backend:///path
+        if '://' not in WORK_QUEUE:
+            WORK_QUEUE = data_path(WORK_QUEUE)
+        QUEUE_RANGE_SIZE = int(os.getenv('QUEUE_RANGE_SIZE', '500'))  # Messages per published range
+        QUEUE_LEASE_SECONDS = int(os.getenv('QUEUE_LEASE_SECONDS', '300'))  # Unrenewed leases return to the queue
+
+        # Pre-upload image downscaling (0 = upload originals untouched)
+        IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '0'))
+        IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '82'))
+        IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'WEBP')  # WEBP or JPEG
+        IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '0'))  # 0 = one process per CPU
+        IMAGE_OUTPUT_DIR = os.getenv('IMAGE_OUTPUT_DIR', 'optimized')  # Relative to EXPORT_DIR
+
+        # Content Processing
+        DEFAULT_AUTHOR_ID = 1
+        DEFAULT_STATUS = 'publish'
+        TERM_WORD_BOUNDARY = os.getenv('TERM_WORD_BOUNDARY', 'false').lower() == 'true'  # Match whole words only
+        TERM_MORPHOLOGY = os.getenv('TERM_MORPHOLOGY', 'false').lower() == 'true'  # Match Russian word forms
+
+        # File paths - can be overridden by environment variable or command line
+        EXPORT_DIR = resolve_path(os.getenv('EXPORT_DIR', 'ChatExport_2025-07-27'))
+        PHOTOS_DIR = os.path.join(EXPORT_DIR, 'photos')
+
+    return {name: value for name, value in vars(Settings).items() if not name.startswith('__')}
+
+class _LazyConfig(type):
+    """Loads settings on first access to a missing Config attribute and caches them on the class
+
+    Values assigned before the first load (set_export_dir, tests, the
+    benchmark) take precedence over the environment.
+    """
+
+    # Attribute -> Config static method computing it on first use
+    LAZY_ATTRIBUTES = {'CATEGORIES': 'load_categories', 'TAGS': 'load_tags'}
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if not cls.__dict__.get('_loaded'):
+            type.__setattr__(cls, '_loaded', True)
+            for key, value in _load_settings().items():
+                if key not in cls.__dict__:
+                    type.__setattr__(cls, key, value)
+            if name in cls.__dict__:
+                return cls.__dict__[name]
+        loader = _LazyConfig.LAZY_ATTRIBUTES.get(name)
+        if loader is None:
+            raise AttributeError(f"Config has no setting {name!r}")
+        value = getattr(cls, loader)()
+        type.__setattr__(cls, name, value)
+        return value
+
+class Config(metaclass=_LazyConfig):
     @classmethod
     def set_export_dir(cls, export_dir):
         """Update export directory and recalculate photos directory"""
@@ -33,7 +165,7 @@ class Config:
     @staticmethod
     def load_categories():
         try:
-            with open('categories.md', 'r', encoding='utf-8') as f:
+            with open(resolve_path('categories.md'), 'r', encoding='utf-8') as f:
                 categories = [line.strip() for line in f if line.strip()]
             return categories
         except FileNotFoundError:
@@ -42,7 +174,7 @@ class Config:
     @staticmethod
     def load_tags():
         try:
-            with open('tags.md', 'r', encoding='utf-8') as f:
+            with open(resolve_path('tags.md'), 'r', encoding='utf-8') as f:
                 tags = [line.strip() for line in f if line.strip()]
             return tags
         except FileNotFoundError:
@@ -60,7 +192,3 @@ class Config:
                 'презентация', 'инфраструктура', 'figma', 'цель', 'стресс',
                 'тепловая карта', 'поведение'
             ]
-
-    # Categories and Tags loaded from external files
-    CATEGORIES = load_categories()
-    TAGS = load_tags()
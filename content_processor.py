@@ -1,191 +1,300 @@
 import re
 import json
+import sys
+from html import escape
+from collections import deque
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
 from config import Config
+from entity_renderer import render, render_parts
+from term_matcher import TermMatcher
+
+# Config attributes that affect processing and must match the parent in worker processes
+_WORKER_CONFIG = (
+    'EXPORT_DIR', 'PHOTOS_DIR', 'REMOVE_EMOJI_LINES', 'REMOVE_LINE_PHRASES', 'CATEGORIES', 'TAGS',
+    'TERM_WORD_BOUNDARY', 'TERM_MORPHOLOGY',
+)
+_worker_processor = None
+
+# Export media_type -> attachment kind; None means the file is not imported
+_MEDIA_KINDS = {
+    'video_file': 'video',
+    'animation': 'video',
+    'video_message': 'video',
+    'audio_file': 'audio',
+    'voice_message': 'audio',
+    'sticker': None,
+}
+# Telegram writes this instead of a path when a file was left out of the export
+_MISSING_FILE = '(File not included'
+
+# What a ProcessedMessage keeps of its Telegram message (ORIGINAL_MESSAGE)
+ORIGINAL_KEEP = 'keep'  # The message dict itself
+ORIGINAL_LAZY = 'lazy'  # Compact JSON, decoded when original is read
+ORIGINAL_DROP = 'drop'  # Nothing
+ORIGINAL_MODES = (ORIGINAL_KEEP, ORIGINAL_LAZY, ORIGINAL_DROP)
+
+_TAG = re.compile(r'<[^>]+>')
+_EMOJI = re.compile(r'[^\w\s]')
+_LIST_MARKERS = ('-', '—', '•')
+
+class MessageLines:
+    """Message content split into lines once and edited in place by the cleanup steps
+
+    lines holds the raw line strings and stripped their stripped views;
+    tag-free views are computed on first use and kept until the lines change.
+    """
+
+    def __init__(self, text):
+        self._replace(text.split('\n'))
+
+    def _replace(self, lines, stripped=None):
+        self.lines = lines
+        self.stripped = [line.strip() for line in lines] if stripped is None else stripped
+        self._plain = {}
+
+    def plain(self, index):
+        """Line text without HTML tags, stripped"""
+        value = self._plain.get(index)
+        if value is None:
+            value = self._plain[index] = _TAG.sub('', self.lines[index]).strip()
+        return value
+
+    def drop(self, rules):
+        """Remove the lines any rule (a callable taking the line string) matches"""
+        lines = self.lines
+        for rule in rules:
+            lines = [line for line in lines if not rule(line)]
+        if len(lines) != len(self.lines):
+            self._replace(lines)
+
+    def drop_before(self, index):
+        """Remove the lines before index in one slice"""
+        if index:
+            self._replace(self.lines[index:], self.stripped[index:])
+
+    def trim(self):
+        """Drop blank lines at both ends and outer whitespace, like str.strip() on the text"""
+        stripped = self.stripped
+        start = next((i for i, line in enumerate(stripped) if line), None)
+        if start is None:
+            self._replace([], [])
+            return
+        end = len(stripped) - 1
+        while not stripped[end]:
+            end -= 1
+        first, last = self.lines[start], self.lines[end]
+        if start == 0 and end == len(stripped) - 1 and first == stripped[start] and last == stripped[end]:
+            return
+        lines = self.lines[start:end + 1]
+        if len(lines) == 1:
+            lines[0] = stripped[start]
+        else:
+            lines[0] = first.lstrip()
+            lines[-1] = last.rstrip()
+        self._replace(lines, stripped[start:end + 1])
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+class ProcessedMessage:
+    """A Telegram message turned into post fields
+
+    Slotted, with categories and tags as tuples of interned names, so
+    queued posts cost little beyond their text. The Telegram message is
+    kept as is, as compact JSON decoded on each read of original, or not
+    at all (see ORIGINAL_MODES).
+    """
+
+    __slots__ = ('id', 'title', 'content', 'date', 'categories', 'tags', 'photo_path', 'attachments',
+                 'signature', '_original')
+    # Fields written by to_dict(), in output order
+    FIELDS = ('id', 'title', 'content', 'date', 'categories', 'tags', 'photo_path', 'attachments')
+
+    def __init__(self, id, title, content, date=None, categories=(), tags=(), photo_path=None,
+                 attachments=(), signature=None, original=None):
+        self.id = id
+        self.title = title
+        self.content = content
+        self.date = date
+        self.categories = tuple(map(sys.intern, categories))
+        self.tags = tuple(map(sys.intern, tags))
+        self.photo_path = photo_path
+        self.attachments = attachments
+        # Near-duplicate fingerprint, set by the importer
+        self.signature = signature
+        self._original = original
+
+    @classmethod
+    def from_message(cls, message, original=ORIGINAL_KEEP, **fields):
+        """Build a record keeping message the way original says"""
+        if original == ORIGINAL_LAZY:
+            kept = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode()
+        elif original == ORIGINAL_KEEP:
+            kept = message
+        elif original == ORIGINAL_DROP:
+            kept = None
+        else:
+            raise ValueError(f"Unknown original message mode: {original}")
+        return cls(message.get('id'), original=kept, **fields)
+
+    @property
+    def original(self):
+        """The Telegram message, or None if it was dropped"""
+        if isinstance(self._original, bytes):
+            return json.loads(self._original)
+        return self._original
+
+    def replace(self, **changes):
+        """Copy of the record with some fields changed"""
+        record = ProcessedMessage.__new__(ProcessedMessage)
+        for name in self.__slots__:
+            setattr(record, name, changes.pop(name, getattr(self, name)))
+        if changes:
+            raise TypeError(f"Unknown fields: {', '.join(changes)}")
+        return record
+
+    def to_dict(self):
+        """Post fields as a JSON-ready dict, without the original message"""
+        record = {name: getattr(self, name) for name in self.FIELDS}
+        record['categories'] = list(self.categories)
+        record['tags'] = list(self.tags)
+        return record
+
+    def __repr__(self):
+        return f"ProcessedMessage(id={self.id!r}, title={self.title!r})"
+
+def phrase_with_emoji_rule(phrases, pattern=_EMOJI):
+    """Cleanup rule matching lines that contain one of phrases and an emoji or symbol"""
+    phrases = [phrase for phrase in phrases if phrase]
+    if not phrases:
+        return lambda line: False
+    search = re.compile('|'.join(map(re.escape, phrases))).search
+    return lambda line: search(line) is not None and pattern.search(line) is not None
+
+def _init_worker(config, cleanup_rules=None):
+    """Set up a ContentProcessor in a pool worker with the parent's settings and custom cleanup rules"""
+    global _worker_processor
+    for name, value in config.items():
+        setattr(Config, name, value)
+    _worker_processor = ContentProcessor(cleanup_rules)
+
+def _process_chunk(messages):
+    """Process a chunk of messages in a pool worker, dropping the originals"""
+    return [_worker_processor.process_message(message, ORIGINAL_DROP) for message in messages]
+
+@lru_cache(maxsize=4)
+def _build_term_matcher(categories, tags, word_boundary, morphology):
+    """Compile the category/tag automaton once per term list and matching mode"""
+    return TermMatcher(
+        {'categories': categories, 'tags': tags},
+        word_boundary=word_boundary,
+        morphology=morphology
+    )
 
 class ContentProcessor:
-    def __init__(self):
-        self.emoji_pattern = re.compile(r'[^\w\s]')
-        self.remove_pattern = re.compile(r'^.*Жми на .*$', re.MULTILINE | re.IGNORECASE)
+    def __init__(self, cleanup_rules=None):
+        # Callables taking a line string and returning True to drop it; applied when REMOVE_EMOJI_LINES is on
+        # Custom rules are sent to process_messages() workers; the default ones are rebuilt there
+        self.custom_rules = cleanup_rules is not None
+        if cleanup_rules is None:
+            cleanup_rules = [phrase_with_emoji_rule(Config.REMOVE_LINE_PHRASES)]
+        self.cleanup_rules = list(cleanup_rules)
+        self.term_matcher = _build_term_matcher(
+            tuple(Config.CATEGORIES),
+            tuple(Config.TAGS),
+            Config.TERM_WORD_BOUNDARY,
+            Config.TERM_MORPHOLOGY
+        )
 
     def process_text_entities(self, text_entities):
         """Convert Telegram text entities to HTML"""
         if not text_entities:
             return ""
-
-        html_parts = []
-        for entity in text_entities:
-            text = entity.get('text', '')
-            entity_type = entity.get('type', 'plain')
-
-            if entity_type == 'bold':
-                html_parts.append(f'<strong>{text}</strong>')
-            elif entity_type == 'italic':
-                html_parts.append(f'<em>{text}</em>')
-            elif entity_type == 'code':
-                html_parts.append(f'<code>{text}</code>')
-            elif entity_type == 'pre':
-                html_parts.append(f'<pre>{text}</pre>')
-            elif entity_type == 'link':
-                url = entity.get('href', text)
-                html_parts.append(f'<a href="{url}">{text}</a>')
-            elif entity_type == 'plain':
-                html_parts.append(text)
-            else:
-                html_parts.append(text)
-
-        return ''.join(html_parts)
+        return ''.join(render_parts(text_entities))
 
     def process_mixed_text_content(self, text_content):
         """Process mixed text content (strings and objects)"""
         if not text_content:
             return ""
-
-        html_parts = []
-        for item in text_content:
-            if isinstance(item, dict):
-                # Handle entity object
-                text = item.get('text', '')
-                entity_type = item.get('type', 'plain')
-
-                if entity_type == 'bold':
-                    html_parts.append(f'<strong>{text}</strong>')
-                elif entity_type == 'italic':
-                    html_parts.append(f'<em>{text}</em>')
-                elif entity_type == 'code':
-                    html_parts.append(f'<code>{text}</code>')
-                elif entity_type == 'pre':
-                    html_parts.append(f'<pre>{text}</pre>')
-                elif entity_type == 'link':
-                    url = item.get('href', text)
-                    html_parts.append(f'<a href="{url}">{text}</a>')
-                elif entity_type == 'plain':
-                    html_parts.append(text)
-                else:
-                    html_parts.append(text)
-            else:
-                # Handle plain string
-                html_parts.append(str(item))
-
-        return ''.join(html_parts)
+        return ''.join(render_parts(text_content))
 
     def clean_text(self, text):
         """Clean text by removing unwanted patterns"""
         if not text:
             return ""
+        return self.clean_lines(text).text()
 
-        # Remove lines with "Жми на " and emojis
-        if Config.REMOVE_EMOJI_LINES:
-            lines = text.split('\n')
-            cleaned_lines = []
-
-            for line in lines:
-                # Skip lines that contain "Жми" patterns and have emojis
-                if (('Жми на ' in line or 'Жми сердечко' in line or 'Жми молнию' in line) and
-                    self.emoji_pattern.search(line)):
-                    continue
-                cleaned_lines.append(line)
-
-            text = '\n'.join(cleaned_lines)
-
-        return text.strip()
+    def clean_lines(self, text):
+        """Split text into lines once, drop lines matched by the cleanup rules and trim"""
+        lines = MessageLines(text)
+        if Config.REMOVE_EMOJI_LINES and self.cleanup_rules:
+            lines.drop(self.cleanup_rules)
+        lines.trim()
+        return lines
 
     def remove_title_from_content(self, content, title):
         """Remove the title from the beginning of content to avoid duplication"""
         if not content or not title:
             return content
-
-        # Clean title for comparison (remove HTML tags)
-        clean_title = re.sub(r'<[^>]+>', '', title).strip()
-
-        # Split content into lines
-        lines = content.split('\n')
-
-        # Find and remove the line that matches the title
-        for i, line in enumerate(lines):
-            clean_line = re.sub(r'<[^>]+>', '', line).strip()
-            if clean_line == clean_title:
-                # Remove this line and any empty lines that follow
-                lines = lines[i+1:]
-                # Remove leading empty lines
-                while lines and not lines[0].strip():
-                    lines = lines[1:]
+        lines = MessageLines(content)
+        self.remove_title_lines(lines, title)
+        lines.trim()
+        return lines.text()
+
+    def remove_title_lines(self, lines, title):
+        """Drop the first line matching title (ignoring HTML tags) and the lines before it"""
+        clean_title = _TAG.sub('', title).strip()
+        stripped = lines.stripped
+        count = len(stripped)
+        for i in range(count):
+            if lines.plain(i) == clean_title:
+                # Also drop the empty lines that follow it
+                i += 1
+                while i < count and not stripped[i]:
+                    i += 1
+                lines.drop_before(i)
                 break
 
-        return '\n'.join(lines).strip()
-
     def extract_title(self, content, max_length=100):
         """Extract title from content"""
         if not content:
             return "Post"
+        return self.title_from_lines(MessageLines(content), max_length)
 
-                # Get the first line only
-        lines = content.split('\n')
-        if not lines:
-            return "Post"
-
-        # Find the first non-empty line
-        first_line = None
-        first_line_index = 0
-        for i, line in enumerate(lines):
-            if line.strip():
-                first_line = line.strip()
-                first_line_index = i
-                break
-
-        if not first_line:
+    def title_from_lines(self, lines, max_length=100):
+        """Pick a title from the first non-empty line that is not a list item or a URL"""
+        stripped = lines.stripped
+        first = next((i for i, line in enumerate(stripped) if line), None)
+        if first is None:
             return "Post"
 
-        # Skip if first line is a list item
-        if first_line.startswith('-') or first_line.startswith('—') or first_line.startswith('•'):
-            # Try to find the next non-empty line that could be a title
-            for line in lines[first_line_index + 1:]:
-                line = line.strip()
-                if line and len(line) <= max_length and not line.startswith('http'):
-                    # Skip list items
-                    if line.startswith('-') or line.startswith('—') or line.startswith('•'):
-                        continue
-                    # Remove HTML tags for title
-                    clean_title = re.sub(r'<[^>]+>', '', line)
-                    # Remove trailing dots and clean up
-                    clean_title = clean_title.rstrip('.')
-                    return clean_title[:max_length]
+        # A list item is not a title; try the next line that could be one
+        if stripped[first].startswith(_LIST_MARKERS):
+            candidates = islice(stripped, first + 1, None)
         else:
-            # First line is not a list item, use it as title
-            if len(first_line) <= max_length and not first_line.startswith('http'):
-                # Remove HTML tags for title
-                clean_title = re.sub(r'<[^>]+>', '', first_line)
-                # Remove trailing dots and clean up
-                clean_title = clean_title.rstrip('.')
-                return clean_title[:max_length]
+            candidates = (stripped[first],)
+
+        for line in candidates:
+            if line and len(line) <= max_length and not line.startswith('http'):
+                if line.startswith(_LIST_MARKERS):
+                    continue
+                # Title without HTML tags and trailing dots
+                return _TAG.sub('', line).rstrip('.')[:max_length]
 
         # Fallback: use first meaningful text
-        clean_content = re.sub(r'<[^>]+>', '', content)
-        words = clean_content.split()[:5]
-        fallback_title = ' '.join(words)[:max_length]
-        # Remove trailing dots from fallback title too
-        return fallback_title.rstrip('.')
+        words = _TAG.sub('', lines.text()).split()[:5]
+        return ' '.join(words)[:max_length].rstrip('.')
 
     def analyze_content(self, content):
         """Analyze content to determine categories and tags"""
         if not content:
             return [], []
 
-        content_lower = content.lower()
-        categories = []
-        tags = []
-
-        # Check for categories (now simple list)
-        for category in Config.CATEGORIES:
-            if category.lower() in content_lower:
-                categories.append(category)
-
-        # Check for tags
-        for tag in Config.TAGS:
-            if tag.lower() in content_lower:
-                tags.append(tag)
-
-        return categories, tags
+        # Single pass over the content for all categories and tags
+        found = self.term_matcher.find(content)
+        return found['categories'], found['tags']
 
     def format_date(self, date_string):
         """Format date for WordPress"""
@@ -196,8 +305,139 @@ class ContentProcessor:
         except:
             return None
 
-    def process_message(self, message):
-        """Process a single Telegram message"""
+    def photo_path(self, photo_filename):
+        """Local path of an exported photo"""
+        # Remove 'photos/' prefix if it's already in the filename
+        if photo_filename.startswith('photos/'):
+            photo_filename = photo_filename[7:]  # Remove 'photos/' prefix
+        return f"{Config.PHOTOS_DIR}/{photo_filename}"
+
+    def message_attachments(self, message):
+        """Return the files of a message, or of every member of an album
+
+        Each attachment is a dict with path, kind (image, video, audio or
+        file) and mime_type.
+        """
+        attachments = []
+        for member in message.get('album') or [message]:
+            photo = member.get('photo')
+            if photo and not photo.startswith(_MISSING_FILE):
+                attachments.append({'path': self.photo_path(photo), 'kind': 'image', 'mime_type': 'image/jpeg'})
+
+            file_name = member.get('file')
+            if file_name and not file_name.startswith(_MISSING_FILE):
+                kind = _MEDIA_KINDS.get(member.get('media_type'), 'file')
+                if kind:
+                    attachments.append({
+                        'path': f"{Config.EXPORT_DIR}/{file_name}",
+                        'kind': kind,
+                        'mime_type': member.get('mime_type')
+                    })
+        return attachments
+
+    @staticmethod
+    def _album_key(message):
+        """Key shared by the messages of one album, or None if the message cannot be in one"""
+        if message.get('type') != 'message' or not (message.get('photo') or message.get('file')):
+            return None
+        group_id = message.get('media_group_id') or message.get('grouped_id')
+        if group_id:
+            return 'group', group_id
+        return 'date', message.get('date_unixtime') or message.get('date'), message.get('from_id')
+
+    @staticmethod
+    def _merge_album(members):
+        if len(members) == 1:
+            return members[0]
+        caption = next((member for member in members if member.get('text')), members[0])
+        merged = dict(caption)
+        merged['album'] = members
+        return merged
+
+    def group_albums(self, messages):
+        """Merge the messages of each media album into one message
+
+        Albums are consecutive media messages sharing a media group id or,
+        as Telegram Desktop exports carry none, the same date and sender
+        with at most one caption. A merged album is its captioned member
+        plus an 'album' list of all members, in order.
+        """
+        members = []
+        album_key = None
+        for message in messages:
+            key = self._album_key(message)
+            if members and key == album_key:
+                has_caption = any(member.get('text') for member in members)
+                if not (message.get('text') and has_caption):
+                    members.append(message)
+                    continue
+
+            if members:
+                yield self._merge_album(members)
+            if key:
+                members, album_key = [message], key
+            else:
+                members, album_key = [], None
+                yield message
+
+        if members:
+            yield self._merge_album(members)
+
+    @staticmethod
+    def render_attachments(attachments, media):
+        """Return block markup for uploaded attachments
+
+        media holds the uploaded media (dicts with id and source_url, None
+        if the upload failed) in the order of attachments. A single image is
+        only used as the featured image; several become a gallery.
+        """
+        images = []
+        blocks = []
+        for attachment, item in zip(attachments, media):
+            if not item or not item.get('source_url'):
+                continue
+            media_id = int(item['id'])
+            url = escape(item['source_url'])
+            kind = attachment['kind']
+
+            if kind == 'image':
+                images.append(
+                    f'<!-- wp:image {{"id":{media_id},"sizeSlug":"large","linkDestination":"none"}} -->\n'
+                    f'<figure class="wp-block-image size-large"><img src="{url}" alt="" class="wp-image-{media_id}"/></figure>\n'
+                    '<!-- /wp:image -->'
+                )
+            elif kind in ('video', 'audio'):
+                blocks.append(
+                    f'<!-- wp:{kind} {{"id":{media_id}}} -->\n'
+                    f'<figure class="wp-block-{kind}"><{kind} controls src="{url}"></{kind}></figure>\n'
+                    f'<!-- /wp:{kind} -->'
+                )
+            else:
+                name = escape(attachment['path'].rsplit('/', 1)[-1])
+                blocks.append(
+                    f'<!-- wp:file {{"id":{media_id},"href":{json.dumps(item["source_url"])}}} -->\n'
+                    f'<div class="wp-block-file"><a href="{url}">{name}</a>'
+                    f'<a href="{url}" class="wp-block-file__button" download>Download</a></div>\n'
+                    '<!-- /wp:file -->'
+                )
+
+        if len(images) > 1:
+            blocks.insert(0, (
+                '<!-- wp:gallery {"linkTo":"none"} -->\n'
+                '<figure class="wp-block-gallery has-nested-images columns-default is-cropped">\n'
+                + '\n'.join(images) +
+                '\n</figure>\n<!-- /wp:gallery -->'
+            ))
+        return '\n\n'.join(blocks)
+
+    def process_message(self, message, original=None):
+        """Process a single Telegram message into a ProcessedMessage, or None if it makes no post
+
+        original is how much of the message the record keeps (ORIGINAL_MESSAGE by default).
+        """
+        if original is None:
+            original = Config.ORIGINAL_MESSAGE
+
         # Skip system messages
         if message.get('type') == 'service':
             return None
@@ -206,25 +446,22 @@ class ContentProcessor:
         if not message.get('text'):
             return None
 
-        # Process text content
-        text_content = message.get('text', '')
-        if isinstance(text_content, list):
-            # Handle mixed array format (strings and objects)
-            processed_content = self.process_mixed_text_content(text_content)
-        else:
-            # Handle plain text format
-            processed_content = text_content
+        # Plain text or mixed array format (strings and entity objects) to HTML
+        processed_content = render(message['text'])
 
-        # Clean the content
-        cleaned_content = self.clean_text(processed_content)
-        if not cleaned_content:
+        # Split into lines once; cleanup, title extraction and title removal share them
+        lines = self.clean_lines(processed_content)
+        if not lines.lines:
             return None
 
         # Extract title
-        title = self.extract_title(cleaned_content)
+        title = self.title_from_lines(lines)
 
         # Remove title from content to avoid duplication
-        content_without_title = self.remove_title_from_content(cleaned_content, title)
+        if title:
+            self.remove_title_lines(lines, title)
+            lines.trim()
+        content_without_title = lines.text()
 
         # Analyze content for categories and tags
         categories, tags = self.analyze_content(content_without_title)
@@ -232,22 +469,59 @@ class ContentProcessor:
         # Process date
         date = self.format_date(message.get('date', ''))
 
-        # Process photo if present
-        photo_path = None
-        if message.get('photo'):
-            photo_filename = message['photo']
-            # Remove 'photos/' prefix if it's already in the filename
-            if photo_filename.startswith('photos/'):
-                photo_filename = photo_filename[7:]  # Remove 'photos/' prefix
-            photo_path = f"{Config.PHOTOS_DIR}/{photo_filename}"
-
-        return {
-            'id': message.get('id'),
-            'title': title,
-            'content': content_without_title,
-            'date': date,
-            'categories': categories,
-            'tags': tags,
-            'photo_path': photo_path,
-            'original_message': message
-        }
\ No newline at end of file
+        # Collect photos, videos and files; the first image becomes the featured image
+        attachments = self.message_attachments(message)
+        photo_path = next((item['path'] for item in attachments if item['kind'] == 'image'), None)
+
+        return ProcessedMessage.from_message(
+            message, original,
+            title=title,
+            content=content_without_title,
+            date=date,
+            categories=categories,
+            tags=tags,
+            photo_path=photo_path,
+            attachments=attachments
+        )
+
+    def process_messages(self, messages, workers=None, chunk_size=256):
+        """Process many messages, optionally on a process pool
+
+        Yields one result per input message (None for skipped ones) in input
+        order. Messages are sent to workers in chunks and only a bounded
+        number of chunks is in flight, so any iterable, including a streamed
+        export, can be processed with flat memory. Results never keep the
+        original message.
+        """
+        if workers is None:
+            workers = Config.PROCESS_WORKERS
+
+        if workers <= 1:
+            for message in messages:
+                yield self.process_message(message, ORIGINAL_DROP)
+            return
+
+        # Process pool machinery is only loaded when a pool is used
+        import pickle
+        from concurrent.futures import ProcessPoolExecutor
+
+        config = {name: getattr(Config, name) for name in _WORKER_CONFIG}
+        cleanup_rules = None
+        if self.custom_rules:
+            cleanup_rules = self.cleanup_rules
+            try:
+                pickle.dumps(cleanup_rules)
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                raise ValueError("Custom cleanup_rules must be picklable (module-level functions) "
+                                 f"to process messages on {workers} workers: {e}") from None
+        messages = iter(messages)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(config, cleanup_rules)) as executor:
+            pending = deque()
+            for chunk in iter(lambda: list(islice(messages, chunk_size)), []):
+                pending.append(executor.submit(_process_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+
+            while pending:
+                yield from pending.popleft().result()
\ No newline at end of file
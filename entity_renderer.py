@@ -0,0 +1,96 @@
+import re
+from functools import lru_cache
+from html import escape
+
+# Schemes allowed in rendered links; anything else (javascript:, data:, ...) stays plain text
+_SAFE_SCHEMES = ('http', 'https', 'tg', 'mailto', 'tel')
+_SCHEME = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.-]*):')
+_PHONE_CHARS = re.compile(r'[^\d+]')
+
+def escape_text(text):
+    """Escape text for HTML content, skipping the work for the common clean case"""
+    if '&' in text or '<' in text or '>' in text:
+        return escape(text, quote=False)
+    return text
+
+def safe_href(url):
+    """Return url usable as a link target, or None if its scheme is not allowed"""
+    url = (url or '').strip()
+    if not url:
+        return None
+    match = _SCHEME.match(url)
+    if not match:
+        # Telegram detects bare domains such as example.com/page as links
+        return 'http://' + url
+    if match.group(1).lower() not in _SAFE_SCHEMES:
+        return None
+    return url
+
+@lru_cache(maxsize=4096)
+def _link_tags(url):
+    """Opening and closing tags for a link, or None if the target is unsafe"""
+    href = safe_href(url)
+    if href is None:
+        return None
+    return f'<a href="{escape(href)}">', '</a>'
+
+def _pre_tags(entity):
+    language = entity.get('language')
+    if language:
+        return f'<pre class="wp-block-code"><code lang="{escape(language)}">', '</code></pre>'
+    return '<pre class="wp-block-code"><code>', '</code></pre>'
+
+def _href_tags(entity):
+    return _link_tags(entity.get('href') or entity.get('text'))
+
+# Entity type -> (opening tag, closing tag), or a function of the entity returning
+# them (None renders the text alone). Every other type (plain, hashtag, cashtag,
+# bot_command, custom_emoji, mention_name, bank_card, ...) is rendered as its text.
+ENTITY_TAGS = {
+    'bold': ('<strong>', '</strong>'),
+    'italic': ('<em>', '</em>'),
+    'underline': ('<u>', '</u>'),
+    'strikethrough': ('<s>', '</s>'),
+    'spoiler': ('<span class="spoiler">', '</span>'),
+    'code': ('<code>', '</code>'),
+    'pre': _pre_tags,
+    'blockquote': ('<blockquote class="wp-block-quote">', '</blockquote>'),
+    'link': _href_tags,
+    'text_link': _href_tags,
+    'mention': lambda entity: _link_tags('https://t.me/' + entity.get('text', '').lstrip('@')),
+    'email': lambda entity: _link_tags('mailto:' + entity.get('text', '')),
+    'phone': lambda entity: _link_tags('tel:' + _PHONE_CHARS.sub('', entity.get('text', ''))),
+}
+
+def render_parts(items, tags=ENTITY_TAGS):
+    """Render Telegram text parts (strings and entity dicts) to a list of HTML fragments
+
+    One fragment per part, so the list lines up with the input; join it once.
+    """
+    parts = []
+    append = parts.append
+    get_tags = tags.get
+    for item in items:
+        if item.__class__ is not dict:
+            text = item if item.__class__ is str else str(item)
+            if '&' in text or '<' in text or '>' in text:
+                text = escape(text, quote=False)
+            append(text)
+            continue
+
+        text = item.get('text', '')
+        if '&' in text or '<' in text or '>' in text:
+            text = escape(text, quote=False)
+        wrapper = get_tags(item.get('type'))
+        if wrapper is not None and wrapper.__class__ is not tuple:
+            wrapper = wrapper(item)
+        append(text if wrapper is None else wrapper[0] + text + wrapper[1])
+    return parts
+
+def render(text):
+    """Render a message's text, a plain string or a list of parts, to HTML"""
+    if not text:
+        return ''
+    if isinstance(text, str):
+        return escape_text(text)
+    return ''.join(render_parts(text))
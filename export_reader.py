@@ -0,0 +1,389 @@
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import islice
+from operator import le
+
+# Structural bytes we care about while scanning; everything else is skipped in bulk
+_TOKEN = re.compile(rb'["{}\[\]]')
+# Remainder of a JSON string after its opening quote (unrolled to stay linear)
+_STRING_TAIL = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_WHITESPACE = re.compile(rb'[ \t\r\n]*')
+# Everything up to the next brace or bracket outside a string, complete strings included
+_VALUE_RUN = re.compile(rb'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*', re.DOTALL)
+
+_QUOTE = 0x22
+_OPEN_BRACE = 0x7b
+_OPEN_BRACKET = 0x5b
+_CLOSE_BRACKET = 0x5d
+_COMMA = 0x2c
+_COLON = 0x3a
+
+_MESSAGE_ID = re.compile(rb'\{\s*"id"\s*:\s*(-?\d+)')
+# Chat id in the header of a single-chat export, before its messages
+_CHAT_ID = re.compile(rb'"id"\s*:\s*(-?\d+)')
+_MESSAGES_KEY = re.compile(rb'"messages"\s*:')
+_DATE_UNIXTIME = re.compile(rb'"date_unixtime"\s*:\s*"?(-?\d+)')
+# Exports made before date_unixtime existed only carry the local "date"
+_DATE = re.compile(rb'"date"\s*:\s*"([^"]+)"')
+
+# Sidecar index file: magic, export size, export mtime (ns), message count, then the arrays
+_INDEX_MAGIC = b'T2WPIDX1'
+_INDEX_HEADER = struct.Struct('<8sqqq')
+_INDEX_ARRAYS = ('offsets', 'lengths', 'ids', 'dates')
+
+
+def parse_export_date(value, end=False):
+    """Unix time of an ISO date or datetime in local time, as Telegram's "date" field
+
+    With end, a bare date means the end of that day, so ranges include it.
+    """
+    moment = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        moment += timedelta(days=1)
+    return int(moment.timestamp())
+
+
+def read_chat_id(export_file, limit=1 << 16):
+    """Return the id of the exported chat from the header of result.json, or None"""
+    with open(export_file, 'rb') as f:
+        head = f.read(limit)
+    match = _MESSAGES_KEY.search(head)
+    if match:
+        head = head[:match.start()]
+    match = _CHAT_ID.search(head)
+    return int(match.group(1)) if match else None
+
+
+class ExportReader:
+    """Incremental reader for the `messages` array of a Telegram result.json.
+
+    Only one message is decoded at a time, so memory stays flat no matter how
+    large the export is. Skipped messages are only scanned for their bounds
+    and never turned into Python objects.
+    """
+
+    def __init__(self, export_file, chunk_size=1 << 20, index=None):
+        self.export_file = export_file
+        self.chunk_size = chunk_size
+        # ExportIndex of the file; with it, reads seek straight to start_index
+        self.index = index
+        # Bytes of the file scanned so far, for progress reporting
+        self.position = 0
+        self.size = 0
+
+    def iter_messages(self, start_index=0, stop_index=None):
+        """Yield message dicts one by one, from start_index up to stop_index"""
+        for offset, raw in self.iter_raw_messages(start_index, stop_index):
+            yield json.loads(raw)
+
+    def fraction(self):
+        """Share of the file read so far (0..1)"""
+        return self.position / self.size if self.size else 0.0
+
+    def iter_raw_messages(self, start_index=0, stop_index=None):
+        """Yield (byte offset, raw JSON bytes) for every message from start_index up to stop_index"""
+        if self.index is not None:
+            yield from self._iter_indexed(start_index, stop_index)
+            return
+
+        self.size = os.path.getsize(self.export_file)
+        with open(self.export_file, 'rb') as f:
+            scanner = _Scanner(f.read, self.chunk_size)
+            if not scanner.seek_messages_array():
+                return
+
+            index = 0
+            while scanner.next_element():
+                if stop_index is not None and index >= stop_index:
+                    return
+                if index < start_index:
+                    scanner.skip_value()
+                else:
+                    offset, raw = scanner.read_value()
+                    self.position = offset + len(raw)
+                    yield offset, raw
+                index += 1
+
+    def _iter_indexed(self, start_index, stop_index):
+        """Read messages at the offsets recorded in the index, touching no other byte"""
+        index = self.index
+        stop = len(index) if stop_index is None else min(stop_index, len(index))
+        if start_index >= stop:
+            return
+
+        # Progress covers the selected range only
+        first = index.offsets[start_index]
+        self.size = index.offsets[stop - 1] + index.lengths[stop - 1] - first
+        with open(self.export_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for i in range(start_index, stop):
+                offset = index.offsets[i]
+                end = offset + index.lengths[i]
+                self.position = end - first
+                yield offset, data[offset:end]
+
+
+class ExportIndex:
+    """Byte offset, length, id and date of every message of a result.json
+
+    Built once by scanning the memory-mapped export for message bounds, and
+    saved to a sidecar file that loads in milliseconds on later runs. The
+    file records the export's size and modification time; when either
+    differs, the index is rebuilt. Telegram lists messages in id and date
+    order, so id and date ranges are found by bisection.
+    """
+
+    def __init__(self, export_file):
+        self.export_file = export_file
+        self.offsets = array('q')
+        self.lengths = array('q')
+        self.ids = array('q')
+        self.dates = array('q')
+        # Size and mtime (ns) of the export the index was built from
+        self.stamp = None
+        # Whether the last open() had to scan the export
+        self.built = False
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def open(cls, export_file, index_file=None):
+        """Load index_file if it matches export_file, otherwise build it (and save it to index_file)"""
+        index = cls(export_file)
+        if index_file and index.load(index_file):
+            return index
+
+        index.build()
+        if index_file:
+            try:
+                index.save(index_file)
+            except OSError as e:
+                print(f"Could not save export index {index_file}: {e}")
+        return index
+
+    def _stamp(self):
+        stat = os.stat(self.export_file)
+        return stat.st_size, stat.st_mtime_ns
+
+    def build(self):
+        """Scan the export and record every message"""
+        self.built = True
+        self.stamp = self._stamp()
+        for name in _INDEX_ARRAYS:
+            setattr(self, name, array('q'))
+        if not self.stamp[0]:
+            return self
+
+        offsets, lengths, ids, dates = (getattr(self, name) for name in _INDEX_ARRAYS)
+        with open(self.export_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            scanner = _Scanner(None, 0, data)
+            if not scanner.seek_messages_array():
+                return self
+            while scanner.next_element():
+                start = scanner.pos
+                scanner.skip_value()
+                end = scanner.pos
+                offsets.append(start)
+                lengths.append(end - start)
+
+                match = _MESSAGE_ID.match(data, start, end)
+                if match:
+                    ids.append(int(match.group(1)))
+                else:
+                    message_id = json.loads(data[start:end]).get('id')
+                    ids.append(message_id if isinstance(message_id, int) else -1)
+                match = _DATE_UNIXTIME.search(data, start, end)
+                if match:
+                    dates.append(int(match.group(1)))
+                else:
+                    match = _DATE.search(data, start, end)
+                    dates.append(parse_export_date(match.group(1).decode()) if match else 0)
+        return self
+
+    def save(self, index_file):
+        """Write the index next to the export, replacing any previous one atomically"""
+        temp_file = index_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, *self.stamp, len(self)))
+            for name in _INDEX_ARRAYS:
+                values = getattr(self, name)
+                if sys.byteorder == 'big':
+                    values = array('q', values)
+                    values.byteswap()
+                values.tofile(f)
+        os.replace(temp_file, index_file)
+
+    def load(self, index_file):
+        """Read a saved index; False when it is missing, damaged or the export changed"""
+        try:
+            with open(index_file, 'rb') as f:
+                magic, size, mtime_ns, count = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+                if magic != _INDEX_MAGIC or (size, mtime_ns) != self._stamp():
+                    return False
+                for name in _INDEX_ARRAYS:
+                    values = array('q')
+                    values.fromfile(f, count)
+                    if sys.byteorder == 'big':
+                        values.byteswap()
+                    setattr(self, name, values)
+        except (OSError, EOFError, struct.error):
+            return False
+        self.stamp = (size, mtime_ns)
+        return True
+
+    def select(self, start_index=0, first_id=None, last_id=None, since=None, until=None):
+        """(start, stop) index range of messages from start_index with ids and dates in range
+
+        Ids are inclusive at both ends; dates are Unix times, since <= date < until.
+        """
+        start, stop = start_index, len(self)
+        for values, low, high in ((self.ids, first_id, None if last_id is None else last_id + 1),
+                                  (self.dates, since, until)):
+            if low is None and high is None:
+                continue
+            low_index, high_index = _value_range(values, low, high)
+            start, stop = max(start, low_index), min(stop, high_index)
+        return start, max(start, stop)
+
+
+def _value_range(values, low, high):
+    """Index range of values in [low, high), bisected when values are sorted"""
+    if all(map(le, values, islice(values, 1, None))):
+        start = 0 if low is None else bisect_left(values, low)
+        stop = len(values) if high is None else bisect_left(values, high)
+        return start, stop
+
+    # Out-of-order export: span from the first to the last message in range
+    inside = [i for i, value in enumerate(values)
+              if (low is None or value >= low) and (high is None or value < high)]
+    if not inside:
+        return 0, 0
+    return inside[0], inside[-1] + 1
+
+
+class _Scanner:
+    """Byte-level JSON scanner over a growing buffer"""
+
+    def __init__(self, read, chunk_size, buf=b''):
+        self._read = read
+        self.chunk_size = chunk_size
+        self.buf = buf
+        self.pos = 0
+        # File offset of buf[0]; grows as consumed bytes are dropped
+        self.base = 0
+        # Buffer position that must survive compaction (start of a captured value)
+        self.mark = None
+
+    def _more(self):
+        """Append the next chunk to the buffer, dropping bytes already consumed"""
+        if self._read is None:
+            return False
+        data = self._read(self.chunk_size)
+        if not data:
+            return False
+
+        keep = self.pos if self.mark is None else self.mark
+        if keep:
+            self.buf = self.buf[keep:]
+            self.base += keep
+            self.pos -= keep
+            if self.mark is not None:
+                self.mark -= keep
+        self.buf += data
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._more():
+                return
+
+    def _peek(self):
+        """Return the next non-whitespace byte without consuming it"""
+        self._skip_whitespace()
+        if self.pos >= len(self.buf):
+            return None
+        return self.buf[self.pos]
+
+    def _read_string(self):
+        """Consume a string whose opening quote is already consumed; return its raw body"""
+        while True:
+            match = _STRING_TAIL.match(self.buf, self.pos)
+            if match:
+                start = self.pos
+                self.pos = match.end()
+                return self.buf[start:self.pos - 1]
+            if not self._more():
+                raise ValueError("Unterminated string in export file")
+
+    def seek_messages_array(self):
+        """Advance to just inside the top-level "messages" array"""
+        depth = 0
+        while True:
+            match = _TOKEN.search(self.buf, self.pos)
+            if not match:
+                self.pos = len(self.buf)
+                if not self._more():
+                    return False
+                continue
+
+            char = self.buf[match.start()]
+            self.pos = match.end()
+            if char == _QUOTE:
+                key = self._read_string()
+                if depth == 1 and key == b'messages' and self._peek() == _COLON:
+                    self.pos += 1
+                    if self._peek() == _OPEN_BRACKET:
+                        self.pos += 1
+                        return True
+            elif char == _OPEN_BRACE or char == _OPEN_BRACKET:
+                depth += 1
+            else:
+                depth -= 1
+
+    def next_element(self):
+        """Position on the next array element; False once the array is closed"""
+        char = self._peek()
+        if char == _COMMA:
+            self.pos += 1
+            char = self._peek()
+        if char is None or char == _CLOSE_BRACKET:
+            return False
+        return True
+
+    def skip_value(self):
+        """Consume one value (object or array) without decoding it"""
+        depth = 0
+        while True:
+            self.pos = _VALUE_RUN.match(self.buf, self.pos).end()
+            # Stopped at the end of the buffer, or at a string that continues past it
+            if self.pos >= len(self.buf) or self.buf[self.pos] == _QUOTE:
+                if not self._more():
+                    raise ValueError("Unexpected end of export file")
+                continue
+
+            char = self.buf[self.pos]
+            self.pos += 1
+            if char == _OPEN_BRACE or char == _OPEN_BRACKET:
+                depth += 1
+            else:
+                depth -= 1
+            if depth == 0:
+                return
+
+    def read_value(self):
+        """Consume one value and return (byte offset, raw bytes)"""
+        self.mark = self.pos
+        try:
+            self.skip_value()
+            start = self.mark
+            return self.base + start, self.buf[start:self.pos]
+        finally:
+            self.mark = None
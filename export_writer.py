@@ -0,0 +1,180 @@
+import json
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+from config import Config
+from content_processor import ContentProcessor
+
+def cdata(text):
+    """Wrap text in CDATA, splitting any ]]> it contains"""
+    return '<![CDATA[' + (text or '').replace(']]>', ']]]]><![CDATA[>') + ']]>'
+
+def term_slug(name):
+    """Slug the way WordPress sanitize_title builds it for non-ASCII names"""
+    slug = '-'.join(name.lower().split())
+    return quote(slug, safe='-').lower()
+
+class NdjsonWriter:
+    """Writes one ProcessedMessage per line as JSON"""
+
+    def __init__(self, output_path):
+        self.file = open(output_path, 'w', encoding='utf-8')
+
+    def write(self, post):
+        self.file.write(json.dumps(post.to_dict(), ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class WxrWriter:
+    """Streams posts into a WordPress eXtended RSS file for `wp import`.
+
+    If media_base_url is given, every photo, video, audio and file of a post
+    becomes an attachment item pointing at media_base_url + media_path()
+    (upload the export's media directories there first), and the post gets
+    the same featured image and gallery/media blocks as a live import.
+    Otherwise the paths are only kept in _telegram_photo (the featured photo)
+    and _telegram_attachment post meta.
+    """
+
+    def __init__(self, output_path, media_base_url=None):
+        self.file = open(output_path, 'w', encoding='utf-8')
+        self.media_base_url = media_base_url.rstrip('/') + '/' if media_base_url else None
+        # Item IDs are only hints for the WordPress importer, which remaps them
+        self.next_item_id = 1
+        site_url = escape(Config.WORDPRESS_URL)
+
+        self.file.write(
+            '<?xml version="1.0" encoding="UTF-8" ?>\n'
+            '<rss version="2.0"\n'
+            '\txmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"\n'
+            '\txmlns:content="http://purl.org/rss/1.0/modules/content/"\n'
+            '\txmlns:wfw="http://wellformedweb.org/CommentAPI/"\n'
+            '\txmlns:dc="http://purl.org/dc/elements/1.1/"\n'
+            '\txmlns:wp="http://wordpress.org/export/1.2/"\n'
+            '>\n'
+            '<channel>\n'
+            f'\t<title>{escape(os.path.basename(Config.EXPORT_DIR.rstrip("/")))}</title>\n'
+            f'\t<link>{site_url}</link>\n'
+            '\t<wp:wxr_version>1.2</wp:wxr_version>\n'
+            f'\t<wp:base_site_url>{site_url}</wp:base_site_url>\n'
+            f'\t<wp:base_blog_url>{site_url}</wp:base_blog_url>\n'
+            f'\t<wp:author><wp:author_login>{cdata(Config.WORDPRESS_USERNAME)}</wp:author_login></wp:author>\n'
+        )
+
+    @staticmethod
+    def _dates(date):
+        """Return (local, gmt) WXR date strings for an ISO date"""
+        if not date:
+            return '', ''
+        dt = datetime.fromisoformat(date)
+        local = dt.strftime('%Y-%m-%d %H:%M:%S')
+        if dt.tzinfo is None:
+            return local, ''
+        return local, dt.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    def _item(self, item_id, post_type, title, content, date, extra='', parent_id=0, status=None):
+        post_date, post_date_gmt = self._dates(date)
+        self.file.write(
+            '\t<item>\n'
+            f'\t\t<title>{cdata(title)}</title>\n'
+            f'\t\t<dc:creator>{cdata(Config.WORDPRESS_USERNAME)}</dc:creator>\n'
+            f'\t\t<content:encoded>{cdata(content)}</content:encoded>\n'
+            f'\t\t<excerpt:encoded>{cdata("")}</excerpt:encoded>\n'
+            f'\t\t<wp:post_id>{item_id}</wp:post_id>\n'
+            f'\t\t<wp:post_date>{cdata(post_date)}</wp:post_date>\n'
+            f'\t\t<wp:post_date_gmt>{cdata(post_date_gmt)}</wp:post_date_gmt>\n'
+            f'\t\t<wp:status>{cdata(status or Config.DEFAULT_STATUS)}</wp:status>\n'
+            f'\t\t<wp:post_parent>{parent_id}</wp:post_parent>\n'
+            f'\t\t<wp:post_type>{cdata(post_type)}</wp:post_type>\n'
+            f'{extra}'
+            '\t</item>\n'
+        )
+
+    @staticmethod
+    def _meta(key, value):
+        return (f'\t\t<wp:postmeta><wp:meta_key>{cdata(key)}</wp:meta_key>'
+                f'<wp:meta_value>{cdata(str(value))}</wp:meta_value></wp:postmeta>\n')
+
+    @staticmethod
+    def media_path(path):
+        """URL path of an attachment below media_base_url: photos by file name, other files as in the export"""
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(Config.PHOTOS_DIR):
+            return os.path.basename(path)
+        return os.path.relpath(path, Config.EXPORT_DIR).replace(os.sep, '/')
+
+    def write(self, post):
+        post_id = self.next_item_id
+        self.next_item_id += 1
+
+        extra = ''.join(
+            f'\t\t<category domain="category" nicename="{term_slug(name)}">{cdata(name)}</category>\n'
+            for name in post.categories
+        )
+        extra += ''.join(
+            f'\t\t<category domain="post_tag" nicename="{term_slug(name)}">{cdata(name)}</category>\n'
+            for name in post.tags
+        )
+        extra += self._meta('_telegram_message_id', post.id)
+
+        photo_path = post.photo_path
+        attachments = post.attachments or ()
+        if photo_path:
+            extra += self._meta('_telegram_photo', os.path.relpath(photo_path, Config.EXPORT_DIR))
+
+        content = post.content
+        media = []
+        if self.media_base_url:
+            # Attachment items get the IDs after the post, in the order of the attachments
+            for attachment in attachments:
+                url = self.media_base_url + quote(self.media_path(attachment['path']))
+                media.append({'id': self.next_item_id, 'source_url': url})
+                self.next_item_id += 1
+                if attachment['path'] == photo_path:
+                    extra += self._meta('_thumbnail_id', media[-1]['id'])
+            media_blocks = ContentProcessor.render_attachments(attachments, media)
+            if media_blocks:
+                content = f"{content}\n\n{media_blocks}"
+        else:
+            for attachment in attachments:
+                if attachment['path'] != photo_path:
+                    extra += self._meta('_telegram_attachment', os.path.relpath(attachment['path'], Config.EXPORT_DIR))
+
+        self._item(post_id, 'post', post.title, content, post.date, extra)
+
+        for attachment, item in zip(attachments, media):
+            self._item(
+                item['id'], 'attachment', os.path.basename(attachment['path']), '', post.date,
+                f'\t\t<wp:attachment_url>{cdata(item["source_url"])}</wp:attachment_url>\n',
+                parent_id=post_id,
+                status='inherit'
+            )
+
+    def close(self):
+        self.file.write('</channel>\n</rss>\n')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_writer(output_path, output_format=None, media_base_url=None):
+    """Open a dry-run writer; the format defaults to WXR for .xml/.wxr files, NDJSON otherwise"""
+    if output_format is None:
+        extension = os.path.splitext(output_path)[1].lower()
+        output_format = 'wxr' if extension in ('.xml', '.wxr') else 'ndjson'
+
+    if output_format == 'wxr':
+        return WxrWriter(output_path, media_base_url)
+    if output_format == 'ndjson':
+        return NdjsonWriter(output_path)
+    raise ValueError(f"Unknown dry-run format: {output_format}")
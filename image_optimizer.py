@@ -0,0 +1,119 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+FORMAT_EXTENSIONS = {
+    'WEBP': '.webp',
+    'JPEG': '.jpg',
+}
+
+def optimize_image(source_path, output_dir, max_dimension, quality, image_format):
+    """Downscale, strip metadata and re-encode one image.
+
+    Runs in a worker process. Returns (upload path, original size, new size);
+    the original file is returned unchanged if re-encoding does not make it
+    smaller.
+    """
+    from PIL import Image, ImageOps
+
+    original_size = os.path.getsize(source_path)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    # The settings are part of the name, so changing them never reuses outputs made with others
+    settings = f"{max_dimension or 'full'}q{quality}"
+    output_path = os.path.join(output_dir, f"{stem}-{settings}{FORMAT_EXTENSIONS[image_format]}")
+
+    # Reuse output of an earlier run
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(source_path):
+        return output_path, original_size, os.path.getsize(output_path)
+
+    with Image.open(source_path) as image:
+        # Bake EXIF orientation into pixels, since EXIF is dropped on save
+        image = ImageOps.exif_transpose(image)
+        if max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        os.makedirs(output_dir, exist_ok=True)
+        tmp_path = output_path + '.tmp'
+        image.save(tmp_path, format=image_format, quality=quality, optimize=True)
+
+    new_size = os.path.getsize(tmp_path)
+    if new_size >= original_size:
+        os.remove(tmp_path)
+        return source_path, original_size, original_size
+
+    os.replace(tmp_path, output_path)
+    return output_path, original_size, new_size
+
+class ImageOptimizer:
+    """Pre-upload image downscaling on a process pool.
+
+    submit() starts work in the background as soon as a message is processed;
+    optimize() later waits for the result from the upload thread.
+    """
+
+    def __init__(self, output_dir, max_dimension, quality=82, image_format='WEBP', workers=None):
+        image_format = image_format.upper()
+        if image_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+
+        self.output_dir = output_dir
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.image_format = image_format
+        self.executor = ProcessPoolExecutor(max_workers=workers or None)
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.count = 0
+        self.original_bytes = 0
+        self.optimized_bytes = 0
+
+    def submit(self, source_path):
+        """Start optimizing an image in the background"""
+        with self.lock:
+            future = self.futures.get(source_path)
+            if future is None:
+                future = self.executor.submit(
+                    optimize_image, source_path, self.output_dir,
+                    self.max_dimension, self.quality, self.image_format
+                )
+                self.futures[source_path] = future
+            return future
+
+    def optimize(self, source_path):
+        """Return the path to upload for an image, falling back to the original on error"""
+        future = self.submit(source_path)
+        try:
+            output_path, original_size, new_size = future.result()
+        except Exception as e:
+            print(f"Error optimizing image {source_path}: {e}")
+            return source_path
+        finally:
+            with self.lock:
+                self.futures.pop(source_path, None)
+
+        with self.lock:
+            self.count += 1
+            self.original_bytes += original_size
+            self.optimized_bytes += new_size
+        return output_path
+
+    def discard(self, source_path):
+        """Forget an image that will not be uploaded after all, cancelling it if not started yet"""
+        with self.lock:
+            future = self.futures.pop(source_path, None)
+        if future:
+            future.cancel()
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - self.optimized_bytes
+
+    def __str__(self):
+        mb = 1024 * 1024
+        return (f"{self.count} images, {self.original_bytes / mb:.1f} MB -> "
+                f"{self.optimized_bytes / mb:.1f} MB (saved {self.bytes_saved / mb:.1f} MB)")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+STATUS_MEDIA = 'media'  # Photo uploaded, post not created yet
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Columns added after the first release, created on open if missing
+_EXTRA_COLUMNS = {
+    'content_hash': 'TEXT',
+    'edited': 'TEXT',
+    'message_date': 'TEXT',
+    'signature': 'BLOB',
+}
+_ROW_KEYS = ('message_id', 'post_id', 'media_id', 'status', 'error', 'updated_at',
+             'content_hash', 'edited', 'message_date', 'signature')
+
+def message_hash(message):
+    """Hash the parts of a Telegram message that end up in its post"""
+    content = [message.get('text'), message.get('photo'), message.get('file')]
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+def message_edited(message):
+    """Return the message's last edit time, or None if it was never edited"""
+    return message.get('edited_unixtime') or message.get('edited')
+
+class ImportState:
+    """Persistent Telegram message id -> WordPress post mapping stored in SQLite.
+
+    Every write is its own transaction, so a crash mid-import never loses a
+    post that WordPress already created. Finished message ids are kept in a
+    set, making the "already imported?" check O(1) and free of API calls.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    message_id INTEGER PRIMARY KEY,
+                    post_id INTEGER,
+                    media_id INTEGER,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS sync_mark (key TEXT PRIMARY KEY, value TEXT)')
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(messages)')}
+            for column, column_type in _EXTRA_COLUMNS.items():
+                if column not in columns:
+                    try:
+                        self.conn.execute(f'ALTER TABLE messages ADD COLUMN {column} {column_type}')
+                    except sqlite3.OperationalError as e:
+                        # Another worker opening the same state added it first
+                        if 'duplicate column' not in str(e):
+                            raise
+
+        self.done_ids = {
+            row[0] for row in
+            self.conn.execute('SELECT message_id FROM messages WHERE status = ?', (STATUS_DONE,))
+        }
+
+    def is_done(self, message_id):
+        """Check whether a message already has a WordPress post"""
+        return message_id in self.done_ids
+
+    def get(self, message_id):
+        """Return the stored row for a message as a dict, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                f'SELECT {", ".join(_ROW_KEYS)} FROM messages WHERE message_id = ?',
+                (message_id,)
+            ).fetchone()
+
+        if not row:
+            return None
+        return dict(zip(_ROW_KEYS, row))
+
+    def get_media_id(self, message_id):
+        """Return the media ID uploaded for a message by an earlier run, if any"""
+        row = self.get(message_id)
+        return row['media_id'] if row else None
+
+    def _upsert(self, message_id, status, post_id=None, media_id=None, error=None, message=None,
+                signature=None):
+        updated_at = datetime.now(timezone.utc).isoformat()
+        content_hash = edited = message_date = None
+        if message is not None:
+            content_hash = message_hash(message)
+            edited = message_edited(message)
+            message_date = message.get('date')
+
+        with self.lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO messages (message_id, post_id, media_id, status, error, updated_at,
+                                      content_hash, edited, message_date, signature)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(message_id) DO UPDATE SET
+                    post_id = COALESCE(excluded.post_id, post_id),
+                    media_id = COALESCE(excluded.media_id, media_id),
+                    status = excluded.status,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at,
+                    content_hash = COALESCE(excluded.content_hash, content_hash),
+                    edited = COALESCE(excluded.edited, edited),
+                    message_date = COALESCE(excluded.message_date, message_date),
+                    signature = COALESCE(excluded.signature, signature)
+            """, (message_id, post_id, media_id, status, error, updated_at,
+                  content_hash, edited, message_date, signature))
+
+    def record_media(self, message_id, media_id):
+        """Remember an uploaded photo so a retry does not upload it again"""
+        self._upsert(message_id, STATUS_MEDIA, media_id=media_id)
+
+    def record_post(self, message_id, post_id, media_id=None, message=None, signature=None):
+        """Mark a message as imported; pass the Telegram message to remember its content hash
+
+        signature is the near-duplicate fingerprint of the message text, if any.
+        """
+        self._upsert(message_id, STATUS_DONE, post_id=post_id, media_id=media_id, message=message,
+                     signature=signature)
+        self.done_ids.add(message_id)
+
+    def iter_signatures(self):
+        """Yield (message_id, signature) of every imported message with a near-duplicate fingerprint"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT message_id, signature FROM messages WHERE status = ? AND signature IS NOT NULL',
+                (STATUS_DONE,)
+            ).fetchall()
+        for message_id, signature in rows:
+            yield message_id, bytes(signature)
+
+    def get_sync_mark(self):
+        """Return (message_id, date) of the last message covered by a finished sync, or (None, None)"""
+        with self.lock:
+            mark = dict(self.conn.execute('SELECT key, value FROM sync_mark'))
+        if 'message_id' not in mark:
+            return None, None
+        return int(mark['message_id']), mark.get('date')
+
+    def set_sync_mark(self, message_id, date):
+        """Advance the high-water mark once every message up to message_id was handled"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO sync_mark (key, value) VALUES (?, ?)',
+                [('message_id', str(message_id)), ('date', date or '')]
+            )
+
+    def record_failure(self, message_id, error):
+        """Keep the last error for a message; it will be retried on the next run"""
+        self._upsert(message_id, STATUS_FAILED, error=str(error))
+
+    def counts(self):
+        """Return number of messages per status"""
+        with self.lock:
+            return dict(self.conn.execute('SELECT status, COUNT(*) FROM messages GROUP BY status'))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# Uploaded media get this slug prefix so the cache can be rebuilt from WordPress
+SLUG_PREFIX = 'tg-media-'
+_SLUG_HASH = re.compile(rf'^{SLUG_PREFIX}([0-9a-f]{{64}})')
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, reading it in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def media_slug(content_hash):
+    """Slug for an uploaded file that encodes its content hash"""
+    return f"{SLUG_PREFIX}{content_hash}"
+
+def site_key(url):
+    """Normalized site URL the cached media IDs belong to"""
+    return url.strip().rstrip('/').lower()
+
+class MediaCache:
+    """Persistent content hash -> WordPress media ID cache stored in SQLite
+
+    Entries are kept per site, so one cache file serves staging and
+    production without handing out media IDs of the other site.
+    """
+
+    def __init__(self, db_path, site):
+        self.db_path = db_path
+        self.site = site_key(site)
+        self.lock = threading.Lock()
+        # One lock per hash so concurrent posts never upload the same file twice
+        self.upload_locks = {}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(media)')}
+            if columns and 'site' not in columns:
+                # Caches from before per-site entries cannot tell which site their IDs belong to;
+                # the empty cache is rebuilt from the site's media library instead
+                self.conn.execute('DROP TABLE media')
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS media (
+                    site TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    media_id INTEGER NOT NULL,
+                    source_url TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (site, hash)
+                )
+            """)
+
+        self.entries = {}
+        self.urls = {}
+        rows = self.conn.execute('SELECT hash, media_id, source_url FROM media WHERE site = ?', (self.site,))
+        for content_hash, media_id, source_url in rows:
+            self.entries[content_hash] = media_id
+            self.urls[content_hash] = source_url
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, content_hash):
+        """Return the media ID for a content hash, or None"""
+        return self.entries.get(content_hash)
+
+    def get_url(self, content_hash):
+        """Return the source URL recorded for a content hash, or None"""
+        return self.urls.get(content_hash)
+
+    def upload_lock(self, content_hash):
+        """Return the lock serializing uploads of one file content"""
+        with self.lock:
+            return self.upload_locks.setdefault(content_hash, threading.Lock())
+
+    def add(self, content_hash, media_id, source_url=None):
+        """Remember an uploaded file"""
+        updated_at = datetime.now(timezone.utc).isoformat()
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO media (site, hash, media_id, source_url, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (self.site, content_hash, media_id, source_url, updated_at)
+            )
+            self.entries[content_hash] = media_id
+            self.urls[content_hash] = source_url
+
+    def rebuild(self, wp_api, photos_dir=None):
+        """Repopulate the cache from the WordPress media library.
+
+        Media uploaded by this importer carry their content hash in the slug.
+        Older uploads are matched by file name against photos_dir and hashed
+        locally. Returns the number of entries added.
+        """
+        local_files = {}
+        if photos_dir and os.path.isdir(photos_dir):
+            local_files = {os.path.splitext(name)[0].lower(): name for name in os.listdir(photos_dir)}
+
+        added = 0
+        for media in wp_api.get_media_library():
+            match = _SLUG_HASH.match(media.get('slug') or '')
+            if match:
+                content_hash = match.group(1)
+            else:
+                # WordPress may append -1, -scaled etc. to the stored file name
+                source_name = os.path.basename(media.get('source_url') or '')
+                stem = os.path.splitext(source_name)[0].lower()
+                local_name = local_files.get(stem) or local_files.get(re.sub(r'-(\d+|scaled)$', '', stem))
+                if not local_name:
+                    continue
+                content_hash = file_hash(os.path.join(photos_dir, local_name))
+
+            if content_hash not in self.entries:
+                self.add(content_hash, media['id'], media.get('source_url'))
+                added += 1
+
+        return added
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,190 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+PROMETHEUS_PREFIX = 'tg2wp_'
+
+class Histogram:
+    """Fixed-bucket latency histogram with constant memory"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, bucket_count in zip(BUCKETS, self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_s': round(self.sum, 6),
+            'mean_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p90_ms': round(self.quantile(0.9) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+class Metrics:
+    """Thread-safe counters and latency histograms for one import run.
+
+    Series are identified by a name plus labels, e.g.
+    observe('stage_seconds', 0.2, stage='upload_photo').
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a block as one observation of stage_seconds{stage=...}"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, stage=stage)
+
+    def report(self):
+        """Return all series as a JSON-serializable dict"""
+        with self.lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                dict({'name': name, 'labels': dict(labels)}, **histogram.to_dict())
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ]
+        return {
+            'started': self.started,
+            'elapsed_s': round(time.time() - self.started, 3),
+            'counters': counters,
+            'histograms': histograms,
+        }
+
+    def to_prometheus(self):
+        """Render all series in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{PROMETHEUS_PREFIX}{name}{_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, histogram.counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{PROMETHEUS_PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{PROMETHEUS_PREFIX}{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{PROMETHEUS_PREFIX}{name}_count{_labels(labels)} {histogram.count}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write the report as Prometheus text for .prom/.txt files, JSON otherwise"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith(('.prom', '.txt')):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.report(), f, indent=2, ensure_ascii=False)
+
+    def summary(self, name='stage_seconds'):
+        """One line per series of a histogram, for the end-of-run printout"""
+        lines = []
+        with self.lock:
+            for (series, labels), histogram in sorted(self.histograms.items()):
+                if series != name:
+                    continue
+                label = ','.join(value for _, value in labels)
+                lines.append(f"  {label:<22} {histogram.count:>7}  total {histogram.sum:8.1f}s  "
+                             f"p50 {histogram.quantile(0.5) * 1000:8.1f}ms  p99 {histogram.quantile(0.99) * 1000:8.1f}ms")
+        return lines
+
+def _label_value(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels) + '}'
+
+class ProgressLine:
+    """Single self-overwriting progress line with rate and ETA on stderr"""
+
+    def __init__(self, interval=1.0, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.started = time.monotonic()
+        self.last_update = 0.0
+
+    def update(self, done, fraction=None, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_update < self.interval:
+            return
+        self.last_update = now
+
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = f"{done} messages, {rate:.1f}/s"
+        if fraction:
+            remaining = elapsed * (1 - fraction) / fraction
+            line += f", {fraction * 100:.1f}%, ETA {_format_duration(remaining)}"
+        self.stream.write('\r' + line.ljust(60))
+        self.stream.flush()
+
+    def finish(self, done, fraction=None):
+        self.update(done, fraction, force=True)
+        self.stream.write('\n')
+        self.stream.flush()
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,73 @@
+import mimetypes
+import os
+import uuid
+
+_HEAD, _FILE, _TAIL, _DONE = range(4)
+
+class MultipartStream:
+    """multipart/form-data body that reads its file lazily, chunk by chunk.
+
+    requests sends file-like bodies block by block with the Content-Length
+    taken from __len__, so memory use stays flat whatever the file size.
+    progress(sent, total) is called after every block read.
+    """
+
+    def __init__(self, file_path, fields=None, field_name='file', progress=None):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+
+        filename = os.path.basename(file_path).replace('"', '%22').replace('\r', '').replace('\n', '')
+        mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in (fields or {}).items()
+        )
+        head += (f'--{boundary}\r\n'
+                 f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+                 f'Content-Type: {mime_type}\r\n\r\n')
+        self.parts = [head.encode(), None, f'\r\n--{boundary}--\r\n'.encode()]
+
+        self.file = open(file_path, 'rb')
+        self.length = len(self.parts[_HEAD]) + os.fstat(self.file.fileno()).st_size + len(self.parts[_TAIL])
+        self.progress = progress
+        self.sent = 0
+        self._part = _HEAD
+        self._offset = 0
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+
+        out = bytearray()
+        while len(out) < size and self._part != _DONE:
+            if self._part == _FILE:
+                chunk = self.file.read(size - len(out))
+                if not chunk:
+                    self._part = _TAIL
+                    continue
+            else:
+                data = self.parts[self._part]
+                chunk = data[self._offset:self._offset + size - len(out)]
+                self._offset += len(chunk)
+                if self._offset >= len(data):
+                    self._part += 1
+                    self._offset = 0
+            out += chunk
+
+        self.sent += len(out)
+        if self.progress and out:
+            self.progress(self.sent, self.length)
+        return bytes(out)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
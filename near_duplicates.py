@@ -0,0 +1,126 @@
+import re
+from array import array
+from operator import eq
+from zlib import crc32
+
+_TAG = re.compile(r'<[^>]+>')
+_WORD = re.compile(r'\w+')
+
+# MinHash values per message; only the lowest byte of each is kept (b-bit MinHash)
+SIGNATURE_SIZE = 32
+_BIN_SHIFT = 64 - 5  # top 5 bits of a feature hash pick one of the 32 bins
+_EMPTY = 1 << 64
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+def words(text):
+    """Lowercase words of text with HTML tags removed"""
+    return _WORD.findall(_TAG.sub(' ', text).lower())
+
+def signature(tokens, shingle=2):
+    """b-bit MinHash signature (SIGNATURE_SIZE bytes) of the word shingles of tokens
+
+    One-permutation MinHash: every shingle is hashed once into one of the
+    bins, which keep their minimum; empty bins borrow the next filled one.
+    """
+    if len(tokens) > shingle:
+        features = {' '.join(tokens[i:i + shingle]) for i in range(len(tokens) - shingle + 1)}
+    else:
+        features = {' '.join(tokens)}
+
+    mins = [_EMPTY] * SIGNATURE_SIZE
+    for feature in features:
+        value = crc32(feature.encode()) * _GOLDEN & _MASK64
+        index = value >> _BIN_SHIFT
+        if value < mins[index]:
+            mins[index] = value
+
+    result = bytearray(SIGNATURE_SIZE)
+    for index in range(SIGNATURE_SIZE):
+        offset = 0
+        while mins[(index + offset) % SIGNATURE_SIZE] == _EMPTY:
+            offset += 1
+        result[index] = (mins[(index + offset) % SIGNATURE_SIZE] + offset * 0x5BD1E995) & 0xFF
+    return bytes(result)
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    matches = sum(map(eq, a, b)) / len(a)
+    # Unrelated one-byte values still agree 1 time in 256
+    return max(0.0, (matches - 1 / 256) / (1 - 1 / 256))
+
+class DuplicateIndex:
+    """Near-duplicate lookup over MinHash signatures with LSH banding
+
+    A signature is cut into bands of consecutive bytes; messages whose
+    signatures agree on a whole band become candidates and are then
+    compared on the full signature. With 8 bands of 4 values, pairs of 0.8
+    similarity almost always meet, while unrelated messages rarely share a
+    bucket, so a lookup checks a handful of entries whatever the index size.
+
+    Everything lives in flat arrays: signatures in one bytearray, and per
+    band a bucket table of chain heads plus one chain link per entry, about
+    72 bytes per message. Chains run newest first and a lookup walks at
+    most max_chain entries of each, bounding its cost even when shingles
+    common to many messages crowd a bucket.
+    """
+
+    def __init__(self, threshold=0.6, bands=8, bucket_bits=16, max_chain=32):
+        if SIGNATURE_SIZE % bands:
+            raise ValueError(f"bands must divide {SIGNATURE_SIZE}")
+        self.threshold = threshold
+        self.rows = SIGNATURE_SIZE // bands
+        self.bucket_bits = bucket_bits
+        self.bucket_mask = (1 << bucket_bits) - 1
+        self.max_chain = max_chain
+        self.signatures = bytearray()
+        self.keys = array('q')
+        self.heads = [array('i', [-1]) * (1 << bucket_bits) for _ in range(bands)]
+        self.links = [array('i') for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _bucket(self, band_value):
+        value = int.from_bytes(band_value, 'little')
+        bucket = 0
+        while value:
+            bucket ^= value & self.bucket_mask
+            value >>= self.bucket_bits
+        return bucket
+
+    def find(self, sig):
+        """Return (key, similarity) of the most similar indexed signature at or above threshold, or None"""
+        signatures, rows = self.signatures, self.rows
+        best = None
+        best_similarity = self.threshold
+        seen = set()
+        for band, (heads, links) in enumerate(zip(self.heads, self.links)):
+            start = band * rows
+            band_value = sig[start:start + rows]
+            entry = heads[self._bucket(band_value)]
+            walked = 0
+            while entry != -1 and walked < self.max_chain:
+                walked += 1
+                offset = entry * SIGNATURE_SIZE
+                # Buckets are shared by different band values; check the band before the signature
+                if entry not in seen and signatures[offset + start:offset + start + rows] == band_value:
+                    seen.add(entry)
+                    score = similarity(signatures[offset:offset + SIGNATURE_SIZE], sig)
+                    if score >= best_similarity:
+                        best, best_similarity = entry, score
+                entry = links[entry]
+        if best is None:
+            return None
+        return self.keys[best], best_similarity
+
+    def add(self, key, sig):
+        """Index a signature under key (e.g. the message that owns the post)"""
+        entry = len(self.keys)
+        self.signatures += sig
+        self.keys.append(key)
+        rows = self.rows
+        for band, (heads, links) in enumerate(zip(self.heads, self.links)):
+            bucket = self._bucket(sig[band * rows:(band + 1) * rows])
+            links.append(heads[bucket])
+            heads[bucket] = entry
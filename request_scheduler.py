@@ -0,0 +1,188 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import NewConnectionError
+from config import Config
+
+# Statuses worth retrying: throttled, or the host/proxy is temporarily overloaded
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Of those, the ones where the server turned the request away without acting on it
+REJECTED_STATUSES = {429, 503}
+# Never wait longer than this for a single Retry-After
+MAX_RETRY_AFTER = 300
+
+def parse_retry_after(value):
+    """Return seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+def request_not_sent(error):
+    """Whether a requests exception happened before the request reached the server"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        # Connection refused or host not found, wrapped in urllib3's MaxRetryError
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+class TokenBucket:
+    """Thread-safe token bucket; rate is requests per second, 0 disables limiting"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hold back every caller, e.g. while the server asks us to back off"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight requests driven by latency and errors.
+
+    The limit grows by about one per round trip while responses stay under
+    target_latency, shrinks gently when they get slower and is halved on
+    throttling, server errors or timeouts.
+    """
+
+    def __init__(self, maximum, minimum=1, target_latency=2.0):
+        self.maximum = max(maximum, minimum)
+        self.minimum = minimum
+        self.target_latency = target_latency
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, overloaded=False):
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif self.target_latency and latency > self.target_latency:
+                self.limit = max(self.minimum, self.limit * 0.9)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+class RequestScheduler:
+    """Runs HTTP calls with rate limiting, adaptive concurrency and retries.
+
+    Throttled (429), 5xx gateway/server errors, connection errors and
+    timeouts are retried with exponential backoff and full jitter, honoring
+    Retry-After. Other responses are returned as is.
+
+    Calls that are not idempotent (creating posts or media) may already have
+    been carried out when a 500/502/504 or a timeout comes back, so they are
+    only retried on 429/503 and on connection failures before sending.
+    """
+
+    def __init__(self, max_retries=5, backoff_base=1.0, backoff_max=60.0, timeout=30.0,
+                 rate=0.0, burst=10, max_concurrency=10, target_latency=2.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(max_concurrency, target_latency=target_latency)
+        self.lock = threading.Lock()
+        self.retries = 0
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            max_retries=Config.HTTP_MAX_RETRIES,
+            backoff_base=Config.HTTP_BACKOFF_BASE,
+            backoff_max=Config.HTTP_BACKOFF_MAX,
+            timeout=Config.HTTP_TIMEOUT,
+            rate=Config.HTTP_RATE_LIMIT,
+            burst=Config.HTTP_RATE_BURST,
+            max_concurrency=Config.HTTP_MAX_CONCURRENCY or Config.HTTP_POOL_SIZE,
+            target_latency=Config.HTTP_TARGET_LATENCY
+        )
+
+    def backoff(self, attempt):
+        """Full-jitter exponential delay before retry number attempt + 1"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def call(self, send, timeout=None, idempotent=True):
+        """Call send(timeout=...) until it returns a non-retryable response"""
+        if timeout is None:
+            timeout = self.timeout
+        retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = send(timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.limiter.release(time.monotonic() - started, overloaded=True)
+                if attempt == self.max_retries or not (idempotent or request_not_sent(e)):
+                    raise
+                print(f"Request failed ({e.__class__.__name__}), retrying")
+                retry_after = None
+            except Exception:
+                self.limiter.release(time.monotonic() - started)
+                raise
+            else:
+                overloaded = response.status_code in RETRY_STATUSES
+                self.limiter.release(time.monotonic() - started, overloaded=overloaded)
+                if response.status_code not in retry_statuses or attempt == self.max_retries:
+                    return response
+                print(f"Request returned {response.status_code}, retrying")
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            with self.lock:
+                self.retries += 1
+
+            if retry_after is not None:
+                # Everyone waits in bucket.acquire(), not just this thread
+                self.bucket.pause(min(retry_after, MAX_RETRY_AFTER))
+            else:
+                time.sleep(self.backoff(attempt))
+
+    def __str__(self):
+        return f"{self.retries} retries, concurrency limit {int(self.limiter.limit)}/{self.limiter.maximum}"
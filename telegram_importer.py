@@ -3,45 +3,58 @@
 Main script for the Telegram to WordPress importer.
 This script can work without a virtual environment.
 """
+import argparse
 import json
 import os
+import re
+import shlex
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from wordpress_api import WordPressAPI
+from export_reader import ExportIndex, ExportReader, parse_export_date, read_chat_id
+from import_state import STATUS_DONE, ImportState, message_edited, message_hash
+from media_cache import MediaCache, file_hash, media_slug
+from metrics import Metrics, ProgressLine
+from near_duplicates import DuplicateIndex, signature, words
+from work_queue import open_queue, worker_name
 from content_processor import ContentProcessor
 from config import Config
 
-def check_dependencies():
-    """Check if required dependencies are available"""
-    missing_deps = []
+# Marks the end of a message stream in _timed_messages
+_END = object()
+# Telegram exports start every message object with its id
+_MESSAGE_ID = re.compile(rb'\{\s*"id"\s*:\s*(-?\d+)')
 
-    try:
-        import requests
-        print("✓ requests module available")
-    except ImportError:
-        missing_deps.append("requests")
-        print("✗ requests module missing")
+# DUPLICATE_POLICY values that turn on near-duplicate detection
+DUPLICATE_POLICIES = ('skip', 'merge', 'update')
 
-    try:
-        import dateutil
-        print("✓ python-dateutil module available")
-    except ImportError:
-        missing_deps.append("python-dateutil")
-        print("✗ python-dateutil module missing")
+# Subcommands; anything else on the command line is the legacy import syntax
+COMMANDS = ('import', 'sync', 'dry-run', 'publish', 'work', 'bench')
 
-    try:
-        import PIL
-        print("✓ Pillow module available")
-    except ImportError:
-        missing_deps.append("Pillow")
-        print("✗ Pillow module missing")
+def required_modules(command):
+    """Third-party modules a command needs, as (import name, pip package) pairs"""
+    if command in ('dry-run', 'publish'):
+        return []
+    modules = [('requests', 'requests')]
+    if command == 'bench' or Config.IMAGE_MAX_DIMENSION > 0:
+        modules.append(('PIL', 'Pillow'))
+    return modules
 
-    try:
-        import dotenv
-        print("✓ python-dotenv module available")
-    except ImportError:
-        missing_deps.append("python-dotenv")
-        print("✗ python-dotenv module missing")
+def check_dependencies(command='import'):
+    """Check if the dependencies of a command are available, without importing them"""
+    from importlib.util import find_spec
+
+    missing_deps = []
+    for module, package in required_modules(command):
+        if find_spec(module) is None:
+            missing_deps.append(package)
+            print(f"✗ {package} module missing")
+        else:
+            print(f"✓ {package} module available")
 
     if missing_deps:
         print(f"\nMissing dependencies: {', '.join(missing_deps)}")
@@ -56,242 +69,1342 @@ def check_dependencies():
 
 class TelegramImporter:
     def __init__(self):
-        self.wp_api = WordPressAPI()
+        # Per-stage timings and HTTP counters shared with the API client
+        self.metrics = Metrics()
+        # WordPress client; created on first use so offline commands never import requests
+        self._wp_api = None
+        self.wp_api_lock = threading.Lock()
         self.processor = ContentProcessor()
         self.categories_cache = {}
         self.tags_cache = {}
+        # Guard term lookups/creation when posts are created from worker threads
+        self.categories_lock = threading.Lock()
+        self.tags_lock = threading.Lock()
+        # Message id -> post mapping; opened by run() or open_state()
+        self.state = None
+        # Content hash -> media ID; opened by run() or open_media_cache()
+        self.media_cache = None
+        # Optional pre-upload downscaling; started by run() or start_image_optimizer()
+        self.image_optimizer = None
+        # Reader behind the current iter_export_data() stream, used for progress
+        self.export_reader = None
+        # Byte offsets of the export's messages; opened by select_messages() to seek instead of parsing
+        self.export_index = None
+        # Near-duplicate fingerprints of imported messages; opened by open_resources() per DUPLICATE_POLICY
+        self.duplicates = None
+        # Message id -> post ID for duplicate lookups when no import state is kept
+        self.duplicate_posts = {}
+        # Shared queue of message ranges and this process's name in it; opened by work()
+        self.work_queue = None
+        self.worker_id = None
+        # Range this worker imports, and message id -> post ID created for it by any lease
+        self.lease = None
+        self.range_posts = {}
+        # Uploads the attachments of one post in parallel; started on first use
+        self.media_executor = None
+        self.media_executor_lock = threading.Lock()
 
-    def load_export_data(self):
-        """Load Telegram export data from JSON file"""
+    @property
+    def wp_api(self):
+        if self._wp_api is None:
+            with self.wp_api_lock:
+                if self._wp_api is None:
+                    from wordpress_api import WordPressAPI
+                    self._wp_api = WordPressAPI(self.metrics)
+        return self._wp_api
+
+    def get_export_file(self):
+        """Return path to result.json, failing early if it is missing"""
         export_file = os.path.join(Config.EXPORT_DIR, 'result.json')
 
         if not os.path.exists(export_file):
             raise FileNotFoundError(f"Export file not found: {export_file}")
 
-        with open(export_file, 'r', encoding='utf-8') as f:
+        return export_file
+
+    def load_export_data(self):
+        """Load Telegram export data from JSON file"""
+        export_file = self.get_export_file()
+
+        with self.metrics.timer('load_export'), open(export_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
 
         return data.get('messages', [])
 
-    def ensure_categories_exist(self, category_names):
-        """Ensure all categories exist in WordPress"""
-        if not category_names:
+    def open_state(self, state_path=None):
+        """Open the persistent import state stored next to the export"""
+        if state_path is None:
+            state_path = os.path.join(Config.EXPORT_DIR, Config.STATE_FILE)
+
+        self.state = ImportState(state_path)
+        return self.state
+
+    def open_media_cache(self, cache_path=None, rebuild=True):
+        """Open the media cache, rebuilding it from WordPress when it is empty"""
+        if cache_path is None:
+            cache_path = Config.MEDIA_CACHE_FILE
+
+        self.media_cache = MediaCache(cache_path, Config.WORDPRESS_URL)
+        if rebuild and not len(self.media_cache):
+            try:
+                added = self.media_cache.rebuild(self.wp_api, Config.PHOTOS_DIR)
+                print(f"Rebuilt media cache from WordPress: {added} files")
+            except Exception as e:
+                print(f"Error rebuilding media cache: {e}")
+        return self.media_cache
+
+    def start_image_optimizer(self):
+        """Start the process pool that downscales photos before upload"""
+        from image_optimizer import ImageOptimizer
+
+        self.image_optimizer = ImageOptimizer(
+            os.path.join(Config.EXPORT_DIR, Config.IMAGE_OUTPUT_DIR),
+            Config.IMAGE_MAX_DIMENSION,
+            quality=Config.IMAGE_QUALITY,
+            image_format=Config.IMAGE_FORMAT,
+            workers=Config.IMAGE_WORKERS
+        )
+        return self.image_optimizer
+
+    def iter_export_data(self, start_index=0, stop_index=None):
+        """Stream Telegram export messages one at a time, from start_index up to stop_index"""
+        self.export_reader = ExportReader(self.get_export_file(), index=self.export_index)
+        return self.export_reader.iter_messages(start_index, stop_index)
+
+    def open_export_index(self):
+        """Load the sidecar offsets index of result.json, building it on first use or after the export changed"""
+        export_file = self.get_export_file()
+        index_file = None
+        if Config.EXPORT_INDEX_FILE:
+            index_file = os.path.join(Config.EXPORT_DIR, Config.EXPORT_INDEX_FILE)
+
+        with self.metrics.timer('index_export'):
+            self.export_index = ExportIndex.open(export_file, index_file)
+        if self.export_index.built:
+            print(f"Indexed {len(self.export_index)} messages of {export_file}")
+        return self.export_index
+
+    def select_messages(self, start_index=0, message_range=None):
+        """Export index range (start, stop) from start_index, narrowed to message_range
+
+        message_range holds ExportIndex.select() bounds (first_id, last_id,
+        since, until); the messages are then read through the export index.
+        """
+        index = self.open_export_index()
+        start, stop = index.select(start_index, **(message_range or {}))
+        if start < stop:
+            print(f"Reading messages {start}-{stop - 1} of {len(index)} through the export index")
+        else:
+            print("No messages in the selected range")
+        return start, stop
+
+    def _timed_messages(self, messages):
+        """Yield from a message stream, timing each read as the read_message stage"""
+        iterator = iter(messages)
+        while True:
+            with self.metrics.timer('read_message'):
+                message = next(iterator, _END)
+            if message is _END:
+                return
+            yield message
+
+    def load_taxonomy_cache(self):
+        """Fetch every existing category and tag once, across all pages"""
+        with self.categories_lock:
+            if not self.categories_cache:
+                existing_categories = self.wp_api.get_categories()
+                self.categories_cache.update({cat['name'].lower(): cat['id'] for cat in existing_categories})
+
+        with self.tags_lock:
+            if not self.tags_cache:
+                existing_tags = self.wp_api.get_tags()
+                self.tags_cache.update({tag['name'].lower(): tag['id'] for tag in existing_tags})
+
+    def collect_terms(self, messages):
+        """Return (categories, tags) that analyze_content assigns across messages"""
+        categories = {}
+        tags = {}
+        for processed_message in self.processor.process_messages(messages):
+            if not processed_message:
+                continue
+            for category in processed_message.categories:
+                categories.setdefault(category.lower(), category)
+            for tag in processed_message.tags:
+                tags.setdefault(tag.lower(), tag)
+
+        return list(categories.values()), list(tags.values())
+
+    def preload_taxonomy(self, messages):
+        """Create every term the export needs before any post is created"""
+        self.load_taxonomy_cache()
+        print(f"Loaded {len(self.categories_cache)} categories and {len(self.tags_cache)} tags")
+
+        categories, tags = self.collect_terms(messages)
+        missing_categories = [name for name in categories if name.lower() not in self.categories_cache]
+        missing_tags = [name for name in tags if name.lower() not in self.tags_cache]
+        print(f"Export needs {len(categories)} categories and {len(tags)} tags, "
+              f"creating {len(missing_categories)} + {len(missing_tags)} missing")
+
+        self.ensure_categories_exist(missing_categories)
+        self.ensure_tags_exist(missing_tags)
+
+    def _ensure_terms(self, taxonomy, names, cache, lock, fetch_existing, label):
+        """Return IDs for term names, creating missing ones in one batched call"""
+        if not names:
             return []
 
-        # Get existing categories
-        if not self.categories_cache:
-            existing_categories = self.wp_api.get_categories()
-            self.categories_cache = {cat['name'].lower(): cat['id'] for cat in existing_categories}
-
-        category_ids = []
-        for category_name in category_names:
-            category_lower = category_name.lower()
-
-            if category_lower not in self.categories_cache:
-                # Create new category
-                try:
-                    new_category = self.wp_api.create_category(category_name)
-                    self.categories_cache[category_lower] = new_category['id']
-                    print(f"Created category: {category_name}")
-                except Exception as e:
-                    print(f"Error creating category {category_name}: {e}")
-                    continue
+        with self.metrics.timer(f'ensure_{taxonomy}'), lock:
+            # Get existing terms
+            if not cache:
+                cache.update({term['name'].lower(): term['id'] for term in fetch_existing()})
+
+            missing = {}
+            for name in names:
+                if name.lower() not in cache:
+                    missing.setdefault(name.lower(), name)
+
+            if missing and self.work_queue:
+                # Other workers create terms too; let one of them at a time check the shared registry and create
+                with self.work_queue.lock(f'terms:{taxonomy}', self.worker_id, Config.QUEUE_LEASE_SECONDS):
+                    known = self.work_queue.get_terms(taxonomy, missing)
+                    cache.update(known)
+                    created = self._create_terms(
+                        taxonomy, [name for key, name in missing.items() if key not in known], cache, label
+                    )
+                    self.work_queue.add_terms(taxonomy, created)
+            elif missing:
+                self._create_terms(taxonomy, list(missing.values()), cache, label)
+
+            return [cache[name.lower()] for name in names if name.lower() in cache]
 
-            category_ids.append(self.categories_cache[category_lower])
+    def _create_terms(self, taxonomy, names, cache, label):
+        """Create terms in one batched call, add them to cache and return {lowercase name: ID}"""
+        created = {}
+        if not names:
+            return created
 
-        return category_ids
+        results = self.wp_api.create_terms(taxonomy, names)
+        for name, (term, error) in zip(names, results):
+            if error:
+                print(f"Error creating {label} {name}: {error}")
+                continue
+            cache[name.lower()] = created[name.lower()] = term['id']
+            print(f"Created {label}: {name}")
+        return created
+
+    def ensure_categories_exist(self, category_names):
+        """Ensure all categories exist in WordPress"""
+        return self._ensure_terms(
+            'categories', category_names, self.categories_cache, self.categories_lock,
+            self.wp_api.get_categories, 'category'
+        )
 
     def ensure_tags_exist(self, tag_names):
         """Ensure all tags exist in WordPress"""
-        if not tag_names:
-            return []
+        return self._ensure_terms(
+            'tags', tag_names, self.tags_cache, self.tags_lock,
+            self.wp_api.get_tags, 'tag'
+        )
 
-        # Get existing tags
-        if not self.tags_cache:
-            existing_tags = self.wp_api.get_tags()
-            self.tags_cache = {tag['name'].lower(): tag['id'] for tag in existing_tags}
-
-        tag_ids = []
-        for tag_name in tag_names:
-            tag_lower = tag_name.lower()
-
-            if tag_lower not in self.tags_cache:
-                # Create new tag
-                try:
-                    new_tag = self.wp_api.create_tag(tag_name)
-                    self.tags_cache[tag_lower] = new_tag['id']
-                    print(f"Created tag: {tag_name}")
-                except Exception as e:
-                    print(f"Error creating tag {tag_name}: {e}")
-                    continue
+    def prepare_photo(self, photo_path):
+        """Return the file to upload for a photo, downscaled if the optimizer is on"""
+        if not self.image_optimizer:
+            return photo_path
+        return self.image_optimizer.optimize(photo_path)
 
-            tag_ids.append(self.tags_cache[tag_lower])
+    @staticmethod
+    def is_large_upload(file_path):
+        """Check whether a file is big enough for the slow upload lane"""
+        threshold = Config.LARGE_UPLOAD_THRESHOLD_MB * 1024 * 1024
+        return bool(threshold and file_path and os.path.exists(file_path)
+                    and os.path.getsize(file_path) >= threshold)
 
-        return tag_ids
+    @staticmethod
+    def upload_progress(file_path):
+        """Return a progress callback that reports a large upload every 10%"""
+        name = os.path.basename(file_path)
+        reported = -1
 
-    def upload_photo(self, photo_path):
-        """Upload photo to WordPress and return media ID"""
-        if not photo_path or not os.path.exists(photo_path):
+        def report(sent, total):
+            nonlocal reported
+            step = sent * 10 // total if total else 10
+            if step > reported:
+                reported = step
+                print(f"Uploading {name}: {step * 10}% of {total / (1024 * 1024):.1f} MB")
+
+        return report
+
+    def upload_file(self, file_path, kind='image', content_hash=None):
+        """Upload a file to WordPress; return the media (id, source_url) or None
+
+        content_hash is the file's SHA-256 if the caller computed it already.
+        """
+        if not file_path or not os.path.exists(file_path):
             return None
 
+        name = os.path.basename(file_path)
+        label = 'photo' if kind == 'image' else kind
+        progress = self.upload_progress(file_path) if self.is_large_upload(file_path) else None
+
+        def upload_path():
+            # Only photos go through the optimizer
+            return self.prepare_photo(file_path) if kind == 'image' else file_path
+
         try:
-            media = self.wp_api.upload_media(photo_path)
-            print(f"Uploaded photo: {os.path.basename(photo_path)}")
-            return media['id']
+            if self.media_cache is None:
+                media = self.wp_api.upload_media(upload_path(), progress=progress)
+                print(f"Uploaded {label}: {name}")
+                return media
+
+            # Same file content is uploaded only once, across messages and runs
+            content_hash = content_hash or file_hash(file_path)
+            with self.media_cache.upload_lock(content_hash):
+                media_id = self.media_cache.get(content_hash)
+                if media_id:
+                    if self.image_optimizer and kind == 'image':
+                        self.image_optimizer.discard(file_path)
+                    print(f"Reused {label}: {name} (ID: {media_id})")
+                    return {'id': media_id, 'source_url': self.media_cache.get_url(content_hash)}
+
+                media = self.wp_api.upload_media(upload_path(), slug=media_slug(content_hash), progress=progress)
+                self.media_cache.add(content_hash, media['id'], media.get('source_url'))
+                print(f"Uploaded {label}: {name}")
+                return media
         except Exception as e:
-            print(f"Error uploading photo {photo_path}: {e}")
+            print(f"Error uploading {label} {file_path}: {e}")
+            return None
+
+    def prefetch_photo(self, file_path):
+        """Start downscaling a photo in the background, unless its content is uploaded already
+
+        Returns the photo's content hash when the media cache is used, for upload_file().
+        """
+        if not os.path.exists(file_path):
             return None
+        content_hash = None
+        if self.media_cache is not None:
+            content_hash = file_hash(file_path)
+            if self.media_cache.get(content_hash):
+                return content_hash
+        self.image_optimizer.submit(file_path)
+        return content_hash
+
+    def upload_photo(self, photo_path):
+        """Upload photo to WordPress and return media ID"""
+        media = self.upload_file(photo_path)
+        return media['id'] if media else None
+
+    @staticmethod
+    def post_attachments(processed_message):
+        """Attachments of a processed message, falling back to its photo alone"""
+        attachments = processed_message.attachments
+        if not attachments and processed_message.photo_path:
+            attachments = [{'path': processed_message.photo_path, 'kind': 'image', 'mime_type': None}]
+        return attachments or []
+
+    def upload_attachments(self, attachments):
+        """Upload the files of one post in parallel; return media (or None) per attachment, in order"""
+        if len(attachments) <= 1:
+            return [self.upload_file(item['path'], item['kind'], item.get('content_hash')) for item in attachments]
+
+        with self.media_executor_lock:
+            if self.media_executor is None:
+                self.media_executor = ThreadPoolExecutor(max_workers=max(Config.MEDIA_UPLOAD_WORKERS, 1))
+        futures = [self.media_executor.submit(self.upload_file, item['path'], item['kind'], item.get('content_hash'))
+                   for item in attachments]
+        return [future.result() for future in futures]
+
+    def prepare_post(self, processed_message, new_post=True):
+        """Upload the media and resolve terms; return keyword arguments for WordPressAPI.create_post
+
+        Only for a new post is the photo of an interrupted attempt reused and
+        the upload recorded; recording it would take a message that already
+        has a post out of the done ones.
+        """
+        message_id = processed_message.id
+        photo_path = processed_message.photo_path
+        attachments = self.post_attachments(processed_message)
+
+        # A lone photo uploaded by an interrupted run is reused as is
+        featured_media_id = None
+        if photo_path and len(attachments) == 1 and self.state and new_post:
+            featured_media_id = self.state.get_media_id(message_id)
+
+        # The post is only created once every attachment has a media ID
+        media = []
+        if attachments and not featured_media_id:
+            with self.metrics.timer('upload_media'):
+                media = self.upload_attachments(attachments)
+            featured_media_id = next(
+                (item['id'] for attachment, item in zip(attachments, media)
+                 if item and attachment['path'] == photo_path),
+                None
+            )
+            if featured_media_id and self.state and new_post:
+                self.state.record_media(message_id, featured_media_id)
+
+        content = processed_message.content
+        media_blocks = self.processor.render_attachments(attachments, media)
+        if media_blocks:
+            content = f"{content}\n\n{media_blocks}"
+
+        # Ensure categories and tags exist
+        category_ids = self.ensure_categories_exist(processed_message.categories)
+        tag_ids = self.ensure_tags_exist(processed_message.tags)
+
+        return {
+            'title': processed_message.title,
+            'content': content,
+            'date': processed_message.date,
+            'categories': category_ids,
+            'tags': tag_ids,
+            'featured_media_id': featured_media_id
+        }
+
+    def post_created(self, processed_message, post, featured_media_id=None):
+        """Record and report a created post"""
+        self.metrics.increment('messages_total', result='created')
+        self.record_post(processed_message, post['id'], featured_media_id)
+
+        print(f"Created post: {processed_message.title} (ID: {post['id']})")
+
+    def record_post(self, processed_message, post_id, featured_media_id=None):
+        """Remember which post a message ended up in"""
+        if self.lease:
+            self.work_queue.add_post(self.lease, processed_message.id, post_id)
+        if self.state:
+            self.state.record_post(processed_message.id, post_id, featured_media_id,
+                                   processed_message.original, processed_message.signature)
+        elif self.duplicates is not None:
+            self.duplicate_posts[processed_message.id] = post_id
+
+    def post_failed(self, processed_message, error):
+        """Record and report a post that could not be created"""
+        print(f"Error creating post '{processed_message.title}': {error}")
+        self.metrics.increment('messages_total', result='failed')
+        if self.state:
+            self.state.record_failure(processed_message.id, error)
 
     def create_post(self, processed_message):
         """Create a WordPress post from processed message"""
         try:
-            # Upload photo if present
-            featured_media_id = None
-            if processed_message['photo_path']:
-                featured_media_id = self.upload_photo(processed_message['photo_path'])
-
-            # Ensure categories and tags exist
-            category_ids = self.ensure_categories_exist(processed_message['categories'])
-            tag_ids = self.ensure_tags_exist(processed_message['tags'])
+            post_args = self.prepare_post(processed_message)
 
             # Create the post
-            post = self.wp_api.create_post(
-                title=processed_message['title'],
-                content=processed_message['content'],
-                date=processed_message['date'],
-                categories=category_ids,
-                tags=tag_ids,
-                featured_media_id=featured_media_id
-            )
+            with self.metrics.timer('create_post'):
+                post = self.wp_api.create_post(**post_args)
+
+        except Exception as e:
+            self.post_failed(processed_message, e)
+            return None
+
+        self.post_created(processed_message, post, post_args['featured_media_id'])
+        return post
+
+    def update_post(self, processed_message, post_id):
+        """Update the post of an edited message in place"""
+        try:
+            # The photo may have changed too; the media cache still avoids re-uploads
+            post_args = self.prepare_post(processed_message, new_post=False)
+            with self.metrics.timer('update_post'):
+                post = self.wp_api.update_post(post_id, **post_args)
+        except Exception as e:
+            # Keep the old state so the next sync tries again
+            print(f"Error updating post '{processed_message.title}': {e}")
+            self.metrics.increment('messages_total', result='failed')
+            return None
+
+        self.metrics.increment('messages_total', result='updated')
+        self.record_post(processed_message, post_id, post_args['featured_media_id'])
+        print(f"Updated post: {processed_message.title} (ID: {post_id})")
+        return post
 
-            print(f"Created post: {processed_message['title']} (ID: {post['id']})")
-            return post
+    def merge_post(self, processed_message, post_id):
+        """Add the terms and new media of a near-duplicate message to an existing post, keeping its text"""
+        try:
+            post = self.wp_api.get_post(post_id)
+            content = post['content']['raw']
+
+            attachments = self.post_attachments(processed_message)
+            media = []
+            if attachments:
+                with self.metrics.timer('upload_media'):
+                    media = self.upload_attachments(attachments)
+            # Media the post already shows is not added again
+            added = [(attachment, item) for attachment, item in zip(attachments, media)
+                     if item and not (item.get('source_url') and item['source_url'] in content)]
+            media_blocks = self.processor.render_attachments([a for a, _ in added], [item for _, item in added])
+            if media_blocks:
+                content = f"{content}\n\n{media_blocks}"
 
+            category_ids = self.ensure_categories_exist(processed_message.categories)
+            tag_ids = self.ensure_tags_exist(processed_message.tags)
+            featured_media_id = post.get('featured_media') or next(
+                (item['id'] for attachment, item in added if attachment['kind'] == 'image'), None
+            )
+            with self.metrics.timer('update_post'):
+                self.wp_api.update_post(
+                    post_id, post['title']['raw'], content, None,
+                    sorted(set(post.get('categories') or []) | set(category_ids)),
+                    sorted(set(post.get('tags') or []) | set(tag_ids)),
+                    featured_media_id
+                )
         except Exception as e:
-            print(f"Error creating post '{processed_message['title']}': {e}")
+            print(f"Error merging '{processed_message.title}' into post {post_id}: {e}")
+            self.metrics.increment('messages_total', result='failed')
+            return None
+
+        self.metrics.increment('messages_total', result='merged')
+        self.record_post(processed_message, post_id)
+        print(f"Merged into post: {processed_message.title} (ID: {post_id})")
+        return post
+
+    def open_duplicate_index(self):
+        """Start near-duplicate detection, seeded with the fingerprints kept in the import state"""
+        self.duplicates = DuplicateIndex(Config.DUPLICATE_THRESHOLD)
+        self.duplicate_posts = {}
+        if self.state:
+            for message_id, message_signature in self.state.iter_signatures():
+                self.duplicates.add(message_id, message_signature)
+        return self.duplicates
+
+    def find_duplicate(self, processed_message):
+        """Fingerprint a processed message; return (message id, similarity) of an earlier near-duplicate or None
+
+        The text is the cleaned message (title and content) without HTML.
+        Messages under DUPLICATE_MIN_WORDS words are never matched.
+        """
+        tokens = words(f"{processed_message.title}\n{processed_message.content}")
+        if len(tokens) < Config.DUPLICATE_MIN_WORDS:
             return None
+        processed_message.signature = signature(tokens)
+        return self.duplicates.find(processed_message.signature)
 
-    def import_messages(self, messages, start_index=0, batch_size=None):
-        """Import messages to WordPress"""
+    def duplicate_post_id(self, message_id):
+        """Post ID of an imported message, or None if it has none (yet)"""
+        if self.state:
+            row = self.state.get(message_id)
+            return row['post_id'] if row and row['status'] == STATUS_DONE else None
+        return self.duplicate_posts.get(message_id)
+
+    def handle_duplicate(self, processed_message, post_id, similarity):
+        """Apply DUPLICATE_POLICY to a message that nearly repeats post post_id"""
+        print(f"Near-duplicate of post {post_id} ({similarity:.0%} similar): {processed_message.title}")
+        if Config.DUPLICATE_POLICY == 'update':
+            # The post keeps its original date
+            return self.update_post(processed_message.replace(date=None), post_id)
+        if Config.DUPLICATE_POLICY == 'merge':
+            return self.merge_post(processed_message, post_id)
+        self.metrics.increment('messages_total', result='duplicate')
+        self.record_post(processed_message, post_id)
+        return True
+
+    def prepare_batched_post(self, processed_message):
+        """Prepare a post for create_posts_batch; returns (processed_message, post_args or None)"""
+        try:
+            return processed_message, self.prepare_post(processed_message)
+        except Exception as e:
+            self.post_failed(processed_message, e)
+            return processed_message, None
+
+    def create_posts_batch(self, prepared_posts):
+        """Create prepared posts through the batch endpoint; return number created
+
+        Each result is mapped back to its Telegram message, so failures are
+        reported and recorded per message just like single creates.
+        """
+        prepared_posts = [(message, args) for message, args in prepared_posts if args]
+        if not prepared_posts:
+            return 0
+
+        with self.metrics.timer('create_posts_batch'):
+            results = self.wp_api.create_posts([
+                self.wp_api.build_post_data(**post_args) for _, post_args in prepared_posts
+            ])
+
+        created_count = 0
+        for (processed_message, post_args), (post, error) in zip(prepared_posts, results):
+            if error:
+                self.post_failed(processed_message, error)
+            else:
+                self.post_created(processed_message, post, post_args['featured_media_id'])
+                created_count += 1
+        return created_count
+
+    def is_imported(self, message_id):
+        """Check whether a message has a post, from the import state or the leased range"""
+        if message_id in self.range_posts:
+            return True
+        return bool(self.state and self.state.is_done(message_id))
+
+    def import_messages(self, messages, start_index=0, batch_size=None, concurrency=None, post_batch=None,
+                        progress=None, stop_event=None):
+        """Import messages to WordPress
+
+        `messages` is either the full list from load_export_data (sliced at
+        start_index here) or an iterator that already starts at start_index,
+        such as the one returned by iter_export_data.
+
+        With concurrency > 1, messages are still processed in order on this
+        thread while post creation runs on a bounded worker pool. Every post
+        carries its own Telegram date, so publish order is unaffected, and
+        results are collected in input order.
+
+        With post_batch, media and terms are still handled per message, but
+        the posts themselves are created BATCH_REQUEST_SIZE at a time through
+        the WordPress batch endpoint.
+
+        Messages with a file of LARGE_UPLOAD_THRESHOLD_MB or more are
+        created on a separate slow lane of LARGE_UPLOAD_WORKERS threads,
+        so a long upload does not hold up the posts queued behind it.
+
+        With progress, a live line with throughput and ETA is kept on stderr.
+
+        Once stop_event is set, no further message is started; posts already
+        queued are still finished and recorded.
+
+        With near-duplicate detection open (DUPLICATE_POLICY), a message
+        whose text nearly repeats an already imported one is skipped, merged
+        into that post or replaces its content instead of becoming a new post.
+        """
         if batch_size is None:
             batch_size = Config.BATCH_SIZE
+        if concurrency is None:
+            concurrency = Config.CONCURRENCY
+        if post_batch is None:
+            post_batch = Config.POST_BATCH
+        if progress is None:
+            progress = Config.SHOW_PROGRESS
+
+        total = None
+        if isinstance(messages, list):
+            total = len(messages)
+            messages = islice(messages, start_index, None)
+        else:
+            messages = self._timed_messages(messages)
+        if Config.GROUP_ALBUMS:
+            messages = self.processor.group_albums(messages)
+
+        def fraction(index):
+            if total:
+                return (index + 1) / total
+            if self.export_reader:
+                return self.export_reader.fraction()
+            return None
+
+        progress_line = ProgressLine() if progress else None
 
         processed_count = 0
         created_count = 0
+        skipped_count = 0
+        duplicate_count = 0
+        next_index = start_index
+        batch_complete = False
+        stopped = False
 
-        for i, message in enumerate(messages[start_index:], start_index):
-            # Process the message
-            processed_message = self.processor.process_message(message)
-
-            if processed_message:
-                processed_count += 1
+        executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+        # Enough queued work to keep every worker busy while the oldest post finishes
+        max_pending = concurrency * 2
+        pending = deque()
+        slow_executor = None
+        if Config.LARGE_UPLOAD_THRESHOLD_MB:
+            slow_executor = ThreadPoolExecutor(max_workers=max(Config.LARGE_UPLOAD_WORKERS, 1))
+        slow_pending = deque()
+        job = self.prepare_batched_post if post_batch else self.create_post
+        prepared_posts = []
 
-                # Create the post
-                post = self.create_post(processed_message)
-                if post:
+        def collect(result):
+            nonlocal created_count
+            if not post_batch:
+                if result:
                     created_count += 1
+                return
+            prepared_posts.append(result)
+            if len(prepared_posts) >= Config.BATCH_REQUEST_SIZE:
+                created_count += self.create_posts_batch(prepared_posts)
+                prepared_posts.clear()
+
+        def drain():
+            nonlocal created_count
+            while pending:
+                collect(pending.popleft().result())
+            while slow_pending:
+                collect(slow_pending.popleft().result())
+            if prepared_posts:
+                created_count += self.create_posts_batch(prepared_posts)
+                prepared_posts.clear()
+
+        try:
+            for message in messages:
+                if stop_event is not None and stop_event.is_set():
+                    stopped = True
+                    break
+
+                # An album counts as every export message it merges
+                i = next_index + len(message.get('album') or [message]) - 1
+                next_index = i + 1
+
+                # Skip messages imported by an earlier run
+                if progress_line:
+                    progress_line.update(i + 1 - start_index, fraction(i))
+
+                if self.is_imported(message.get('id')):
+                    skipped_count += 1
+                    self.metrics.increment('messages_total', result='skipped')
+                    continue
+
+                # Process the message
+                with self.metrics.timer('process_message'):
+                    processed_message = self.processor.process_message(message)
+
+                if processed_message:
+                    processed_count += 1
+
+                    if self.duplicates is not None:
+                        duplicate = self.find_duplicate(processed_message)
+                        post_id = None
+                        if duplicate:
+                            post_id = self.duplicate_post_id(duplicate[0])
+                            if post_id is None:
+                                # The earlier message may still be in flight; a failed one is no duplicate
+                                drain()
+                                post_id = self.duplicate_post_id(duplicate[0])
+                        message_signature = processed_message.signature
+                        if post_id is not None:
+                            duplicate_count += 1
+                            self.handle_duplicate(processed_message, post_id, duplicate[1])
+                            # Later variants match this one too, and lead to the same post
+                            self.duplicates.add(duplicate[0], message_signature)
+                            continue
+                        if message_signature:
+                            self.duplicates.add(processed_message.id, message_signature)
+
+                    # Start downscaling now so it overlaps with earlier uploads
+                    attachments = self.post_attachments(processed_message)
+                    if self.image_optimizer:
+                        for attachment in attachments:
+                            if attachment['kind'] == 'image':
+                                # Hashed once here, the upload reuses it
+                                attachment['content_hash'] = self.prefetch_photo(attachment['path'])
+
+                    # Create the post
+                    if slow_executor and any(self.is_large_upload(item['path']) for item in attachments):
+                        slow_pending.append(slow_executor.submit(job, processed_message))
+                    elif executor:
+                        pending.append(executor.submit(job, processed_message))
+                        while len(pending) >= max_pending:
+                            collect(pending.popleft().result())
+                    else:
+                        collect(job(processed_message))
+
+                    while slow_pending and slow_pending[0].done():
+                        collect(slow_pending.popleft().result())
+
+                    # Check if we should stop for batch processing
+                    if batch_size > 0 and processed_count >= batch_size:
+                        batch_complete = True
+                        break
+
+            drain()
+        finally:
+            if executor:
+                executor.shutdown(wait=True)
+            if slow_executor:
+                slow_executor.shutdown(wait=True)
+            if progress_line:
+                progress_line.finish(next_index - start_index, fraction(next_index - 1))
+
+        if skipped_count:
+            print(f"Skipped {skipped_count} messages already imported.")
+        if duplicate_count:
+            print(f"Found {duplicate_count} near-duplicate messages ({Config.DUPLICATE_POLICY}).")
+        if stopped:
+            print(f"Import stopped. Processed {processed_count} messages, created {created_count} posts.")
+        elif batch_complete:
+            print(f"Batch complete. Processed {processed_count} messages, created {created_count} posts.")
+        else:
+            print(f"Import complete. Processed {processed_count} messages, created {created_count} posts.")
+        return next_index  # Return next index to start from
+
+    def dry_run(self, output_path, output_format=None, start_index=0, stream=None, workers=None,
+                media_base_url=None, message_range=None):
+        """Process the export and write posts to a WXR/NDJSON file without contacting WordPress"""
+        # xml.sax.saxutils pulls in urllib and http.client; only the dry run needs them
+        from export_writer import open_writer
+
+        if stream is None:
+            stream = Config.STREAM_EXPORT
+        if media_base_url is None:
+            media_base_url = Config.DRY_RUN_MEDIA_URL
+
+        print(f"Dry run: writing posts to {output_path}")
+
+        if start_index or message_range:
+            messages = self.iter_export_data(*self.select_messages(start_index, message_range))
+        elif stream:
+            messages = self.iter_export_data()
+        else:
+            messages = self.load_export_data()
+        if Config.GROUP_ALBUMS:
+            messages = self.processor.group_albums(messages)
+
+        message_count = 0
+        post_count = 0
+        started = time.monotonic()
+
+        with open_writer(output_path, output_format, media_base_url) as writer:
+            for processed_message in self.processor.process_messages(messages, workers):
+                message_count += 1
+                if processed_message:
+                    writer.write(processed_message)
+                    post_count += 1
+
+                if message_count % 10000 == 0:
+                    elapsed = time.monotonic() - started
+                    print(f"  {message_count} messages, {message_count / elapsed:.0f} messages/s")
 
-                # Check if we should stop for batch processing
-                if batch_size > 0 and processed_count >= batch_size:
-                    print(f"Batch complete. Processed {processed_count} messages, created {created_count} posts.")
-                    return i + 1  # Return next index to start from
+        elapsed = max(time.monotonic() - started, 1e-9)
+        print(f"Dry run complete. Wrote {post_count} posts from {message_count} messages "
+              f"in {elapsed:.1f}s ({message_count / elapsed:.0f} messages/s)")
+        return post_count
 
-        print(f"Import complete. Processed {processed_count} messages, created {created_count} posts.")
-        return len(messages)
+    def open_resources(self, track_state, media_cache, state_path=None):
+        """Open the import state, media cache and image optimizer used by a run"""
+        # A wrong export directory fails here, before any database file is created in it
+        self.get_export_file()
+
+        if track_state:
+            state = self.open_state(state_path)
+            print(f"Using import state {state.db_path} ({len(state.done_ids)} messages already imported)")
+
+        if media_cache:
+            cache = self.open_media_cache()
+            print(f"Using media cache {cache.db_path} ({len(cache)} files)")
+
+        if Config.DUPLICATE_POLICY in DUPLICATE_POLICIES:
+            duplicates = self.open_duplicate_index()
+            print(f"Near-duplicate detection: {Config.DUPLICATE_POLICY} ({len(duplicates)} fingerprints)")
+
+        if Config.IMAGE_MAX_DIMENSION:
+            optimizer = self.start_image_optimizer()
+            print(f"Downscaling photos to {optimizer.max_dimension}px {optimizer.image_format}")
+
+    def print_stats(self):
+        """Print HTTP, image and per-stage statistics of the run"""
+        print(f"HTTP: {self.wp_api.connection_stats}; {self.wp_api.scheduler}")
+        if self.image_optimizer:
+            print(f"Images: {self.image_optimizer}")
+        print("Stages:")
+        for line in self.metrics.summary():
+            print(line)
+
+    def close_resources(self, metrics_file=None):
+        """Write the metrics report and close everything open_resources opened"""
+        if metrics_file:
+            try:
+                self.metrics.write(metrics_file)
+                print(f"Metrics written to {metrics_file}")
+            except OSError as e:
+                print(f"Error writing metrics: {e}")
+        if self.state:
+            self.state.close()
+            self.state = None
+        self.duplicates = None
+        self.duplicate_posts = {}
+        if self.media_cache is not None:
+            self.media_cache.close()
+            self.media_cache = None
+        if self.image_optimizer:
+            self.image_optimizer.shutdown()
+            self.image_optimizer = None
+        if self.media_executor:
+            self.media_executor.shutdown(wait=True)
+            self.media_executor = None
+
+    def run(self, start_index=0, batch_size=None, stream=None, concurrency=None, track_state=None,
+            preload_terms=None, media_cache=None, post_batch=None, progress=None, metrics_file=None,
+            message_range=None):
+        """Run the import process
+
+        A start_index past 0 or a message_range (see select_messages) reads
+        only those messages, seeking through the export index.
+        """
+        if metrics_file is None:
+            metrics_file = Config.METRICS_FILE
+        if media_cache is None:
+            media_cache = Config.MEDIA_CACHE
+        if stream is None:
+            stream = Config.STREAM_EXPORT
+        if track_state is None:
+            track_state = Config.TRACK_STATE
+        if preload_terms is None:
+            preload_terms = Config.PRELOAD_TAXONOMY
 
-    def run(self, start_index=0, batch_size=None):
-        """Run the import process"""
         print("Starting Telegram to WordPress import...")
 
         try:
+            self.open_resources(track_state, media_cache)
+
             # Load export data
-            messages = self.load_export_data()
-            print(f"Loaded {len(messages)} messages from export")
+            stop_index = None
+            if start_index or message_range:
+                start_index, stop_index = self.select_messages(start_index, message_range)
+                messages = self.iter_export_data(start_index, stop_index)
+            elif stream:
+                messages = self.iter_export_data()
+                print("Streaming messages from export")
+            else:
+                messages = self.load_export_data()
+                print(f"Loaded {len(messages)} messages from export")
+
+            # Create all needed terms upfront (streamed messages are read twice for this pass)
+            if preload_terms:
+                if isinstance(messages, list):
+                    self.preload_taxonomy(messages)
+                else:
+                    # A reader of its own, so progress keeps following the import's reader
+                    reader = ExportReader(self.get_export_file(), index=self.export_index)
+                    self.preload_taxonomy(reader.iter_messages(start_index, stop_index))
 
             # Import messages
-            next_index = self.import_messages(messages, start_index, batch_size)
+            next_index = self.import_messages(messages, start_index, batch_size, concurrency, post_batch,
+                                              progress)
 
             print(f"Import completed. Next index: {next_index}")
+            self.print_stats()
             return next_index
 
         except Exception as e:
             print(f"Import failed: {e}")
             return start_index
+        finally:
+            self.close_resources(metrics_file)
+
+    def _iter_sync_candidates(self, scan):
+        """Yield export messages for the sync scan; imported ones that can hold no edit are only stubs
+
+        A message already imported is recognized by its id without being
+        decoded, unless it carries an edit time or media and so may be part
+        of an edited album. It is replaced by a stub holding just its id,
+        which still ends an album where the message stood.
+        """
+        self.export_reader = ExportReader(self.get_export_file())
+        for offset, raw in self.export_reader.iter_raw_messages():
+            scan['last'] = raw
+            match = _MESSAGE_ID.match(raw)
+            if (match and self.state.is_done(int(match.group(1))) and b'"edited' not in raw
+                    and b'"photo"' not in raw and b'"file"' not in raw):
+                yield {'id': int(match.group(1))}
+                continue
+            yield json.loads(raw)
+
+    def iter_sync_messages(self, mark_id, scan):
+        """Yield export messages that still need a post, collecting edited ones
+
+        Albums are grouped as by import_messages, so an edited caption
+        updates the post with the whole album. Edited messages whose content
+        hash changed are appended to scan['updates'] as (message, post_id);
+        scan['last'] ends up as the raw last message.
+        """
+        messages = self._iter_sync_candidates(scan)
+        if Config.GROUP_ALBUMS:
+            messages = self.processor.group_albums(messages)
+
+        for message in messages:
+            message_id = message.get('id')
+            if not isinstance(message_id, int):
+                yield message
+                continue
+
+            if self.state.is_done(message_id):
+                if not message_edited(message):
+                    continue
+                row = self.state.get(message_id)
+                if message_edited(message) == row['edited'] or message_hash(message) == row['content_hash']:
+                    continue
+                scan['updates'].append((message, row['post_id']))
+                continue
+
+            # Below the mark, only messages with a failed or unfinished attempt are retried;
+            # the rest produced no post (service messages, empty text) last time
+            if mark_id is not None and message_id <= mark_id and self.state.get(message_id) is None:
+                continue
+
+            # import_messages groups the album again
+            yield from message.get('album') or [message]
+
+    def sync(self, concurrency=None, post_batch=None, progress=None, media_cache=None, metrics_file=None,
+             state_path=None):
+        """Import messages added since the last sync and update edited ones
+
+        Meant for successive full exports of the same channel: the state is
+        kept in SYNC_STATE_FILE instead of the export directory, so a new
+        ChatExport_* directory picks up where the previous one stopped.
+        """
+        if metrics_file is None:
+            metrics_file = Config.METRICS_FILE
+        if media_cache is None:
+            media_cache = Config.MEDIA_CACHE
+        if state_path is None:
+            state_path = Config.SYNC_STATE_FILE
+
+        print("Starting incremental sync...")
+
+        try:
+            self.open_resources(True, media_cache, state_path)
+
+            mark_id, mark_date = self.state.get_sync_mark()
+            if mark_id is None:
+                print("No previous sync, importing every message missing from the state")
+            else:
+                print(f"Last sync covered messages up to {mark_id} ({mark_date})")
 
-def main():
+            scan = {'updates': [], 'last': None}
+            self.import_messages(self.iter_sync_messages(mark_id, scan), 0, 0, concurrency, post_batch,
+                                 progress)
+
+            updated_count = 0
+            for message, post_id in scan['updates']:
+                processed_message = self.processor.process_message(message)
+                if processed_message and self.update_post(processed_message, post_id):
+                    updated_count += 1
+            print(f"Updated {updated_count} of {len(scan['updates'])} edited messages.")
+
+            # Everything up to the last message is now imported, skipped or recorded as failed
+            if scan['last']:
+                last_message = json.loads(scan['last'])
+                if isinstance(last_message.get('id'), int) and (mark_id is None or last_message['id'] > mark_id):
+                    self.state.set_sync_mark(last_message['id'], last_message.get('date'))
+                    print(f"Sync mark moved to message {last_message['id']} ({last_message.get('date')})")
+
+            self.print_stats()
+            return True
+
+        except Exception as e:
+            print(f"Sync failed: {e}")
+            return False
+        finally:
+            self.close_resources(metrics_file)
+
+    def export_key(self):
+        """Name of the export in the work queue: the id of the exported chat
+
+        Every later export of the chat, on any host and in any directory,
+        shares the key, and so the ranges and posts already in the queue.
+        Without a chat id in result.json, the directory name is used.
+        """
+        chat_id = read_chat_id(self.get_export_file())
+        if chat_id is None:
+            return os.path.basename(os.path.normpath(Config.EXPORT_DIR))
+        return f"chat:{chat_id}"
+
+    def publish(self, queue_location=None, range_size=None):
+        """Add the export's messages to the work queue as ranges of range_size messages
+
+        Ranges are message id ranges, so they keep their messages in later
+        exports. Only messages past the last published range are added, so
+        publishing again after the export grew queues just the new messages.
+        """
+        if queue_location is None:
+            queue_location = Config.WORK_QUEUE
+        if range_size is None:
+            range_size = Config.QUEUE_RANGE_SIZE
+
+        queue = open_queue(queue_location)
+        try:
+            index = self.open_export_index()
+            export = self.export_key()
+            first, total = index.select(first_id=queue.published_stop(export))
+            ranges = [(index.ids[start], index.ids[min(start + range_size, total) - 1] + 1)
+                      for start in range(first, total, range_size)]
+            queue.publish(export, ranges)
+
+            print(f"Published {len(ranges)} ranges of up to {range_size} messages of {export} to {queue_location}")
+            print(f"Queue: {queue.counts(export)}")
+            return len(ranges)
+        finally:
+            queue.close()
+
+    def work(self, queue_location=None, worker_id=None, concurrency=None, post_batch=None, progress=None,
+             media_cache=None, metrics_file=None):
+        """Import ranges leased from the work queue until none is left
+
+        Any number of workers, on one host or several, can run this against
+        the same queue. A heartbeat thread renews the current lease; the range
+        goes back to the queue when the worker fails, or once the lease
+        expires if it crashes. A worker that finds its lease taken over stops
+        the range before its next message. Posts are recorded in the queue per
+        range, so messages done by an earlier attempt at the range are skipped
+        on any host; the import state stays local to each worker.
+        """
+        if queue_location is None:
+            queue_location = Config.WORK_QUEUE
+        if metrics_file is None:
+            metrics_file = Config.METRICS_FILE
+        if media_cache is None:
+            media_cache = Config.MEDIA_CACHE
+        lease_seconds = Config.QUEUE_LEASE_SECONDS
+
+        self.work_queue = open_queue(queue_location)
+        self.worker_id = worker_id or worker_name()
+        range_count = 0
+
+        try:
+            export = self.export_key()
+            print(f"Worker {self.worker_id} importing ranges of {export} from {queue_location}")
+            self.open_resources(Config.TRACK_STATE, media_cache)
+            self.open_export_index()
+
+            while True:
+                lease = self.work_queue.lease(export, self.worker_id, lease_seconds)
+                if lease is None:
+                    break
+
+                print(f"Leased messages {lease.start}-{lease.stop - 1}")
+                self.lease = lease
+                self.range_posts = self.work_queue.get_posts(lease)
+                start, stop = self.export_index.select(first_id=lease.start, last_id=lease.stop - 1)
+                with self.work_queue.keep_alive(lease, lease_seconds) as lost:
+                    try:
+                        self.import_messages(self.iter_export_data(start, stop), start, 0,
+                                             concurrency, post_batch, progress, stop_event=lost)
+                    except BaseException:
+                        self.work_queue.release(lease)
+                        raise
+                    finally:
+                        self.lease = None
+                        self.range_posts = {}
+
+                if self.work_queue.complete(lease):
+                    range_count += 1
+                elif lost.is_set():
+                    print(f"Lease on messages {lease.start}-{lease.stop - 1} expired, another worker took them over")
+
+            print(f"No ranges left. This worker imported {range_count} ranges; queue: {self.work_queue.counts(export)}")
+            self.print_stats()
+            return True
+
+        except Exception as e:
+            print(f"Work failed: {e}")
+            return False
+        finally:
+            self.close_resources(metrics_file)
+            self.work_queue.close()
+            self.work_queue = None
+
+def export_date(value):
+    """argparse type for --since/--until: an ISO date or date and time"""
+    try:
+        parse_export_date(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {value!r} (expected YYYY-MM-DD or YYYY-MM-DDTHH:MM)")
+    return value
+
+def message_range(args):
+    """ExportIndex.select() bounds given by --from-id/--to-id/--since/--until, or None"""
+    bounds = {
+        'first_id': args.from_id,
+        'last_id': args.to_id,
+        'since': parse_export_date(args.since) if args.since else None,
+        'until': parse_export_date(args.until, end=True) if args.until else None,
+    }
+    if all(value is None for value in bounds.values()):
+        return None
+    return bounds
+
+def build_parser():
+    """Command line parser with one subcommand per stage"""
+    parser = argparse.ArgumentParser(
+        prog='telegram_importer.py',
+        description='Import a Telegram channel export into WordPress.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=(
+            'Without a command, the arguments are those of "import":\n'
+            '  python telegram_importer.py [options] [start_index] [batch_size]\n'
+            '\nExamples:\n'
+            '  python telegram_importer.py\n'
+            '  python telegram_importer.py 10 5\n'
+            '  python telegram_importer.py --export-dir ChatExport_2025-07-26 10 5\n'
+            '  python telegram_importer.py import --stream 40000 0\n'
+            '  python telegram_importer.py import --since 2025-07-01 --until 2025-07-31 0 0\n'
+            '  python telegram_importer.py import --concurrency 8 0 0\n'
+            '  python telegram_importer.py dry-run --stream --workers 4 posts.xml\n'
+            '  python telegram_importer.py sync --export-dir ChatExport_2025-08-03\n'
+            '  python telegram_importer.py publish --queue /mnt/shared/queue.sqlite3\n'
+            '  python telegram_importer.py work --queue /mnt/shared/queue.sqlite3 --concurrency 4\n'
+            '  python telegram_importer.py bench --messages 5000 --concurrency 8\n'
+            '\nRun "python telegram_importer.py COMMAND --help" for the options of a command.'
+        )
+    )
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    export = argparse.ArgumentParser(add_help=False)
+    export.add_argument('--export-dir', metavar='DIR',
+                        help='Export directory (default: from .env or ChatExport_2025-07-27)')
+    export.add_argument('--stream', action='store_true', default=None,
+                        help='Parse result.json incrementally with flat memory (default: from .env)')
+
+    selection = argparse.ArgumentParser(add_help=False)
+    selection.add_argument('--from-id', type=int, metavar='ID',
+                           help='Start at the message with this id')
+    selection.add_argument('--to-id', type=int, metavar='ID',
+                           help='Stop after the message with this id')
+    selection.add_argument('--since', type=export_date, metavar='DATE',
+                           help='Start at this date or time (YYYY-MM-DD[THH:MM], local time)')
+    selection.add_argument('--until', type=export_date, metavar='DATE',
+                           help='Stop after this date (whole day) or time')
+
+    network = argparse.ArgumentParser(add_help=False)
+    network.add_argument('--concurrency', type=int, metavar='N',
+                         help='Create up to N posts in parallel (default: from .env or 1)')
+    network.add_argument('--no-media-cache', dest='media_cache', action='store_false', default=None,
+                         help='Upload every photo even if the same image was uploaded before')
+    network.add_argument('--batch-posts', dest='post_batch', action='store_true', default=None,
+                         help='Create posts 25 at a time via the WordPress batch endpoint')
+    network.add_argument('--progress', action='store_true', default=None,
+                         help='Show a live progress line with throughput and ETA on stderr')
+    network.add_argument('--metrics', dest='metrics_file', metavar='FILE',
+                         help='Write per-stage timings and HTTP counters as JSON (.prom: Prometheus text)')
+
+    dry_run = argparse.ArgumentParser(add_help=False)
+    dry_run.add_argument('--format', dest='dry_run_format', choices=('wxr', 'ndjson'),
+                         help='Dry-run format (default: from file extension)')
+    dry_run.add_argument('--workers', type=int, metavar='N',
+                         help='Processes used for content processing (default: from .env or 1)')
+
+    command = commands.add_parser('import', parents=[export, selection, network, dry_run],
+                                  help='Import messages into WordPress (default)')
+    command.add_argument('--no-state', dest='track_state', action='store_false', default=None,
+                         help='Do not record or skip already imported messages')
+    command.add_argument('--preload-terms', action='store_true', default=None,
+                         help='Create all categories/tags the export needs before posting')
+    # Options of the sync and dry-run commands, kept for existing scripts
+    command.add_argument('--sync', action='store_true', help='Same as the sync command')
+    command.add_argument('--dry-run', dest='dry_run_output', metavar='FILE', help='Same as the dry-run command')
+    command.add_argument('start_index', type=int, nargs='?', default=0,
+                         help='Start from this message index, seeking through the export index (default: 0)')
+    command.add_argument('batch_size', type=int, nargs='?',
+                         help='Number of messages to process (default: from .env or 1)')
+
+    commands.add_parser('sync', parents=[export, network],
+                        help='Import only new messages and update edited ones since the last sync')
+
+    command = commands.add_parser('dry-run', parents=[export, selection, dry_run],
+                                  help='Write posts to a WXR (.xml/.wxr) or NDJSON file instead of WordPress')
+    command.add_argument('dry_run_output', metavar='FILE')
+    command.add_argument('start_index', type=int, nargs='?', default=0,
+                         help='Start from this message index, seeking through the export index (default: 0)')
+
+    queue = argparse.ArgumentParser(add_help=False)
+    queue.add_argument('--queue', dest='queue_location', metavar='PATH',
+                       help='Work queue shared by the workers: a SQLite file or sqlite:///PATH '
+                            '(default: from .env or work_queue.sqlite3)')
+
+    command = commands.add_parser('publish', parents=[export, queue],
+                                  help='Add the export to the work queue as message ranges')
+    command.add_argument('--range-size', type=int, metavar='N',
+                         help='Messages per range (default: from .env or 500)')
+
+    command = commands.add_parser('work', parents=[export, queue, network],
+                                  help='Import message ranges leased from the work queue until none is left')
+    command.add_argument('--worker-id', metavar='NAME', help='Name of this worker in the queue (default: host:pid)')
+
+    # Options are parsed by benchmark.py (see parse_args), which is only imported when the command runs
+    commands.add_parser('bench', add_help=False,
+                        help='Benchmark an import against a local mock WordPress server')
+    return parser
+
+def parse_args(argv):
+    """Parse command line arguments, treating the legacy syntax as the import command"""
+    if argv and argv[0] == 'bench':
+        return argparse.Namespace(command='bench', bench_args=list(argv[1:]))
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['import'] + list(argv)
+    args = build_parser().parse_args(argv)
+    if args.command == 'import' and args.dry_run_output:
+        args.command = 'dry-run'
+    elif args.command == 'import' and args.sync:
+        args.command = 'sync'
+    return args
+
+def run_benchmark(bench_args):
+    import benchmark
+
+    parser = benchmark.build_parser(argparse.ArgumentParser(
+        prog='telegram_importer.py bench', description=benchmark.__doc__.strip()
+    ))
+    return benchmark.main(parser.parse_args(bench_args))
+
+def main(argv=None):
     """Main function for command line usage"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == 'bench':
+        return run_benchmark(args.bench_args)
+
     print("Telegram to WordPress Importer")
     print("=" * 50)
 
-    if not check_dependencies():
-        print("\nPlease install missing dependencies and try again.")
-        return 1
+    # Update export directory if specified
+    if args.export_dir:
+        Config.set_export_dir(args.export_dir)
+        print(f"Using export directory: {args.export_dir}")
+
+    # Only commands that talk to WordPress need the third-party modules
+    if required_modules(args.command):
+        if not check_dependencies(args.command):
+            print("\nPlease install missing dependencies and try again.")
+            return 1
+        print("\n✓ All dependencies available!")
 
-    print("\n✓ All dependencies available!")
     print("\nStarting importer...")
+    importer = TelegramImporter()
 
-    # Parse command line arguments
-    start_index = 0
-    batch_size = None
-    export_dir = None
-
-    # Parse arguments
-    args = sys.argv[1:]
-    i = 0
-
-    while i < len(args):
-        arg = args[i]
-
-        if arg == '--export-dir' and i + 1 < len(args):
-            export_dir = args[i + 1]
-            i += 2
-        elif arg.startswith('--export-dir='):
-            export_dir = arg.split('=', 1)[1]
-            i += 1
-        elif arg == '--help' or arg == '-h':
-            print("Usage: python telegram_importer.py [--export-dir DIR] [start_index] [batch_size]")
-            print("\nArguments:")
-            print("  --export-dir DIR    Specify export directory (default: from .env or ChatExport_2025-07-27)")
-            print("  start_index         Start from this message index (default: 0)")
-            print("  batch_size          Number of messages to process (default: from .env or 1)")
-            print("\nExamples:")
-            print("  python telegram_importer.py")
-            print("  python telegram_importer.py 10 5")
-            print("  python telegram_importer.py --export-dir ChatExport_2025-07-26")
-            print("  python telegram_importer.py --export-dir ChatExport_2025-07-26 10 5")
-            return 0
-        else:
-            # Try to parse as start_index or batch_size
-            try:
-                if start_index == 0:
-                    start_index = int(arg)
-                elif batch_size is None:
-                    batch_size = int(arg)
-                else:
-                    print(f"Unknown argument: {arg}")
-                    return 1
-            except ValueError:
-                print(f"Invalid argument: {arg}")
-                return 1
-            i += 1
+    if args.command == 'dry-run':
+        try:
+            importer.dry_run(args.dry_run_output, args.dry_run_format, args.start_index, args.stream, args.workers,
+                             message_range=message_range(args))
+        except Exception as e:
+            print(f"Dry run failed: {e}")
+            return 1
+        return 0
 
-    # Update export directory if specified
-    if export_dir:
-        Config.set_export_dir(export_dir)
-        print(f"Using export directory: {export_dir}")
+    if args.command == 'publish':
+        try:
+            importer.publish(args.queue_location, args.range_size)
+        except Exception as e:
+            print(f"Publish failed: {e}")
+            return 1
+        return 0
 
-    importer = TelegramImporter()
+    if args.command == 'work':
+        return 0 if importer.work(args.queue_location, args.worker_id, args.concurrency, args.post_batch,
+                                  args.progress, args.media_cache, args.metrics_file) else 1
+
+    if args.command == 'sync':
+        return 0 if importer.sync(args.concurrency, args.post_batch, args.progress, args.media_cache,
+                                  args.metrics_file) else 1
 
     # Run import
-    next_index = importer.run(start_index, batch_size)
+    batch_size = args.batch_size
+    next_index = importer.run(args.start_index, batch_size, args.stream, args.concurrency, args.track_state,
+                              args.preload_terms, args.media_cache, args.post_batch, args.progress,
+                              args.metrics_file, message_range(args))
 
     if batch_size and batch_size > 0:
-        cmd = f"python telegram_importer.py {next_index} {batch_size}"
-        if export_dir:
-            cmd = f"python telegram_importer.py --export-dir {export_dir} {next_index} {batch_size}"
+        options = []
+        if args.stream:
+            options.append('--stream')
+        if args.export_dir:
+            options += ['--export-dir', args.export_dir]
+        for option in ('from_id', 'to_id', 'since', 'until'):
+            if getattr(args, option) is not None:
+                options += ['--' + option.replace('_', '-'), str(getattr(args, option))]
+        cmd = ' '.join(['python telegram_importer.py'] + [shlex.quote(option) for option in options]
+                       + [str(next_index), str(batch_size)])
         print(f"To continue, run: {cmd}")
 
     return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
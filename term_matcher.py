@@ -0,0 +1,176 @@
+import re
+from bisect import bisect_right
+from collections import deque
+
+_WORD = re.compile(r'\w+')
+_CYRILLIC = re.compile(r'[а-я]')
+
+# Endings of the Russian noun and adjective paradigms; '' is the bare stem
+_PARADIGMS = (
+    # Adjectives (новый, русский, тепловой)
+    ('ый', 'ий', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ого', 'его', 'ому', 'ему',
+     'ым', 'им', 'ую', 'юю', 'ых', 'их', 'ыми', 'ими', 'ей'),
+    # Hard masculine nouns (стартап, диск, врач)
+    ('', 'а', 'у', 'ом', 'ем', 'е', 'ы', 'и', 'ов', 'ей', 'ам', 'ами', 'ах'),
+    # Soft masculine nouns (пользователь, музей)
+    ('ь', 'й', 'я', 'ю', 'ем', 'е', 'и', 'ей', 'ев', 'ям', 'ями', 'ях'),
+    # Feminine nouns in -а/-я (карта, задача, неделя)
+    ('', 'а', 'я', 'ы', 'и', 'е', 'у', 'ю', 'ой', 'ей', 'ою', 'ею', 'ам', 'ям', 'ами', 'ями', 'ах', 'ях'),
+    # Feminine nouns in -ь (цель)
+    ('ь', 'и', 'ью', 'ей', 'ям', 'ями', 'ях'),
+    # Neuter nouns in -о/-е (дело, поле)
+    ('', 'о', 'е', 'а', 'я', 'у', 'ю', 'ом', 'ем', 'ей', 'ам', 'ям', 'ами', 'ями', 'ах', 'ях'),
+    # Nouns in -ия/-ие (линия, решение)
+    ('ия', 'ие', 'ии', 'ию', 'ией', 'ием', 'ий', 'иям', 'иями', 'иях'),
+    # Nouns in -ья/-ье (статья, воскресенье)
+    ('ья', 'ье', 'ьи', 'ью', 'ьей', 'ьем', 'ей', 'ий', 'ьям', 'ьями', 'ьях'),
+)
+# Ending -> bit set of the paradigms it belongs to
+_ENDING_PARADIGMS = {}
+for _bit, _endings in enumerate(_PARADIGMS):
+    for _ending in _endings:
+        _ENDING_PARADIGMS[_ending] = _ENDING_PARADIGMS.get(_ending, 0) | 1 << _bit
+# Strippable endings, longest first
+_RUSSIAN_ENDINGS = sorted((ending for ending in _ENDING_PARADIGMS if ending), key=len, reverse=True)
+_MIN_STEM = 3
+
+def split_word(word):
+    """Split a Russian word into (stem, inflectional ending); other words have ending ''"""
+    if not _CYRILLIC.search(word):
+        return word, ''
+    for ending in _RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)], ending
+    return word, ''
+
+def stem_word(word):
+    """Strip a Russian inflectional ending so that word forms share one stem"""
+    return split_word(word)[0]
+
+def split_words(text):
+    """Lowercase text and return (space-separated word stems, ending of each word)"""
+    text = text.lower().replace('ё', 'е')
+    parts = [split_word(word) for word in _WORD.findall(text)]
+    return ' '.join(stem for stem, _ in parts), [ending for _, ending in parts]
+
+def normalize_words(text):
+    """Lowercase text and reduce it to space-separated word stems"""
+    return split_words(text)[0]
+
+def same_paradigm(ending, other):
+    """Whether two endings can be forms of one word, i.e. share a declension paradigm"""
+    return bool(_ENDING_PARADIGMS.get(ending, 0) & _ENDING_PARADIGMS.get(other, 0)) or ending == other
+
+class TermMatcher:
+    """Aho-Corasick automaton that finds every listed term in one pass over a text.
+
+    Terms are given in named groups (e.g. categories and tags) and results
+    keep each group's original order. With word_boundary, a term only
+    matches as whole words; morphology additionally matches Russian
+    inflections by comparing word stems (and implies word boundaries).
+    A stem match only counts when every word's ending belongs to the same
+    declension paradigm as the term's, so `целый` does not match `цель`.
+    """
+
+    def __init__(self, groups, word_boundary=False, morphology=False):
+        self.groups = {name: list(terms) for name, terms in groups.items()}
+        self.word_boundary = word_boundary or morphology
+        self.morphology = morphology
+
+        # Trie transitions, failure links and (length, group, index) outputs per state
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        # (group, index) -> word endings of the term, with morphology
+        self.term_endings = {}
+
+        for name, terms in self.groups.items():
+            for index, term in enumerate(terms):
+                pattern, endings = self._normalize(term)
+                if pattern:
+                    self._add(pattern, (len(pattern), name, index))
+                    self.term_endings[name, index] = endings
+        self._build_failure_links()
+
+    def _normalize(self, text):
+        """Return (text to match, word endings or None)"""
+        if self.morphology:
+            return split_words(text)
+        return text.lower(), None
+
+    def _endings_match(self, name, index, word_starts, endings, start):
+        """Whether the text words from offset start have endings of the term's paradigms"""
+        first = bisect_right(word_starts, start) - 1
+        term_endings = self.term_endings[name, index]
+        text_endings = endings[first:first + len(term_endings)]
+        return all(same_paradigm(a, b) for a, b in zip(term_endings, text_endings))
+
+    def _add(self, pattern, output):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = next_state
+        self.out[state].append(output)
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                # Inherit matches that end at the same place (suffix patterns)
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def find(self, text):
+        """Return {group: [matched terms]} for every term found in text"""
+        found = {name: set() for name in self.groups}
+        if not text:
+            return {name: [] for name in self.groups}
+
+        text, endings = self._normalize(text)
+        word_starts = None
+        if endings is not None:
+            # Offset of every word in the normalized text, which joins stems with single spaces
+            word_starts = []
+            offset = 0
+            for word in text.split(' '):
+                word_starts.append(offset)
+                offset += len(word) + 1
+        goto, fail, out = self.goto, self.fail, self.out
+        word_boundary = self.word_boundary
+        text_length = len(text)
+
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not out[state]:
+                continue
+
+            end = position + 1
+            for length, name, index in out[state]:
+                if word_boundary:
+                    start = end - length
+                    if start > 0 and (text[start - 1].isalnum() or text[start - 1] == '_'):
+                        continue
+                    if end < text_length and (text[end].isalnum() or text[end] == '_'):
+                        continue
+                    if word_starts is not None and not self._endings_match(name, index, word_starts, endings, start):
+                        continue
+                found[name].add(index)
+
+        return {
+            name: [self.groups[name][index] for index in sorted(indexes)]
+            for name, indexes in found.items()
+        }
@@ -0,0 +1,97 @@
+import itertools
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+class FakeWordPress:
+    """Stands in for WordPressAPI, recording every call that changes the site"""
+
+    connection_stats = 'fake'
+    scheduler = 'fake'
+
+    def __init__(self):
+        self.ids = itertools.count(100)
+        self.created = []
+        self.updated = []
+        self.uploaded = []
+        self.fail_updates = False
+
+    def get_categories(self):
+        return []
+
+    def get_tags(self):
+        return []
+
+    def create_terms(self, taxonomy, names):
+        return [({'id': next(self.ids), 'name': name}, None) for name in names]
+
+    def upload_media(self, file_path, title=None, slug=None, progress=None):
+        media_id = next(self.ids)
+        self.uploaded.append(os.path.basename(file_path))
+        return {'id': media_id, 'source_url': f'https://example.com/{media_id}.jpg'}
+
+    def create_post(self, title, content, date=None, categories=None, tags=None, featured_media_id=None):
+        post = {'id': next(self.ids), 'title': title, 'content': content, 'featured_media': featured_media_id}
+        self.created.append(post)
+        return post
+
+    def update_post(self, post_id, title, content, date=None, categories=None, tags=None, featured_media_id=None):
+        if self.fail_updates:
+            raise RuntimeError('500 Server Error')
+        post = {'id': post_id, 'title': title, 'content': content, 'featured_media': featured_media_id}
+        self.updated.append(post)
+        return post
+
+class Export:
+    """A Telegram export directory whose result.json can be rewritten between runs"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, 'photos'), exist_ok=True)
+
+    def photo(self, name, data=None):
+        """Write a photo; its content defaults to its name, so photos differ unless told otherwise"""
+        with open(os.path.join(self.path, 'photos', name), 'wb') as f:
+            f.write(data or f'jpeg {name}'.encode())
+        return f'photos/{name}'
+
+    def write(self, messages):
+        export = {'name': 'Test', 'type': 'public_channel', 'id': 1, 'messages': messages}
+        with open(os.path.join(self.path, 'result.json'), 'w', encoding='utf-8') as f:
+            json.dump(export, f, ensure_ascii=False, indent=1)
+
+@pytest.fixture
+def wordpress():
+    return FakeWordPress()
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    """Empty export in a temporary ChatExport directory, with every data file kept next to it"""
+    export_dir = str(tmp_path / 'ChatExport')
+    monkeypatch.setattr(Config, 'EXPORT_DIR', export_dir)
+    monkeypatch.setattr(Config, 'PHOTOS_DIR', os.path.join(export_dir, 'photos'))
+    monkeypatch.setattr(Config, 'SYNC_STATE_FILE', str(tmp_path / 'sync_state.sqlite3'))
+    monkeypatch.setattr(Config, 'MEDIA_CACHE_FILE', str(tmp_path / 'media_cache.sqlite3'))
+    monkeypatch.setattr(Config, 'WORK_QUEUE', str(tmp_path / 'work_queue.sqlite3'))
+    monkeypatch.setattr(Config, 'EXPORT_INDEX_FILE', '')
+    monkeypatch.setattr(Config, 'IMAGE_MAX_DIMENSION', 0)
+    monkeypatch.setattr(Config, 'DUPLICATE_POLICY', 'off')
+    monkeypatch.setattr(Config, 'METRICS_FILE', '')
+    return Export(export_dir)
+
+@pytest.fixture
+def new_importer(wordpress):
+    """Return a factory of TelegramImporters talking to the fake site, one per run"""
+    from telegram_importer import TelegramImporter
+
+    def new_importer():
+        importer = TelegramImporter()
+        importer._wp_api = wordpress
+        return importer
+    return new_importer
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from image_optimizer import optimize_image
+
+def test_changed_settings_do_not_reuse_earlier_output(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    source = str(tmp_path / 'photo.jpg')
+    Image.effect_noise((400, 300), 64).convert('RGB').save(source, quality=95)
+    output_dir = str(tmp_path / 'optimized')
+
+    first, _, _ = optimize_image(source, output_dir, 200, 80, 'JPEG')
+    second, _, _ = optimize_image(source, output_dir, 100, 80, 'JPEG')
+    assert first != second
+    with Image.open(first) as image:
+        assert max(image.size) == 200
+    with Image.open(second) as image:
+        assert max(image.size) == 100
+
+    # Same settings again reuse the file
+    assert optimize_image(source, output_dir, 200, 80, 'JPEG')[0] == first
+    assert sorted(os.listdir(output_dir)) == ['photo-100q80.jpg', 'photo-200q80.jpg']
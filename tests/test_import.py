@@ -0,0 +1,16 @@
+
+def test_preload_keeps_progress_on_import_reader(export, new_importer, monkeypatch):
+    export.write([{'id': i, 'type': 'message', 'date': '2024-01-01T10:00:00', 'text': f'Пост {i} про docker'}
+                  for i in range(1, 11)])
+    importer = new_importer()
+    fractions = []
+    import_messages = importer.import_messages
+
+    def record_fraction(messages, *args, **kwargs):
+        # The import has read nothing yet when it starts
+        fractions.append(importer.export_reader.fraction())
+        return import_messages(messages, *args, **kwargs)
+
+    monkeypatch.setattr(importer, 'import_messages', record_fraction)
+    assert importer.run(0, 0, stream=True, preload_terms=True, media_cache=False) == 10
+    assert fractions == [0.0]
@@ -0,0 +1,7 @@
+from metrics import Metrics
+
+def test_prometheus_escapes_label_values():
+    metrics = Metrics()
+    metrics.increment('http_requests_total', endpoint='say "hi"\\now\nthen')
+    line = next(line for line in metrics.to_prometheus().splitlines() if 'http_requests_total{' in line)
+    assert line.endswith('{endpoint="say \\"hi\\"\\\\now\\nthen"} 1')
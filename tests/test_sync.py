@@ -0,0 +1,40 @@
+def message(message_id, text, **fields):
+    return {'id': message_id, 'type': 'message', 'date': f'2024-01-0{message_id}T10:00:00', 'text': text, **fields}
+
+def edited(original, text, **fields):
+    return {**original, 'text': text, 'edited': '2024-02-01T10:00:00', **fields}
+
+def test_failed_update_is_retried_by_next_sync(export, wordpress, new_importer):
+    post = message(1, 'Первый пост про docker', photo=export.photo('a.jpg'))
+    export.write([post])
+    assert new_importer().sync(media_cache=False)
+    assert len(wordpress.created) == 1
+
+    # The edit also replaces the photo, which is uploaded before the PUT fails
+    export.write([edited(post, 'Первый пост про docker, исправленный', photo=export.photo('b.jpg'))])
+    wordpress.fail_updates = True
+    assert new_importer().sync(media_cache=False)
+    assert wordpress.updated == []
+
+    wordpress.fail_updates = False
+    assert new_importer().sync(media_cache=False)
+    assert len(wordpress.created) == 1
+    assert [post['id'] for post in wordpress.updated] == [wordpress.created[0]['id']]
+
+def test_edited_album_caption_keeps_gallery(export, wordpress, new_importer):
+    album = [
+        message(1, 'Альбом с фотографиями команды', photo=export.photo('a.jpg'), media_group_id='42'),
+        message(1, '', photo=export.photo('b.jpg'), media_group_id='42', id=2),
+        message(1, '', photo=export.photo('c.jpg'), media_group_id='42', id=3),
+    ]
+    export.write(album)
+    assert new_importer().sync(media_cache=False)
+    assert len(wordpress.created) == 1
+    assert wordpress.created[0]['content'].count('<img') == 3
+
+    export.write([edited(album[0], 'Альбом с фотографиями команды, подпись исправлена'), *album[1:]])
+    assert new_importer().sync(media_cache=False)
+    assert len(wordpress.created) == 1
+    assert len(wordpress.updated) == 1
+    assert wordpress.updated[0]['title'].endswith('подпись исправлена')
+    assert wordpress.updated[0]['content'].count('<img') == 3
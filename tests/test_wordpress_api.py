@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from wordpress_api import WordPressAPI
+
+def rejected_batch(status, body):
+    def batch(sub_requests):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode()
+        raise requests.HTTPError(f"{status} Client Error", response=response)
+    return batch
+
+def test_batch_rejected_with_400_reports_errors_without_fallback(monkeypatch):
+    api = WordPressAPI()
+    monkeypatch.setattr(api, 'batch', rejected_batch(400, {'code': 'rest_invalid_param', 'message': 'Invalid date'}))
+    sent = []
+
+    results = api._run_batched('/wp/v2/posts', [{'title': 'a'}, {'title': 'b'}], sent.append)
+    assert sent == []
+    assert api.batch_supported is None
+    assert [str(error) for _, error in results] == ['HTTP 400: Invalid date'] * 2
+
+def test_missing_batch_endpoint_falls_back_to_single_requests(monkeypatch):
+    api = WordPressAPI()
+    monkeypatch.setattr(api, 'batch', rejected_batch(404, {'code': 'rest_no_route'}))
+
+    results = api._run_batched('/wp/v2/posts', [{'title': 'a'}, {'title': 'b'}], lambda body: {'id': body['title']})
+    assert api.batch_supported is False
+    assert results == [({'id': 'a'}, None), ({'id': 'b'}, None)]
@@ -0,0 +1,47 @@
+from config import Config
+from work_queue import open_queue
+
+def message(message_id):
+    return {'id': message_id, 'type': 'message', 'date': '2024-01-01T10:00:00',
+            'text': f'Сообщение номер {message_id} про docker и команду'}
+
+def published_ranges(location):
+    queue = open_queue(location)
+    try:
+        return [row for row in queue.conn.execute('SELECT export, start, stop FROM ranges ORDER BY start')]
+    finally:
+        queue.close()
+
+def test_publish_after_export_grew_extends_ranges(export, new_importer, tmp_path):
+    location = str(tmp_path / 'queue.sqlite3')
+    export.write([message(i) for i in range(1, 9)])
+    assert new_importer().publish(location, range_size=3) == 3
+
+    # A newer export of the same chat, one message deleted and four added
+    export.write([message(i) for i in range(1, 13) if i != 5])
+    assert new_importer().publish(location, range_size=3) == 2
+
+    assert published_ranges(location) == [
+        ('chat:1', 1, 4), ('chat:1', 4, 7), ('chat:1', 7, 9), ('chat:1', 9, 12), ('chat:1', 12, 13),
+    ]
+
+def test_worker_on_newer_export_skips_posts_of_earlier_one(export, wordpress, new_importer, tmp_path, monkeypatch):
+    # Only the queue tells the workers which messages have posts
+    monkeypatch.setattr(Config, 'TRACK_STATE', False)
+    location = str(tmp_path / 'queue.sqlite3')
+    export.write([message(i) for i in range(1, 9)])
+    new_importer().publish(location, range_size=3)
+    assert new_importer().work(location, 'first', media_cache=False)
+    assert len(wordpress.created) == 8
+
+    # The first range is leased again, as after a crash of the worker that imported it
+    queue = open_queue(location)
+    queue.conn.execute("UPDATE ranges SET status = 'pending' WHERE start = 1")
+    queue.close()
+
+    export.write([message(i) for i in range(1, 13)])
+    new_importer().publish(location, range_size=3)
+    assert new_importer().work(location, 'second', media_cache=False)
+    assert sorted(post['title'] for post in wordpress.created) == sorted(
+        new_importer().processor.process_message(message(i)).title for i in range(1, 13)
+    )
@@ -1,41 +1,172 @@
 import requests
 import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from config import Config
+from metrics import Metrics
+from multipart_stream import MultipartStream
+from request_scheduler import RequestScheduler
+
+# Responses meaning /batch/v1 is missing (WordPress < 5.6) or disabled on this site
+BATCH_UNAVAILABLE_STATUSES = {404, 405, 501}
+
+def batch_failure(error):
+    """Error for each body of a failed /batch/v1 call; some sub-requests may still have been applied"""
+    failure = RuntimeError(f"Batch request failed, the server may have applied part of it: {error}")
+    failure.__cause__ = error
+    return failure
+
+class ConnectionStats:
+    """Counts TCP/TLS connections opened versus requests sent over them"""
 
-class WordPressAPI:
     def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+    def record_connection(self):
+        with self.lock:
+            self.opened += 1
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+
+    @property
+    def reused(self):
+        """Requests that were served by an already open keep-alive connection"""
+        return max(self.requests - self.opened, 0)
+
+    def __str__(self):
+        return f"{self.requests} requests, {self.opened} connections opened, {self.reused} reused"
+
+def _counting_pool(pool_class, stats):
+    """Return a urllib3 pool class that reports every new connection to stats"""
+    class CountingPool(pool_class):
+        def _new_conn(self):
+            stats.record_connection()
+            return super()._new_conn()
+
+    return CountingPool
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter that tracks how often pooled connections are reused"""
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.stats),
+            'https': _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.record_request()
+        return super().send(request, **kwargs)
+
+class WordPressAPI:
+    def __init__(self, metrics=None):
         self.base_url = Config.WORDPRESS_URL.rstrip('/')
         # Bedrock WordPress uses different API endpoints
         self.api_url = f"{self.base_url}/index.php?rest_route=/wp/v2"
         self.media_url = f"{self.base_url}/index.php?rest_route=/wp/v2/media"
+        self.batch_url = f"{self.base_url}/index.php?rest_route=/batch/v1"
+        # Unknown until the first batch call (WordPress 5.6+ only)
+        self.batch_supported = None
+
+        # One pooled keep-alive session shared by every call and auth mode
+        self.connection_stats = ConnectionStats()
+        self.session = requests.Session()
+        adapter = PooledAdapter(
+            self.connection_stats,
+            pool_connections=Config.HTTP_POOL_SIZE,
+            pool_maxsize=Config.HTTP_POOL_SIZE
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Retries, backoff, rate limiting and adaptive concurrency for every call
+        self.scheduler = RequestScheduler.from_config()
+        # Latency, status and bytes of every HTTP attempt, retries included
+        self.metrics = metrics or Metrics()
+
+        if not Config.HTTP_KEEP_ALIVE:
+            self.session.headers['Connection'] = 'close'
+        if not Config.HTTP_COMPRESSION:
+            self.session.headers['Accept-Encoding'] = 'identity'
 
         # Setup authentication
         if Config.WORDPRESS_APPLICATION_PASSWORD:
             # Use Application Passwords (recommended)
             auth_string = f"{Config.WORDPRESS_USERNAME}:{Config.WORDPRESS_APPLICATION_PASSWORD}"
             self.auth_header = f"Basic {base64.b64encode(auth_string.encode()).decode()}"
+            self.session.headers['Authorization'] = self.auth_header
         else:
             # Fallback to username/password (less secure)
             self.auth_header = None
-            self.session = requests.Session()
             self.session.auth = (Config.WORDPRESS_USERNAME, Config.WORDPRESS_PASSWORD)
 
-    def _make_request(self, method, url, **kwargs):
-        """Make authenticated request to WordPress API"""
-        headers = kwargs.get('headers', {})
+    @staticmethod
+    def _endpoint(url):
+        """Short endpoint name for metrics, e.g. posts, media or batch"""
+        route = url.split('rest_route=', 1)[-1].split('&', 1)[0]
+        if route.startswith('/wp/v2/'):
+            route = route[len('/wp/v2/'):]
+        return route.strip('/').split('/', 1)[0] or 'root'
+
+    def _timed(self, send, method, url):
+        """Wrap send() so every attempt is recorded in metrics"""
+        endpoint = self._endpoint(url)
+
+        def timed_send(timeout):
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                response = send(timeout)
+                status = str(response.status_code)
+                body = response.request.body if response.request is not None else None
+                try:
+                    sent = len(body)
+                except TypeError:
+                    sent = 0
+                self.metrics.increment('http_request_bytes_total', sent, endpoint=endpoint)
+                self.metrics.increment('http_response_bytes_total', len(response.content), endpoint=endpoint)
+                return response
+            finally:
+                self.metrics.observe('http_request_seconds', time.perf_counter() - started,
+                                     method=method, endpoint=endpoint)
+                self.metrics.increment('http_requests_total', method=method, endpoint=endpoint, status=status)
+
+        return timed_send
+
+    def _make_request(self, method, url, idempotent=None, **kwargs):
+        """Make authenticated request to WordPress API
+
+        POSTs count as not idempotent (see RequestScheduler) unless idempotent says otherwise.
+        """
+        if idempotent is None:
+            idempotent = method != 'POST'
+        headers = kwargs.pop('headers', {})
         headers['Content-Type'] = 'application/json'
+        timeout = kwargs.pop('timeout', None)
 
-        if self.auth_header:
-            headers['Authorization'] = self.auth_header
-            response = requests.request(method, url, headers=headers, **kwargs)
-        else:
-            response = self.session.request(method, url, headers=headers, **kwargs)
+        def send(timeout):
+            return self.session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+
+        response = self.scheduler.call(self._timed(send, method, url), timeout, idempotent)
 
         response.raise_for_status()
         return response
 
-    def create_post(self, title, content, date=None, categories=None, tags=None, featured_media_id=None):
-        """Create a new WordPress post"""
+    @staticmethod
+    def build_post_data(title, content, date=None, categories=None, tags=None, featured_media_id=None):
+        """Build the request body for a new post"""
         post_data = {
             'title': title,
             'content': content,
@@ -55,51 +186,230 @@ class WordPressAPI:
         if featured_media_id:
             post_data['featured_media'] = featured_media_id
 
+        return post_data
+
+    def create_post(self, title, content, date=None, categories=None, tags=None, featured_media_id=None):
+        """Create a new WordPress post"""
+        post_data = self.build_post_data(title, content, date, categories, tags, featured_media_id)
         response = self._make_request('POST', self.api_url + '/posts', json=post_data)
         return response.json()
 
-    def upload_media(self, file_path, title=None):
-        """Upload media file to WordPress"""
-        with open(file_path, 'rb') as file:
-            files = {'file': file}
-            data = {}
+    def get_post(self, post_id):
+        """Get the raw title and content, terms and featured image of a post"""
+        response = self._make_request(
+            'GET',
+            f"{self.api_url}/posts/{post_id}&context=edit&_fields=id,title,content,categories,tags,featured_media"
+        )
+        return response.json()
+
+    def update_post(self, post_id, title, content, date=None, categories=None, tags=None, featured_media_id=None):
+        """Replace the content of an existing post, keeping its status and author"""
+        post_data = self.build_post_data(title, content, date, categories, tags, featured_media_id)
+        del post_data['status'], post_data['author']
+        response = self._make_request('PUT', f"{self.api_url}/posts/{post_id}", json=post_data)
+        return response.json()
+
+    def batch(self, sub_requests):
+        """Send up to BATCH_REQUEST_SIZE sub-requests in one /batch/v1 call
+
+        Each sub-request is a dict with method, path (e.g. /wp/v2/posts) and
+        body. Returns one (status, body) pair per sub-request, in order.
+        Never retried after a 5xx or timeout: WordPress may have carried out
+        some of the sub-requests already.
+        """
+        response = self._make_request('POST', self.batch_url, idempotent=False, json={
+            'validation': 'normal',
+            'requests': sub_requests
+        })
+        responses = response.json().get('responses', [])
+        if len(responses) != len(sub_requests):
+            raise ValueError(f"Batch returned {len(responses)} responses for {len(sub_requests)} requests")
+        return [(item.get('status'), item.get('body')) for item in responses]
+
+    def _run_batched(self, path, bodies, send_single, on_error=None):
+        """Run POSTs through /batch/v1 when the site supports it, else one by one
+
+        Returns one (result, error) pair per body, in order. on_error may turn
+        an error body into a result (e.g. an already existing term). A batch
+        call the server turns away with a 4xx goes through on_error for each
+        of its bodies, as nothing of it was applied; when a batch call fails
+        otherwise, every body of it gets a batch_failure() error, as the
+        server may have applied any number of them.
+        """
+        results = []
+        size = Config.BATCH_REQUEST_SIZE
+        start = 0
 
-            if title:
-                data['title'] = title
+        def error_result(status, body):
+            recovered = on_error(body) if on_error else None
+            if recovered is not None:
+                return recovered, None
+            message = body.get('message') if isinstance(body, dict) else body
+            return None, RuntimeError(f"HTTP {status}: {message}")
 
-            if self.auth_header:
-                headers = {'Authorization': self.auth_header}
-                response = requests.post(self.media_url, files=files, data=data, headers=headers)
-            else:
-                response = self.session.post(self.media_url, files=files, data=data)
+        while start < len(bodies) and self.batch_supported is not False and len(bodies) - start > 1:
+            chunk = bodies[start:start + size]
+            try:
+                responses = self.batch([{'method': 'POST', 'path': path, 'body': body} for body in chunk])
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if not self.batch_supported and status in BATCH_UNAVAILABLE_STATUSES:
+                    print(f"Batch endpoint unavailable (HTTP {status}), falling back to single requests")
+                    self.batch_supported = False
+                    break
+                if status is not None and status < 500:
+                    # Turned away as a whole, e.g. an invalid body: nothing of it was applied
+                    try:
+                        body = e.response.json()
+                    except ValueError:
+                        body = e.response.text
+                    results.extend(error_result(status, body) for _ in chunk)
+                else:
+                    results.extend((None, batch_failure(e)) for _ in chunk)
+                start += len(chunk)
+                continue
+            except Exception as e:
+                results.extend((None, batch_failure(e)) for _ in chunk)
+                start += len(chunk)
+                continue
+
+            self.batch_supported = True
+            for status, body in responses:
+                if status is not None and status < 400:
+                    results.append((body, None))
+                else:
+                    results.append(error_result(status, body))
+            start += len(chunk)
+
+        for body in bodies[start:]:
+            try:
+                results.append((send_single(body), None))
+            except Exception as e:
+                results.append((None, e))
+
+        return results
+
+    def create_posts(self, posts_data):
+        """Create several posts from build_post_data() bodies, batched where possible
+
+        Returns one (post, error) pair per body, in order.
+        """
+        def send_single(post_data):
+            return self._make_request('POST', self.api_url + '/posts', json=post_data).json()
+
+        return self._run_batched('/wp/v2/posts', posts_data, send_single)
+
+    def upload_media(self, file_path, title=None, slug=None, progress=None):
+        """Upload media file to WordPress
+
+        The file is streamed from disk, never held in memory whole;
+        progress(sent, total) is called as the body goes out.
+        """
+        data = {}
+
+        if title:
+            data['title'] = title
+
+        if slug:
+            data['slug'] = slug
+
+        def send(timeout):
+            # Reopen the file on every attempt so retries send the whole body
+            with MultipartStream(file_path, data, progress=progress) as body:
+                headers = {'Content-Type': body.content_type}
+                return self.session.post(self.media_url, data=body, headers=headers, timeout=timeout)
+
+        response = self.scheduler.call(self._timed(send, 'POST', self.media_url), idempotent=False)
 
         response.raise_for_status()
         return response.json()
 
+    def _get_all_pages(self, url):
+        """GET every page of a collection, fetching the remaining pages concurrently"""
+        url = f"{url}&per_page=100"
+
+        first_page = self._make_request('GET', f"{url}&page=1")
+        items = first_page.json()
+        total_pages = int(first_page.headers.get('X-WP-TotalPages', 1))
+
+        if total_pages > 1:
+            def fetch_page(page):
+                return self._make_request('GET', f"{url}&page={page}").json()
+
+            workers = min(Config.HTTP_POOL_SIZE, total_pages - 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for page_items in executor.map(fetch_page, range(2, total_pages + 1)):
+                    items.extend(page_items)
+
+        return items
+
+    def get_all_terms(self, taxonomy):
+        """Get every term of a taxonomy"""
+        return self._get_all_pages(f"{self.api_url}/{taxonomy}&_fields=id,name,slug")
+
+    def get_media_library(self):
+        """Get id, slug and URL of every media item"""
+        return self._get_all_pages(f"{self.media_url}&_fields=id,slug,source_url")
+
     def get_categories(self):
         """Get all WordPress categories"""
-        response = self._make_request('GET', f"{self.api_url}/categories&per_page=100")
-        return response.json()
+        return self.get_all_terms('categories')
 
     def get_tags(self):
         """Get all WordPress tags"""
-        response = self._make_request('GET', f"{self.api_url}/tags&per_page=100")
-        return response.json()
+        return self.get_all_terms('tags')
 
-    def create_category(self, name, slug=None):
-        """Create a new category"""
+    def _create_term(self, taxonomy, name, slug=None):
+        """Create a term, returning the existing one if WordPress reports a duplicate"""
         data = {'name': name}
         if slug:
             data['slug'] = slug
 
-        response = self._make_request('POST', f"{self.api_url}/categories", json=data)
+        try:
+            # A repeated creation resolves to the existing term below, so retries are safe
+            response = self._make_request('POST', f"{self.api_url}/{taxonomy}", json=data, idempotent=True)
+        except requests.HTTPError as e:
+            try:
+                term_id = self._existing_term_id(e.response.json())
+            except (AttributeError, ValueError):
+                term_id = None
+            if term_id is None:
+                raise
+            return {'id': term_id, 'name': name}
+
         return response.json()
 
+    @staticmethod
+    def _existing_term_id(error):
+        """Extract the term ID from a WordPress "term_exists" error body"""
+        if not isinstance(error, dict) or error.get('code') != 'term_exists':
+            return None
+        return (error.get('data') or {}).get('term_id')
+
+    def create_terms(self, taxonomy, names):
+        """Create several terms, batched where possible
+
+        Returns one (term, error) pair per name, in order; names that already
+        exist resolve to the existing term.
+        """
+        def send_single(body):
+            return self._create_term(taxonomy, body['name'])
+
+        def existing_term(error):
+            term_id = self._existing_term_id(error)
+            return {'id': term_id} if term_id else None
+
+        return self._run_batched(
+            f'/wp/v2/{taxonomy}',
+            [{'name': name} for name in names],
+            send_single,
+            existing_term
+        )
+
+    def create_category(self, name, slug=None):
+        """Create a new category"""
+        return self._create_term('categories', name, slug)
+
     def create_tag(self, name, slug=None):
         """Create a new tag"""
-        data = {'name': name}
-        if slug:
-            data['slug'] = slug
-
-        response = self._make_request('POST', f"{self.api_url}/tags", json=data)
-        return response.json()
\ No newline at end of file
+        return self._create_term('tags', name, slug)
\ No newline at end of file
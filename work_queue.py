@@ -0,0 +1,295 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+STATUS_PENDING = 'pending'
+STATUS_LEASED = 'leased'
+STATUS_DONE = 'done'
+
+# Message ids [start, stop) of an export held by one worker; token tells this lease from later ones
+Lease = namedtuple('Lease', 'range_id export start stop token')
+
+# SQLite allows at most 999 parameters per statement in older builds
+_MAX_PARAMS = 500
+
+def worker_name():
+    """Default worker id: host name and process id"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class WorkQueue:
+    """Message ranges of exports, leased by any number of importer workers
+
+    A lease lasts lease_seconds unless renewed with heartbeat(), so the
+    range of a crashed worker goes back to the queue on its own; a worker
+    that stops cleanly releases it at once. Backends also provide named
+    locks and registries of created terms and posts, so workers never create
+    the same term twice, and a worker taking over a range skips the posts
+    an earlier lease created, whatever host it ran on. SQLiteWorkQueue is
+    the reference backend.
+    """
+
+    def published_stop(self, export):
+        """End (last message id + 1) of the last range published for export, 0 if none"""
+        raise NotImplementedError
+
+    def publish(self, export, ranges):
+        """Queue (start, stop) message id ranges of export; ranges already published are kept as they are"""
+        raise NotImplementedError
+
+    def lease(self, export, worker, lease_seconds):
+        """Take the first pending or expired range of export, or return None when none is left"""
+        raise NotImplementedError
+
+    def heartbeat(self, lease, lease_seconds):
+        """Extend a lease; False if it expired and another worker took the range"""
+        raise NotImplementedError
+
+    def complete(self, lease):
+        """Mark a leased range as imported; False if the lease was lost"""
+        raise NotImplementedError
+
+    def release(self, lease):
+        """Put a leased range back in the queue"""
+        raise NotImplementedError
+
+    def acquire_lock(self, name, owner, ttl):
+        """Take a named lock for ttl seconds without waiting; True on success"""
+        raise NotImplementedError
+
+    def release_lock(self, name, owner):
+        raise NotImplementedError
+
+    def get_terms(self, taxonomy, names):
+        """Return {lowercase name: term ID} of names some worker already created"""
+        raise NotImplementedError
+
+    def add_terms(self, taxonomy, terms):
+        """Record {lowercase name: term ID} created by this worker"""
+        raise NotImplementedError
+
+    def get_posts(self, lease):
+        """Return {message ID: post ID} of posts created for the leased range by any lease"""
+        raise NotImplementedError
+
+    def add_post(self, lease, message_id, post_id):
+        """Record a post created for a message of the leased range, even if the lease was lost since"""
+        raise NotImplementedError
+
+    def counts(self, export):
+        """Return number of ranges of export per status"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def lock(self, name, owner, ttl=60, poll=0.05):
+        """Hold a named lock shared by every worker of the queue
+
+        The lock expires after ttl seconds, so a crashed holder cannot block the others.
+        """
+        while not self.acquire_lock(name, owner, ttl):
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            self.release_lock(name, owner)
+
+    @contextmanager
+    def keep_alive(self, lease, lease_seconds):
+        """Send heartbeats for a lease while the block runs; yields an Event set if the lease is lost"""
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def beat():
+            while not stop.wait(lease_seconds / 3):
+                if not self.heartbeat(lease, lease_seconds):
+                    lost.set()
+                    return
+
+        thread = threading.Thread(target=beat, name='lease-heartbeat', daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+class SQLiteWorkQueue(WorkQueue):
+    """WorkQueue in a SQLite file, for workers on one host or sharing a network drive
+
+    Uses the rollback journal instead of WAL, which needs memory shared
+    between the processes and so breaks across hosts. Every change is one
+    short IMMEDIATE transaction; waiting writers retry for up to 30 seconds.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn_lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ranges (
+                    range_id INTEGER PRIMARY KEY,
+                    export TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    stop INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    token TEXT,
+                    expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (export, start)
+                )
+            """)
+            conn.execute('CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS terms (
+                    taxonomy TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    term_id INTEGER NOT NULL,
+                    PRIMARY KEY (taxonomy, name)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS posts (
+                    range_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    post_id INTEGER NOT NULL,
+                    PRIMARY KEY (range_id, message_id)
+                )
+            """)
+
+    @contextmanager
+    def _transaction(self):
+        with self.conn_lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def published_stop(self, export):
+        with self.conn_lock:
+            row = self.conn.execute('SELECT MAX(stop) FROM ranges WHERE export = ?', (export,)).fetchone()
+        return row[0] or 0
+
+    def publish(self, export, ranges):
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO ranges (export, start, stop, status) VALUES (?, ?, ?, ?)',
+                [(export, start, stop, STATUS_PENDING) for start, stop in ranges]
+            )
+
+    def lease(self, export, worker, lease_seconds):
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._transaction() as conn:
+            row = conn.execute("""
+                SELECT range_id, start, stop FROM ranges
+                WHERE export = ? AND (status = ? OR (status = ? AND expires < ?))
+                ORDER BY start LIMIT 1
+            """, (export, STATUS_PENDING, STATUS_LEASED, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("""
+                UPDATE ranges SET status = ?, worker = ?, token = ?, expires = ?, attempts = attempts + 1
+                WHERE range_id = ?
+            """, (STATUS_LEASED, worker, token, now + lease_seconds, row[0]))
+        return Lease(row[0], export, row[1], row[2], token)
+
+    def _update_lease(self, lease, assignments, values):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f'UPDATE ranges SET {assignments} WHERE range_id = ? AND token = ? AND status = ?',
+                (*values, lease.range_id, lease.token, STATUS_LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, lease, lease_seconds):
+        return self._update_lease(lease, 'expires = ?', (time.time() + lease_seconds,))
+
+    def complete(self, lease):
+        return self._update_lease(lease, 'status = ?, expires = NULL', (STATUS_DONE,))
+
+    def release(self, lease):
+        return self._update_lease(lease, 'status = ?, worker = NULL, token = NULL, expires = NULL',
+                                  (STATUS_PENDING,))
+
+    def acquire_lock(self, name, owner, ttl):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute("""
+                INSERT INTO locks (name, owner, expires) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+                WHERE locks.expires < ? OR locks.owner = excluded.owner
+            """, (name, owner, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def release_lock(self, name, owner):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+
+    def get_terms(self, taxonomy, names):
+        names = list(names)
+        terms = {}
+        with self.conn_lock:
+            for i in range(0, len(names), _MAX_PARAMS):
+                chunk = names[i:i + _MAX_PARAMS]
+                terms.update(self.conn.execute(
+                    f'SELECT name, term_id FROM terms WHERE taxonomy = ? AND name IN ({", ".join("?" * len(chunk))})',
+                    (taxonomy, *chunk)
+                ))
+        return terms
+
+    def add_terms(self, taxonomy, terms):
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO terms (taxonomy, name, term_id) VALUES (?, ?, ?)',
+                [(taxonomy, name, term_id) for name, term_id in terms.items()]
+            )
+
+    def get_posts(self, lease):
+        with self.conn_lock:
+            return dict(self.conn.execute(
+                'SELECT message_id, post_id FROM posts WHERE range_id = ?', (lease.range_id,)
+            ))
+
+    def add_post(self, lease, message_id, post_id):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO posts (range_id, message_id, post_id) VALUES (?, ?, ?)',
+                (lease.range_id, message_id, post_id)
+            )
+
+    def counts(self, export):
+        with self.conn_lock:
+            return dict(self.conn.execute(
+                'SELECT status, COUNT(*) FROM ranges WHERE export = ? GROUP BY status', (export,)
+            ))
+
+    def close(self):
+        with self.conn_lock:
+            self.conn.close()
+
+# Work queue backends by URL scheme (scheme:///path); a location without a scheme is a SQLite file
+QUEUE_BACKENDS = {
+    'sqlite': SQLiteWorkQueue,
+}
+
+def open_queue(location):
+    """Open the work queue at location"""
+    scheme, separator, path = location.partition('://')
+    if not separator:
+        return SQLiteWorkQueue(location)
+    backend = QUEUE_BACKENDS.get(scheme)
+    if backend is None:
+        raise ValueError(f"Unknown work queue backend: {scheme}")
+    return backend(path)